@@ -1,7 +1,6 @@
 # conding: utf-8
 import os
-import urlparse
-import json
+import time
 from datetime import datetime
 
 from wsgiref.simple_server import make_server
@@ -9,10 +8,17 @@ import pyramid.httpexceptions as exc
 from pyramid.config import Configurator
 from pyramid.view import view_config
 from pyramid.response import Response
-import pymongo
 
 import utils
 import controller
+import compression
+import serializer
+import metrics
+import executor
+import export_citations
+import snapshot
+import storage
+import validation
 from export import Export
 
 from functools import wraps
@@ -30,6 +36,44 @@ def authenticate(func):
     return wrapper
 
 
+def json_response(request, data):
+    srlzr = request.registry.serializer
+
+    if srlzr.streamable(data):
+        return Response(app_iter=srlzr.iterdumps(data),
+                        content_type="application/json")
+
+    return Response(srlzr.dumps(data), content_type="application/json")
+
+
+EVENTS_MAX_WAIT = 30
+EVENTS_POLL_INTERVAL = 0.5
+
+EXPORT_FORMATS = {
+    'xmlwos': 'sci',  # SciELO Citation Index
+    'xmldoaj': 'doaj',
+    'xmliahx': 'iahx',
+    'xmlrsps': 'rsps'
+}
+
+
+def export_article(request, fmt, article):
+    """
+    Render the article in the given export format, in the export worker
+    processes when they are enabled.
+    """
+    export_executor = request.registry.export_executor
+
+    if export_executor is not None:
+        try:
+            return export_executor.export(fmt, article)
+        except executor.ExecutorBusy as e:
+            raise exc.HTTPServiceUnavailable(
+                str(e), headers={'Retry-After': str(e.retry_after)})
+
+    return getattr(Export(article), 'pipeline_%s' % fmt)()
+
+
 @view_config(route_name='index', request_method='GET')
 def index(request):
     return Response('Articles Metadata API')
@@ -43,7 +87,7 @@ def collection(request):
 
     collection = request.databroker.collection()
 
-    return Response(json.dumps(collection), content_type="application/json")
+    return json_response(request, collection)
 
 
 @view_config(route_name='journal',
@@ -56,7 +100,7 @@ def journal(request):
 
     journal = request.databroker.journal(collection=collection, issn=issn)
 
-    return Response(json.dumps(journal), content_type="application/json")
+    return json_response(request, journal)
 
 
 @view_config(route_name='identifiers_journal',
@@ -64,6 +108,9 @@ def journal(request):
 def identifiers_journal(request):
 
     collection = request.GET.get('collection', None)
+    from_date = request.GET.get('from', None)
+    until_date = request.GET.get('until', None)
+    resume_token = request.GET.get('resume_token', None)
     offset = request.GET.get('offset', 0)
 
     try:
@@ -71,10 +118,26 @@ def identifiers_journal(request):
     except ValueError:
         raise exc.HTTPBadRequest('offset must be integer')
 
-    ids = request.databroker.identifiers_journal(collection=collection,
-                                                 offset=offset)
+    if request.GET.get('deleted', 'false').lower() == 'true':
+        ids = request.databroker.identifiers_deleted(
+            'journal',
+            collection=collection,
+            offset=offset,
+            from_date=from_date or '1500-01-01',
+            until_date=until_date or datetime.now().date().isoformat())
+
+        return json_response(request, ids)
 
-    return Response(json.dumps(ids), content_type="application/json")
+    try:
+        ids = request.databroker.identifiers_journal(collection=collection,
+                                                     from_date=from_date,
+                                                     until_date=until_date,
+                                                     offset=offset,
+                                                     resume_token=resume_token)
+    except ValueError:
+        raise exc.HTTPBadRequest('resume_token is not valid')
+
+    return json_response(request, ids)
 
 
 @view_config(route_name='add_journal',
@@ -123,12 +186,19 @@ def identifiers_article(request):
     except ValueError:
         raise exc.HTTPBadRequest('offset must be integer')
 
-    ids = request.databroker.identifiers_article(collection=collection,
-                                                 offset=offset,
-                                                 from_date=from_date,
-                                                 until_date=until_date)
+    if request.GET.get('deleted', 'false').lower() == 'true':
+        ids = request.databroker.identifiers_deleted('article',
+                                                     collection=collection,
+                                                     offset=offset,
+                                                     from_date=from_date,
+                                                     until_date=until_date)
+    else:
+        ids = request.databroker.identifiers_article(collection=collection,
+                                                     offset=offset,
+                                                     from_date=from_date,
+                                                     until_date=until_date)
 
-    return Response(json.dumps(ids), content_type="application/json")
+    return json_response(request, ids)
 
 
 @view_config(route_name='identifiers_press_release',
@@ -150,7 +220,7 @@ def identifiers_press_release(request):
                                                        from_date=from_date,
                                                        until_date=until_date)
 
-    return Response(json.dumps(ids), content_type="application/json")
+    return json_response(request, ids)
 
 
 @view_config(route_name='exists_article',
@@ -163,7 +233,7 @@ def exists_article(request):
 
     article = request.databroker.exists_article(code, collection=collection)
 
-    return Response(json.dumps(article), content_type="application/json")
+    return json_response(request, article)
 
 
 @view_config(route_name='get_article',
@@ -177,24 +247,23 @@ def get_article(request):
 
     article = request.databroker.get_article(code, collection)
 
-    if article:
-        if fmt == 'xmlwos':  # SciELO Citation Index
-            return Response(
-                Export(article).pipeline_sci(), content_type="application/xml")
+    if article and fmt in EXPORT_FORMATS:
+        data = export_article(request, EXPORT_FORMATS[fmt], article)
 
-        if fmt == 'xmldoaj':
-            return Response(
-                Export(article).pipeline_doaj(), content_type="application/xml")
+        if request.GET.get('validate', 'false').lower() == 'true':
+            try:
+                errors = validation.validate(EXPORT_FORMATS[fmt], data)
+            except ValueError as e:
+                raise exc.HTTPBadRequest(str(e))
 
-        if fmt == 'xmliahx':
-            return Response(
-                Export(article).pipeline_iahx(), content_type="application/xml")
+            if errors:
+                response = json_response(request, {'errors': errors})
+                response.status_code = 422
+                return response
 
-        if fmt == 'xmlrsps':
-            return Response(
-                Export(article).pipeline_rsps(), content_type="application/xml")
+        return Response(data, content_type="application/xml")
 
-    return Response(json.dumps(article), content_type="application/json")
+    return json_response(request, article)
 
 
 @view_config(route_name='add_article',
@@ -210,15 +279,38 @@ def add_article(request):
     return Response()
 
 
+@view_config(route_name='add_articles',
+             request_method='POST')
+@authenticate
+def add_articles(request):
+
+    try:
+        articles = request.json_body
+    except ValueError:
+        raise exc.HTTPBadRequest('The posted JSON data is not valid')
+
+    if not isinstance(articles, list):
+        raise exc.HTTPBadRequest('A list of articles must be given')
+
+    try:
+        counts = request.databroker.add_articles(articles)
+    except (KeyError, IndexError):
+        raise exc.HTTPBadRequest('The posted JSON data is not valid')
+
+    return json_response(request, counts)
+
+
 @view_config(route_name='set_doaj_status_true',
              request_method='POST')
 @authenticate
 def set_doaj_status_true(request):
 
     code = request.GET.get('code', None)
+    collection = request.GET.get('collection', None)
 
     try:
-        article = request.databroker.set_doaj_status(code, True)
+        article = request.databroker.set_doaj_status(code, True,
+                                                     collection=collection)
     except ValueError:
         raise exc.HTTPBadRequest('The posted JSON data is not valid')
 
@@ -230,14 +322,54 @@ def set_doaj_status_true(request):
 def set_doaj_status_false(request):
 
     code = request.GET.get('code', None)
+    collection = request.GET.get('collection', None)
 
     try:
-        article = request.databroker.set_doaj_status(code, False)
+        article = request.databroker.set_doaj_status(code, False,
+                                                     collection=collection)
     except ValueError:
         raise exc.HTTPBadRequest('The posted JSON data is not valid')
 
     return Response()
 
+@view_config(route_name='set_doaj_status_bulk',
+             request_method='POST')
+@authenticate
+def set_doaj_status_bulk(request):
+    """
+    Expects {"status": true, "articles": [["scl", "S0034-89102010000400007"], ...]}
+    """
+
+    try:
+        data = request.json_body
+        status = bool(data['status'])
+        articles = [(collection, code) for collection, code in data['articles']]
+    except (ValueError, KeyError, TypeError):
+        raise exc.HTTPBadRequest('The posted JSON data is not valid')
+
+    updated = request.databroker.set_doaj_status_bulk(articles, status)
+
+    return json_response(request, {'updated': updated})
+
+
+@view_config(route_name='identifiers_doaj_pending',
+             request_method='GET')
+def identifiers_doaj_pending(request):
+
+    collection = request.GET.get('collection', None)
+    offset = request.GET.get('offset', 0)
+
+    try:
+        offset = int(offset)
+    except ValueError:
+        raise exc.HTTPBadRequest('offset must be integer')
+
+    ids = request.databroker.identifiers_doaj_pending(collection=collection,
+                                                      offset=offset)
+
+    return json_response(request, ids)
+
+
 @view_config(route_name='delete_article',
              request_method='DELETE')
 @authenticate
@@ -258,24 +390,118 @@ def delete_article(request):
     return Response()
 
 
+@view_config(route_name='events',
+             request_method='GET')
+def events(request):
+    """
+    Events logged after the since sequence number. When there is none,
+    the request waits up to ``wait`` seconds for new events, capped by the
+    events_max_wait setting, 0 unless a server handling concurrent requests
+    is configured.
+    """
+
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = min(int(request.GET.get('limit', 100)), 1000)
+        wait = min(float(request.GET.get('wait', 0)), request.registry.events_max_wait)
+    except ValueError:
+        raise exc.HTTPBadRequest('since, limit and wait must be numbers')
+
+    deadline = time.time() + wait
+
+    while True:
+        result = request.databroker.events(since=since, limit=limit)
+
+        if result['objects'] or time.time() >= deadline:
+            return json_response(request, result)
+
+        time.sleep(EVENTS_POLL_INTERVAL)
+
+
+@view_config(route_name='metrics',
+             request_method='GET')
+def metrics_view(request):
+
+    if not metrics.registry.enabled:
+        raise exc.HTTPNotFound()
+
+    response = Response(metrics.registry.render())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+
+    return response
+
+
 def main(settings, *args, **xargs):
     config = Configurator(settings=settings)
 
-    db_url = urlparse.urlparse(settings['app']['mongo_uri'])
+    metrics.registry.enabled = settings['app'].get('metrics', 'false').lower() == 'true'
 
-    config.registry.db = pymongo.Connection(
-        host=db_url.hostname,
-        port=db_url.port
+    config.registry.storage = storage.from_uri(
+        settings['app'].get('storage_uri') or settings['app']['mongo_uri'])
+    if metrics.registry.enabled:
+        config.registry.storage = storage.TimedStorage(config.registry.storage)
+
+    config.registry.serializer = serializer.Serializer(
+        encoder=settings['app'].get('json_encoder', 'json'),
+        stream_threshold=int(settings['app'].get('json_stream_threshold', 500))
     )
 
-    def add_database():
-        db = config.registry.db[db_url.path[1:]]
-        if db_url.username and db_url.password:
-            db.authenticate(db_url.username, db_url.password)
-        return db
+    reference_cache_ttl = int(settings['app'].get('reference_cache_ttl', 300))
+    reference_cache = None
+    if reference_cache_ttl > 0:
+        reference_cache = controller.ReferenceCache(
+            ttl=reference_cache_ttl,
+            maxsize=int(settings['app'].get('reference_cache_size', 1000)))
+
+    config.registry.article_store = None
+    if settings['app'].get('article_snapshot', None):
+        config.registry.article_store = snapshot.SnapshotArticleStore(
+            settings['app']['article_snapshot'],
+            check_interval=int(settings['app'].get('article_snapshot_check_interval', 5)))
+
+    validation.configure(settings['app'].get('xsd_dir', None))
+    if settings['app'].get('validation_preload', 'false').lower() == 'true':
+        validation.preload()
+
+    citations_threshold = int(settings['app'].get('citations_parallel_threshold', 0))
+    citations_processes = settings['app'].get('citations_processes', '')
+    citations_chunk_size = int(settings['app'].get('citations_chunk_size', 250))
+
+    config.registry.export_executor = None
+    export_processes = int(settings['app'].get('export_processes', 0))
+    if export_processes > 0:
+        worker_args = ['--citations-threshold', str(citations_threshold),
+                       '--citations-chunk-size', str(citations_chunk_size)]
+        if citations_processes:
+            worker_args += ['--citations-processes', citations_processes]
+        if metrics.registry.enabled:
+            worker_args.append('--metrics')
+
+        export_max_queue = settings['app'].get('export_max_queue', '')
+        config.registry.export_executor = executor.ExportExecutor(
+            processes=export_processes,
+            max_queue=int(export_max_queue) if export_max_queue else None,
+            queue_timeout=float(settings['app'].get('export_queue_timeout', 10)),
+            retry_after=int(settings['app'].get('export_retry_after', 1)),
+            worker_args=worker_args)
+    else:
+        export_citations.configure(
+            threshold=citations_threshold,
+            processes=int(citations_processes) if citations_processes else None,
+            chunk_size=citations_chunk_size)
+
+    tombstone_retention_days = int(settings['app'].get('tombstone_retention_days', 180))
+    events_max = int(settings['app'].get('events_max', 100000))
+
+    config.registry.events_max_wait = min(
+        float(settings['app'].get('events_max_wait', 0)), EVENTS_MAX_WAIT)
 
     def add_databroker(request):
-        return controller.DataBroker(add_database())
+        return controller.DataBroker(config.registry.storage,
+                                     reference_cache=reference_cache,
+                                     article_store=config.registry.article_store,
+                                     tombstone_retention_days=tombstone_retention_days,
+                                     events_max=events_max)
 
     config.add_route('index', '/')
     config.add_route('collection', '/api/v1/collection')
@@ -285,13 +511,22 @@ def main(settings, *args, **xargs):
     config.add_route('delete_journal', '/api/v1/journal/delete')
     config.add_route('get_article', '/api/v1/article')
     config.add_route('add_article', '/api/v1/article/add')
+    config.add_route('add_articles', '/api/v1/article/add/batch')
     config.add_route('set_doaj_status_true', '/api/v1/article/doaj_status_true')
     config.add_route('set_doaj_status_false', '/api/v1/article/doaj_status_false')
+    config.add_route('set_doaj_status_bulk', '/api/v1/article/doaj_status')
+    config.add_route('identifiers_doaj_pending', '/api/v1/article/doaj_pending')
     config.add_route('delete_article', '/api/v1/article/delete')
     config.add_route('identifiers_article', '/api/v1/article/identifiers')
     config.add_route('identifiers_press_release', '/api/v1/press_release/identifiers')
     config.add_route('exists_article', '/api/v1/article/exists')
+    config.add_route('events', '/api/v1/events')
+    config.add_route('metrics', '/api/v1/_metrics')
     config.add_request_method(add_databroker, 'databroker', reify=True)
+    config.add_tween(compression.__name__ + '.compression_tween_factory')
+
+    if metrics.registry.enabled:
+        config.add_tween(metrics.__name__ + '.metrics_tween_factory')
     config.scan()
 
     return config.make_wsgi_app()
@@ -0,0 +1,173 @@
+# coding: utf-8
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/xml',
+    'text/plain',
+    'text/xml'
+)
+
+DEFAULT_MIN_SIZE = 1024
+DEFAULT_LEVEL = 6
+
+
+class BrotliCompressor(object):
+    """
+    Gives the brotli streaming compressor the same interface of the zlib
+    compression objects.
+    """
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def gzip_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def deflate_compressor(level):
+    return zlib.compressobj(level)
+
+
+COMPRESSORS = {
+    'gzip': gzip_compressor,
+    'deflate': deflate_compressor
+}
+
+PREFERENCE = ['gzip', 'deflate']
+
+if brotli:
+    COMPRESSORS['br'] = BrotliCompressor
+    PREFERENCE.insert(0, 'br')
+
+
+def parse_accept_encoding(header):
+    """
+    Parses the Accept-Encoding header value and retrieve a dictionary
+    of codings and quality values.
+    from: 'gzip;q=0.8, deflate, br;q=0'
+    to: {'gzip': 0.8, 'deflate': 1.0, 'br': 0.0}
+    """
+    codings = {}
+
+    for item in (header or '').split(','):
+        parts = [i.strip() for i in item.split(';')]
+
+        if not parts[0]:
+            continue
+
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+
+        codings[parts[0].lower()] = quality
+
+    return codings
+
+
+def choose_encoding(header):
+    """
+    Retrieve the best content coding available for the given
+    Accept-Encoding header or None when the response must not be
+    compressed.
+    """
+    codings = parse_accept_encoding(header)
+
+    candidates = []
+    for position, encoding in enumerate(PREFERENCE):
+        quality = codings.get(encoding, codings.get('*', 0.0))
+        if quality > 0:
+            candidates.append((-quality, position, encoding))
+
+    if not candidates:
+        return None
+
+    return sorted(candidates)[0][2]
+
+
+def compress_iter(app_iter, compressor):
+    """
+    Compress the response body chunk by chunk, so the body is never
+    buffered as a whole.
+    """
+    try:
+        for chunk in app_iter:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+def should_compress(request, response, min_size):
+
+    if request.method == 'HEAD':
+        return False
+
+    if response.status_int != 200 or response.content_encoding:
+        return False
+
+    if response.content_type not in COMPRESSIBLE_TYPES:
+        return False
+
+    # Streamed responses have no length and are always compressed.
+    if response.content_length is not None and response.content_length < min_size:
+        return False
+
+    return True
+
+
+def compression_tween_factory(handler, registry):
+    settings = (registry.settings or {}).get('app', {})
+
+    enabled = settings.get('compression', 'true').lower() == 'true'
+    min_size = int(settings.get('compression_min_size', DEFAULT_MIN_SIZE))
+    level = int(settings.get('compression_level', DEFAULT_LEVEL))
+
+    if not enabled:
+        return handler
+
+    def compression_tween(request):
+        response = handler(request)
+
+        if response.content_type not in COMPRESSIBLE_TYPES:
+            return response
+
+        vary = tuple(response.vary or ())
+        if 'Accept-Encoding' not in vary:
+            response.vary = vary + ('Accept-Encoding',)
+
+        if not should_compress(request, response, min_size):
+            return response
+
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+
+        if not encoding:
+            return response
+
+        response.app_iter = compress_iter(response.app_iter,
+                                          COMPRESSORS[encoding](level))
+        response.content_length = None
+        response.content_encoding = encoding
+
+        return response
+
+    return compression_tween
@@ -1,15 +1,35 @@
 # coding: utf-8
+import base64
+import hashlib
+import json
 import unicodedata
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
-import pymongo
-from xylose.scielodocument import Article
+from lazydocument import LazyArticle, citation_records
+
+import metrics
+import storage
 
 
 def remove_accents(data):
     return ''.join(x for x in unicodedata.normalize('NFKD', data) if unicodedata.category(x)[0] == 'L').lower()
 
 
+def content_hash(metadata):
+    """
+    Stable hash of the article or journal record as received from the
+    source, used to skip the records that did not change since the last
+    load.
+    """
+    data = dict((k, v) for k, v in metadata.items() if k != '_id')
+
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, separators=(',', ':'))).hexdigest()
+
+
 def gen_citations_title_keys(article):
     """
     This method is responsible to receive an array having the article titles
@@ -18,26 +38,16 @@ def gen_citations_title_keys(article):
     to: ['healthcareafter60th', 'cuidadosdesaudeaposossessentaanos']
     """
 
+    citations = citation_records(article)
+
     def get_citation_titles():
         titles = set()
 
-        for citation in article.citations:
-            title = ''
-            if citation.article_title:
-                title = citation.article_title
-            elif citation.chapter_title:
-                title = citation.chapter_title
-            elif citation.thesis_title:
-                title = citation.thesis_title
-            elif citation.conference_title:
-                title = citation.conference_title
-            elif citation.link_title:
-                title = citation.link_title
-
-            if not title:
+        for citation in citations:
+            if not citation.title:
                 continue
 
-            titles.add(remove_accents(title))
+            titles.add(remove_accents(citation.title))
 
         if len(titles) == 0:
             return []
@@ -47,25 +57,13 @@ def gen_citations_title_keys(article):
     def get_citation_titles_pages():
         titles = set()
 
-        for citation in article.citations:
-            title = ''
-            if citation.article_title:
-                title = citation.article_title
-            elif citation.chapter_title:
-                title = citation.chapter_title
-            elif citation.thesis_title:
-                title = citation.thesis_title
-            elif citation.conference_title:
-                title = citation.conference_title
-            elif citation.link_title:
-                title = citation.link_title
-
-            if not title:
+        for citation in citations:
+            if not citation.title:
                 continue
 
             start_page = citation.start_page or ''
             end_page = citation.end_page or ''
-            titles.add(remove_accents(title)+start_page+end_page)
+            titles.add(remove_accents(citation.title)+start_page+end_page)
 
 
         if len(titles) == 0:
@@ -76,34 +74,23 @@ def gen_citations_title_keys(article):
     def get_citation_titles_author_year():
         titles = set()
 
-        for citation in article.citations:
+        for citation in citations:
 
             if not citation.date:
                 continue
 
             data = []
-            title = ''
-            if citation.article_title:
-                title = citation.article_title
-            elif citation.chapter_title:
-                title = citation.chapter_title
-            elif citation.thesis_title:
-                title = citation.thesis_title
-            elif citation.conference_title:
-                title = citation.conference_title
-            elif citation.link_title:
-                title = citation.link_title
-
-            if not title:
+
+            if not citation.title:
                 continue
 
-            data.append(title)
+            data.append(citation.title)
 
             author = ''
             if citation.authors:
-                author = citation.authors[0].get('given_names', '')+citation.authors[0].get('surname', '')
+                author = (citation.authors[0].given_names or '')+(citation.authors[0].surname or '')
             elif citation.monographic_authors:
-                author = citation.monographic_authors[0].get('given_names', '')+citation.monographic_authors[0].get('surname', '')
+                author = (citation.monographic_authors[0].given_names or '')+(citation.monographic_authors[0].surname or '')
 
             if not author:
                 continue
@@ -122,7 +109,7 @@ def gen_citations_title_keys(article):
 
         return list(titles)
 
-    if not article.citations:
+    if not citations:
         return []
 
     no_accents_strings = get_citation_titles()
@@ -185,10 +172,147 @@ def gen_title_keys(article):
     return title_keys
 
 
+EVENTS_TRIM_INTERVAL = 100
+
+# seconds after which a missing sequence number is taken for an event that
+# will never be written, instead of one still being written
+EVENTS_GAP_SECONDS = 30
+
+DOAJ_STATUS_CHUNK = 500
+
+JOURNALS_CHANGES_SORT = [('processing_date', 1), ('collection', 1), ('issn', 1)]
+
+
+def encode_resume_token(journal):
+    """
+    Opaque token with the sort keys of the last journal of a page.
+    """
+    keys = [journal.get(field, None) for field, direction in JOURNALS_CHANGES_SORT]
+
+    return base64.urlsafe_b64encode(json.dumps(keys))
+
+
+def resume_filter(token):
+    """
+    Retrieve the $or conditions selecting the journals sorted after the
+    one the token was made from. Raises ValueError for invalid tokens.
+    """
+    try:
+        processing_date, collection, issn = json.loads(
+            base64.urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid resume token')
+
+    return [
+        {'processing_date': {'$gt': processing_date}},
+        {'processing_date': processing_date,
+         'collection': {'$gt': collection}},
+        {'processing_date': processing_date,
+         'collection': collection,
+         'issn': {'$gt': issn}}
+    ]
+
+
+class ReferenceCache(object):
+    """
+    Read-through cache for small reference sets, like collections and
+    journals. Entries expire after ``ttl`` seconds and are dropped by the
+    DataBroker every time the cached data is changed.
+
+    The keys come from the request parameters, misses included, so the
+    least recently used entries are discarded when maxsize is reached.
+    """
+
+    def __init__(self, ttl=300, maxsize=1000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, loader):
+        now = time.time()
+
+        with self._lock:
+            entry = self._data.pop(key, None)
+            generation = self._generation
+
+            if entry and entry[0] > now:
+                self._data[key] = entry
+                return entry[1]
+
+        value = loader()
+
+        with self._lock:
+            # do not keep values loaded before an invalidation
+            if generation == self._generation:
+                self._data.pop(key, None)
+                self._data[key] = (now + self.ttl, value)
+
+                if len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+        return value
+
+    def invalidate(self, kind=None):
+        """
+        Drop the entries of the given kind, the first item of the keys, or
+        all the entries when no kind is given.
+        """
+        with self._lock:
+            self._generation += 1
+
+            if kind is None:
+                self._data.clear()
+                return
+
+            for key in self._data.keys():
+                if key[0] == kind:
+                    del(self._data[key])
+
+
 class DataBroker(object):
 
-    def __init__(self, databroker):
-        self.db = databroker
+    def __init__(self, databroker, reference_cache=None, article_store=None,
+                 tombstone_retention_days=180, events_max=100000):
+        """
+        databroker is a storage.Storage instance or a pymongo database,
+        which is used through storage.MongoStorage.
+
+        article_store is an optional read-only source of articles, like
+        snapshot.SnapshotArticleStore, checked by get_article before the
+        storage.
+
+        Deleted articles and journals are listed as tombstones for
+        tombstone_retention_days days.
+
+        The writes are appended to the events log, which keeps the last
+        events_max events, 0 disables it.
+        """
+        if isinstance(databroker, storage.Storage):
+            self.storage = databroker
+        else:
+            self.storage = storage.MongoStorage(databroker)
+
+        self._reference_cache = reference_cache
+        self._article_store = article_store
+        self.tombstone_retention_days = tombstone_retention_days
+        self.events_max = events_max
+
+    def _cached(self, key, loader):
+
+        if self._reference_cache is None:
+            return loader()
+
+        data = self._reference_cache.get(key, loader)
+
+        if data is None:
+            return None
+
+        return list(data)
 
     def _check_article_meta(self, metadata):
         """
@@ -196,7 +320,7 @@ class DataBroker(object):
             a new dictionary with some new fields.
         """
 
-        article = Article(metadata)
+        article = LazyArticle(metadata)
 
         issns = set([article.any_issn(priority=u'electronic'),
                     article.any_issn(priority=u'print')])
@@ -233,16 +357,147 @@ class DataBroker(object):
             This method will check the given metadata and retrieve
             a new dictionary with some new fields.
         """
-        journal = Article({'title': metadata, 'article': {}, 'citations': {}})
+        journal = LazyArticle({'title': metadata, 'article': {}, 'citations': {}})
 
         issns = set([journal.any_issn(priority=u'electronic'),
                      journal.any_issn(priority=u'print')])
 
         metadata['code'] = list(issns)
+        metadata['issn'] = journal.any_issn()
         metadata['collection'] = journal.collection_acronym
+        metadata['processing_date'] = datetime.now().date().isoformat()
 
         return metadata
 
+    def _log_event(self, event, code, collection=None, **data):
+        """
+        Append an event to the events log, numbered by a monotonic
+        sequence. The log is trimmed to the last events_max events every
+        EVENTS_TRIM_INTERVAL events.
+        """
+        if not self.events_max:
+            return
+
+        seq = self.storage.next_sequence('events')
+
+        record = {
+            'seq': seq,
+            'event': event,
+            'code': code,
+            'collection': collection,
+            'date': datetime.now().isoformat()
+        }
+        record.update(data)
+
+        self.storage.insert('events', record)
+
+        if seq % EVENTS_TRIM_INTERVAL == 0:
+            self.storage.remove('events', {'seq': {'$lte': seq - self.events_max}})
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def events(self, since=0, limit=100):
+        """
+        Events with sequence number greater than since, in order. meta.last
+        is the sequence number to ask for the next events, meta.truncated
+        tells the log no longer has all the events after since.
+
+        The sequence number is allocated before the event is written, so
+        concurrent writers may store an event before one with a lower
+        number. The events are retrieved up to the first missing
+        number, unless the event after it is older than EVENTS_GAP_SECONDS,
+        so a reader moving meta.last forward never skips an event.
+        """
+        data = [i for i in self.storage.find(
+            'events', {'seq': {'$gt': since}}, sort=[('seq', 1)], limit=limit)]
+
+        truncated = False
+        if since and data and data[0]['seq'] > since + 1:
+            first = [i for i in self.storage.find(
+                'events', {}, ['seq'], sort=[('seq', 1)], limit=1)]
+            truncated = bool(first) and first[0]['seq'] > since + 1
+
+        settled = (datetime.now() - timedelta(seconds=EVENTS_GAP_SECONDS)).isoformat()
+
+        expected = since + 1 if since and not truncated else None
+        for index, event in enumerate(data):
+            if expected is not None and event['seq'] > expected and event['date'] > settled:
+                data = data[:index]
+                break
+            expected = event['seq'] + 1
+
+        meta = {'since': since,
+                'limit': limit,
+                'last': data[-1]['seq'] if data else since,
+                'truncated': truncated}
+
+        return {'meta': meta, 'objects': data}
+
+    def _add_tombstone(self, kind, code, collection):
+        """
+        Record the deletion of an article or journal and drop the
+        tombstones older than the retention window.
+        """
+        today = datetime.now().date()
+
+        self.storage.upsert(
+            'tombstones',
+            {'kind': kind, 'code': code, 'collection': collection},
+            {'deleted_date': today.isoformat()}
+        )
+
+        self.compact_tombstones(
+            (today - timedelta(days=self.tombstone_retention_days)).isoformat())
+
+    def _remove_tombstones(self, kind, codes, collection):
+
+        self.storage.remove(
+            'tombstones',
+            {'kind': kind, 'code': {'$in': codes}, 'collection': collection}
+        )
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def compact_tombstones(self, before):
+        """
+        Remove the tombstones of deletions made before the given date.
+        """
+        self.storage.remove('tombstones', {'deleted_date': {'$lt': before}})
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def identifiers_deleted(self,
+                            kind,
+                            collection=None,
+                            from_date='1500-01-01',
+                            until_date=datetime.now().date().isoformat(),
+                            limit=1000,
+                            offset=0):
+        """
+        Articles or journals, as given by kind, deleted in the date window.
+        Deletions older than the retention window are not listed.
+        """
+
+        fltr = {'kind': kind}
+        fltr['deleted_date'] = {'$gte': from_date, '$lte': until_date}
+
+        if collection:
+            fltr['collection'] = collection
+
+        total = self.storage.count('tombstones', fltr)
+        data = self.storage.find('tombstones', fltr,
+                                 ['code', 'collection', 'deleted_date'],
+                                 sort=[('deleted_date', 1)],
+                                 skip=offset, limit=limit)
+
+        meta = {'limit': limit,
+                'offset': offset,
+                'filter': fltr,
+                'total': total,
+                'retention_days': self.tombstone_retention_days}
+
+        result = {'meta': meta, 'objects': [{'code': i['code'], 'collection': i.get('collection', None), 'deleted_date': i['deleted_date']} for i in data]}
+
+        return result
+
+    @metrics.timed('articlemeta_databroker_seconds')
     def journal(self, collection=None, issn=None):
 
         fltr = {}
@@ -253,13 +508,17 @@ class DataBroker(object):
         if issn:
             fltr['code'] = issn
 
-        data = self.db['journals'].find(fltr, {'_id': 0})
+        def loader():
+            data = [i for i in self.storage.find('journals', fltr)]
 
-        if not data:
-            return None
+            if not data:
+                return None
 
-        return [i for i in data]
+            return data
 
+        return self._cached(('journals', collection, issn), loader)
+
+    @metrics.timed('articlemeta_databroker_seconds')
     def delete_journal(self, issn, collection=None):
 
         fltr = {
@@ -267,51 +526,147 @@ class DataBroker(object):
             'collection': collection
         }
 
-        self.db['journals'].remove(fltr)
+        if not self.storage.remove('journals', fltr):
+            return
 
-    def add_journal(self, metadata):
+        self._add_tombstone('journal', issn, collection)
+        self._log_event('journal.delete', issn, collection)
+
+        if self._reference_cache is not None:
+            self._reference_cache.invalidate('journals')
 
+    @metrics.timed('articlemeta_databroker_seconds')
+    def add_journal(self, metadata):
+        """
+        Store the journal and retrieve it, or None when the stored copy has
+        the same content hash, so its processing_date is kept and it is not
+        listed as changed again.
+        """
+        chash = content_hash(metadata)
         journal = self._check_journal_meta(metadata)
 
         if not journal:
             return None
 
-        self.db['journals'].update(
+        current = self.storage.find_one(
+            'journals',
             {'code': journal['code'], 'collection': journal['collection']},
-            {'$set': journal},
-            safe=False,
-            upsert=True
+            ['content_hash'])
+
+        if current is not None and current.get('content_hash', None) == chash:
+            return None
+
+        journal['content_hash'] = chash
+
+        self.storage.upsert(
+            'journals',
+            {'code': journal['code'], 'collection': journal['collection']},
+            journal
         )
+        self._remove_tombstones('journal', journal['code'], journal['collection'])
+        self._log_event('journal.add', journal['code'], journal['collection'])
+
+        if self._reference_cache is not None:
+            self._reference_cache.invalidate('journals')
 
         return journal
 
+    @metrics.timed('articlemeta_databroker_seconds')
+    def get_watermark(self, name, collection=None):
+        """
+        Retrieve the progress recorded by the job of the given name for the
+        collection, an empty dict when there is none.
+        """
+        data = self.storage.find_one('watermarks',
+                                     {'name': name, 'collection': collection})
+
+        return data or {}
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def set_watermark(self, name, collection=None, **values):
+
+        self.storage.upsert('watermarks',
+                            {'name': name, 'collection': collection},
+                            values)
+
+    @metrics.timed('articlemeta_databroker_seconds')
     def collection(self):
 
-        data = self.db['collections'].find({}, {'_id': 0})
+        def loader():
+            data = [i for i in self.storage.find('collections', {})]
 
-        if not data:
-            return None
+            if not data:
+                return None
+
+            return data
 
-        return [i for i in data]
+        return self._cached(('collections',), loader)
 
-    def identifiers_journal(self, collection=None, limit=1000, offset=0):
+    @metrics.timed('articlemeta_databroker_seconds')
+    def identifiers_journal(self,
+                            collection=None,
+                            from_date=None,
+                            until_date=None,
+                            limit=1000,
+                            offset=0,
+                            resume_token=None):
+        """
+        Journals identifiers. When a date window or a resume_token is given,
+        only the journals updated in the window are listed, ordered by
+        processing_date, and meta.resume_token points to the next page.
+        """
 
         fltr = {}
         if collection:
             fltr['collection'] = collection
 
-        total = self.db['journals'].find(fltr).count()
-        data = self.db['journals'].find(fltr, {'code': 1, 'collection': 1}).skip(offset).limit(limit)
+        changes = bool(from_date or until_date or resume_token)
+
+        if not changes:
+            total = self.storage.count('journals', fltr)
+            data = self.storage.find('journals', fltr, ['code', 'collection'],
+                                     skip=offset, limit=limit)
+
+            meta = {'limit': limit,
+                    'offset': offset,
+                    'filter': fltr,
+                    'total': total}
+
+            result = {'meta': meta, 'objects': [{'code': i['code'], 'collection': i['collection']} for i in data]}
+
+            return result
+
+        fltr['processing_date'] = {
+            '$gte': from_date or '1500-01-01',
+            '$lte': until_date or datetime.now().date().isoformat()
+        }
+
+        total = self.storage.count('journals', fltr)
+
+        query = dict(fltr)
+        if resume_token:
+            query['$or'] = resume_filter(resume_token)
+
+        data = self.storage.find('journals', query,
+                                 ['code', 'issn', 'collection', 'processing_date'],
+                                 sort=JOURNALS_CHANGES_SORT, skip=offset, limit=limit)
+        data = [i for i in data]
+
+        next_token = None
+        if limit and len(data) == limit:
+            next_token = encode_resume_token(data[-1])
 
         meta = {'limit': limit,
                 'offset': offset,
                 'filter': fltr,
-                'total': total}
+                'total': total,
+                'resume_token': next_token}
 
-        result = {'meta': meta, 'objects': [{'code': i['code'], 'collection': i['collection']} for i in data]}
+        result = {'meta': meta, 'objects': [{'code': i['code'], 'collection': i['collection'], 'processing_date': i['processing_date']} for i in data]}
 
         return result
 
+    @metrics.timed('articlemeta_databroker_seconds')
     def identifiers_article(self,
                             collection=None,
                             from_date='1500-01-01',
@@ -327,12 +682,10 @@ class DataBroker(object):
             fltr['collection'] = collection
             hint.insert(0, ('collection', 1))
 
-        total = self.db['articles'].find(fltr).hint(hint).count()
-        data = self.db['articles'].find(fltr, {
-            'code': 1,
-            'collection': 1,
-            'processing_date': 1}
-        ).hint(hint).skip(offset).limit(limit)
+        total = self.storage.count('articles', fltr, hint=hint)
+        data = self.storage.find('articles', fltr,
+                                 ['code', 'collection', 'processing_date'],
+                                 hint=hint, skip=offset, limit=limit)
 
         meta = {'limit': limit,
                 'offset': offset,
@@ -343,6 +696,34 @@ class DataBroker(object):
 
         return result
 
+    def articles(self, collection=None, from_date='1500-01-01', until_date=None,
+                 page_size=1000):
+        """
+        Generator of the articles processed in the date window, read page by
+        page from identifiers_article.
+        """
+        until_date = until_date or datetime.now().date().isoformat()
+        offset = 0
+
+        while True:
+            page = self.identifiers_article(collection=collection,
+                                            from_date=from_date,
+                                            until_date=until_date,
+                                            limit=page_size,
+                                            offset=offset)
+
+            for item in page['objects']:
+                article = self.get_article(item['code'],
+                                           collection=item['collection'])
+                if article:
+                    yield article
+
+            offset += page_size
+
+            if offset >= page['meta']['total'] or not page['objects']:
+                break
+
+    @metrics.timed('articlemeta_databroker_seconds')
     def identifiers_press_release(self,
                                   collection=None,
                                   from_date='1500-01-01',
@@ -358,12 +739,12 @@ class DataBroker(object):
         if collection:
             fltr['collection'] = collection
 
-        total = self.db['articles'].find(fltr).hint([('document_type', 1), ('collection', 1), ('processing_date', -1)]).count()
-        data = self.db['articles'].find(fltr, {
-            'code': 1,
-            'collection': 1,
-            'processing_date': 1}
-        ).hint([('document_type', 1), ('collection', 1), ('processing_date', -1)]).skip(offset).limit(limit)
+        hint = [('document_type', 1), ('collection', 1), ('processing_date', -1)]
+
+        total = self.storage.count('articles', fltr, hint=hint)
+        data = self.storage.find('articles', fltr,
+                                 ['code', 'collection', 'processing_date'],
+                                 hint=hint, skip=offset, limit=limit)
 
         meta = {'limit': limit,
                 'offset': offset,
@@ -374,21 +755,27 @@ class DataBroker(object):
 
         return result
 
+    @metrics.timed('articlemeta_databroker_seconds')
     def get_article(self, code, collection=None):
 
+        if self._article_store is not None:
+            data = self._article_store.get_article(code, collection)
+
+            if data:
+                return data
+
         fltr = {'code': code}
         if collection:
             fltr['collection'] = collection
 
-        data = self.db['articles'].find_one(fltr)
+        data = self.storage.find_one('articles', fltr)
 
         if not data:
             return None
 
-        del(data['_id'])
-
         return data
 
+    @metrics.timed('articlemeta_databroker_seconds')
     def exists_article(self, code, collection=None):
 
         fltr = {'code': code}
@@ -396,11 +783,12 @@ class DataBroker(object):
         if collection:
             fltr['collection'] = collection
 
-        if self.db['articles'].find(fltr).count() >= 1:
+        if self.storage.count('articles', fltr) >= 1:
             return True
 
         return False
 
+    @metrics.timed('articlemeta_databroker_seconds')
     def delete_article(self, code, collection=None):
 
         fltr = {
@@ -408,31 +796,151 @@ class DataBroker(object):
             'collection': collection
         }
 
-        self.db['articles'].remove(fltr)
+        if not self.storage.remove('articles', fltr):
+            return
 
-    def add_article(self, metadata):
+        self._add_tombstone('article', code, collection)
+        self._log_event('article.delete', code, collection)
+
+    def _save_article(self, metadata):
+        """
+        Store the article unless the stored copy has the same content hash.
+        Retrieve the status, inserted, updated or skipped, and the article
+        as stored, None when skipped.
+        """
+        code = metadata['article']['v880'][0]['_']
+        collection = metadata['article']['v992'][0]['_']
+        chash = content_hash(metadata)
+
+        current = self.storage.find_one(
+            'articles', {'code': code, 'collection': collection}, ['content_hash'])
+
+        if current is not None and current.get('content_hash', None) == chash:
+            return 'skipped', None
 
         article = self._check_article_meta(metadata)
 
         if not article:
-            return None
+            return 'skipped', None
 
-        code = article['article']['v880'][0]['_']
-        collection = article['article']['v992'][0]['_']
+        article['content_hash'] = chash
 
-        self.db['articles'].update(
+        self.storage.upsert(
+            'articles',
             {'code': code, 'collection': collection},
-            {'$set': article},
-            safe=False,
-            upsert=True
+            article
         )
+        self._remove_tombstones('article', [code], collection)
+
+        status = 'inserted' if current is None else 'updated'
+        self._log_event('article.add', code, collection, status=status)
+
+        return status, article
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def add_article(self, metadata):
+        """
+        Retrieve the stored article, or None when it did not change.
+        """
+        status, article = self._save_article(metadata)
 
         return article
 
-    def set_doaj_status(self, code, status):
+    @metrics.timed('articlemeta_databroker_seconds')
+    def add_articles(self, articles):
+        """
+        Store a batch of articles and retrieve how many of them were
+        inserted, updated or skipped for being unchanged.
+        """
+        counts = {'inserted': 0, 'updated': 0, 'skipped': 0}
+
+        for metadata in articles:
+            status, article = self._save_article(metadata)
+            counts[status] += 1
+
+        return counts
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def set_doaj_status(self, code, status, collection=None):
+        """
+        Set the DOAJ status of the article and retrieve the number of
+        updated articles, 0 when it is unknown or already had the status.
+        """
+        fltr = {'code': code, 'sent_doaj': {'$ne': str(status)}}
+        if collection:
+            fltr['collection'] = collection
+
+        updated = self.storage.update(
+            'articles',
+            fltr,
+            {'sent_doaj': str(status)}
+        )
+
+        if updated:
+            self._log_event('article.doaj_status', code, collection,
+                            sent_doaj=str(status))
+
+        return updated
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def set_doaj_status_bulk(self, articles, status):
+        """
+        Set the DOAJ status of the given (collection, code) pairs, with one
+        multi-document update per collection and chunk of codes. Retrieve
+        the number of updated articles. Only the articles whose status
+        changed are listed in the events.
+        """
+        codes = {}
+        for collection, code in articles:
+            codes.setdefault(collection, []).append(code)
+
+        updated = 0
+        for collection, items in sorted(codes.items()):
+            for i in range(0, len(items), DOAJ_STATUS_CHUNK):
+                fltr = {'collection': collection,
+                        'code': {'$in': items[i:i + DOAJ_STATUS_CHUNK]},
+                        'sent_doaj': {'$ne': str(status)}}
+
+                changed = sorted(set(
+                    j['code'] for j in self.storage.find('articles', fltr, ['code'])))
+
+                if not changed:
+                    continue
+
+                updated += self.storage.update(
+                    'articles',
+                    fltr,
+                    {'sent_doaj': str(status)},
+                    multi=True
+                )
+                self._log_event('article.doaj_status', None, collection,
+                                codes=changed, sent_doaj=str(status))
+
+        return updated
+
+    @metrics.timed('articlemeta_databroker_seconds')
+    def identifiers_doaj_pending(self, collection=None, limit=1000, offset=0):
+        """
+        Articles not sent to DOAJ yet, oldest first. Marking articles as
+        sent removes them from this listing, consumers working through the
+        queue should keep asking for the first page.
+        """
+
+        fltr = {'sent_doaj': 'False'}
+        if collection:
+            fltr['collection'] = collection
+
+        total = self.storage.count('articles', fltr)
+        data = self.storage.find('articles', fltr,
+                                 ['code', 'collection', 'processing_date'],
+                                 sort=[('processing_date', 1)],
+                                 skip=offset, limit=limit)
+
+        meta = {'limit': limit,
+                'offset': offset,
+                'filter': fltr,
+                'total': total}
+
+        result = {'meta': meta, 'objects': [{'code': i['code'], 'collection': i['collection'], 'processing_date': i.get('processing_date', None)} for i in data]}
 
-        self.db['articles'].update(
-            {'code': code},
-            {'$set': {'sent_doaj': str(status)}},
-            safe=False
-        )
\ No newline at end of file
+        return result
\ No newline at end of file
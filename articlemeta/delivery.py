@@ -0,0 +1,145 @@
+# coding: utf-8
+"""
+Delivery packages of a collection's exports, xmlwos by default.
+
+Each article is rendered and validated against the schema of the format in
+worker processes. The valid documents are packed in a zip file and the
+invalid ones are set apart in a quarantine file, with their errors, so they
+do not hold up the delivery. A summary of the run is written beside them.
+
+    python -m articlemeta.delivery mongodb://localhost:27017/scielo_network wos/ --collection scl
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import zipfile
+from datetime import datetime
+
+import storage
+import validation
+from controller import DataBroker
+from export import Export, JournalMetaCache
+
+_journal_cache = JournalMetaCache()
+
+
+def render(args):
+    """
+    Render and validate the article, retrieving its collection, code,
+    document and errors. The document is None when it could not be rendered.
+    """
+    article, fmt = args
+    data = None
+
+    try:
+        data = getattr(Export(article, journal_cache=_journal_cache),
+                       'pipeline_%s' % fmt)()
+        errors = validation.validate(fmt, data)
+    except Exception as e:
+        errors = ['%s: %s' % (e.__class__.__name__, e)]
+
+    return article.get('collection', None), article.get('code', None), data, errors
+
+
+def deliver(articles, output_dir, name, fmt='sci', processes=1, chunksize=20):
+    """
+    Write the package <name>.zip of the valid documents, the quarantine
+    <name>.quarantine.json of the invalid ones, one JSON object a line, and
+    the summary <name>.summary.json to output_dir. Retrieve the summary.
+    Nothing is left in output_dir when the delivery fails.
+    """
+    validation.preload([fmt])
+
+    package = os.path.join(output_dir, '%s.zip' % name)
+    quarantine = os.path.join(output_dir, '%s.quarantine.json' % name)
+
+    summary = {'package': package, 'quarantine': quarantine, 'format': fmt,
+               'articles': 0, 'valid': 0, 'invalid': 0}
+
+    tasks = ((article, fmt) for article in articles)
+
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        rendered = pool.imap(render, tasks, chunksize)
+    else:
+        rendered = (render(i) for i in tasks)
+
+    started = time.time()
+
+    try:
+        with zipfile.ZipFile(package + '.tmp', 'w', zipfile.ZIP_DEFLATED) as zf, \
+                open(quarantine + '.tmp', 'wb') as qf:
+            for collection, code, data, errors in rendered:
+                summary['articles'] += 1
+
+                if errors:
+                    summary['invalid'] += 1
+                    qf.write(json.dumps({'collection': collection, 'code': code,
+                                         'errors': errors, 'document': data}))
+                    qf.write('\n')
+                    continue
+
+                summary['valid'] += 1
+                zf.writestr('%s/%s.xml' % (collection, code), data)
+
+        os.rename(package + '.tmp', package)
+        os.rename(quarantine + '.tmp', quarantine)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+        for path in (package + '.tmp', quarantine + '.tmp'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    seconds = time.time() - started
+    summary['seconds'] = round(seconds, 3)
+    summary['articles_per_second'] = round(summary['articles'] / seconds, 1) if seconds else None
+    summary['failure_rate'] = round(
+        float(summary['invalid']) / summary['articles'], 4) if summary['articles'] else 0.0
+
+    with open(os.path.join(output_dir, '%s.summary.json' % name), 'wb') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Validated export delivery packages')
+    parser.add_argument('uri', help='storage URI, mongodb:// or sqlite://')
+    parser.add_argument('output_dir', help='directory of the package files')
+    parser.add_argument('--name', default=None,
+                        help='base name of the files, <collection>_<date> by default')
+    parser.add_argument('--format', dest='fmt', default='sci',
+                        choices=sorted(validation.SCHEMAS))
+    parser.add_argument('--collection', default=None)
+    parser.add_argument('--from', dest='from_date', default='1500-01-01')
+    parser.add_argument('--until', dest='until_date', default=None)
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--xsd-dir', default=None,
+                        help='directory of the schemas, the one of the package by default')
+    args = parser.parse_args()
+
+    validation.configure(args.xsd_dir)
+
+    name = args.name or '%s_%s' % (args.collection or 'all',
+                                   datetime.now().strftime('%Y%m%d'))
+
+    articles = DataBroker(storage.from_uri(args.uri)).articles(
+        collection=args.collection,
+        from_date=args.from_date,
+        until_date=args.until_date)
+
+    summary = deliver(articles, args.output_dir, name, fmt=args.fmt,
+                      processes=args.processes)
+
+    print 'articles: %d valid: %d invalid: %d (%.2f%%) %.1f articles/s' % (
+        summary['articles'], summary['valid'], summary['invalid'],
+        summary['failure_rate'] * 100, summary['articles_per_second'] or 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+# coding: utf-8
+"""
+Builds the DOAJ batch files of the articles not sent to DOAJ yet.
+
+The <record> of each article is appended to a <records> file until the
+next one would take the file over the byte limit. Each file is validated
+against the DOAJ schema once. When it is invalid its records are validated
+one by one, the invalid ones are set apart in the quarantine file of the
+run and the file is written with the others. The articles of the written
+files are marked as sent.
+
+The files of each run are named after the time it started,
+doaj_<YYYYmmddHHMMSS>_00001.xml and so on, and existing files are never
+overwritten.
+
+    python -m articlemeta.doaj_feed mongodb://localhost:27017/scielo_network doaj/ --collection scl
+"""
+import argparse
+import json
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from lxml import etree
+
+import storage
+from controller import DataBroker
+from export import Export, JournalMetaCache
+from utils import create_file
+from validation import SCHEMAS, schema
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<records>'
+FOOTER = '</records>\n'
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+
+DOAJ_XSD = SCHEMAS['doaj']
+
+
+class FeedWriter(object):
+    """
+    Groups serialized records in <records> documents of at most max_bytes
+    bytes. ``add`` retrieves the completed batches, ``close`` the last one,
+    as (data, items, records) triples, items being the keys given with
+    each record.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._records = []
+        self._items = []
+        self._size = 0
+
+    def fits(self, record):
+        return len(HEADER) + len(record) + len(FOOTER) <= self.max_bytes
+
+    def add(self, record, item):
+        """
+        Append a record, retrieving the batch completed by it, if any.
+        Records that do not fit alone in a batch raise ValueError.
+        """
+        if not self.fits(record):
+            raise ValueError('record larger than %d bytes' % self.max_bytes)
+
+        batch = None
+        if self._records and len(HEADER) + self._size + len(record) + len(FOOTER) > self.max_bytes:
+            batch = self.close()
+
+        self._records.append(record)
+        self._items.append(item)
+        self._size += len(record)
+
+        return batch
+
+    def close(self):
+
+        if not self._records:
+            return None
+
+        batch = (HEADER + ''.join(self._records) + FOOTER, self._items, self._records)
+
+        self._records = []
+        self._items = []
+        self._size = 0
+
+        return batch
+
+
+def _errors(xsd_schema, data):
+
+    if xsd_schema.validate(etree.fromstring(data)):
+        return []
+
+    return [str(e) for e in xsd_schema.error_log]
+
+
+def build(databroker, output_dir, collection=None, max_bytes=DEFAULT_MAX_BYTES,
+          xsd=DOAJ_XSD, mark_sent=True, run=None):
+    """
+    Write the DOAJ batch files of the pending articles to output_dir and
+    mark the articles of the written files as sent. run names the files,
+    the current time by default. Retrieve a report with the written files,
+    the invalid records, the quarantine file and the articles left out.
+    """
+    run = run or datetime.now().strftime('%Y%m%d%H%M%S')
+
+    pending = []
+    offset = 0
+    while True:
+        page = databroker.identifiers_doaj_pending(collection=collection,
+                                                   offset=offset)
+        pending += [(i['collection'], i['code']) for i in page['objects']]
+        offset += page['meta']['limit']
+
+        if offset >= page['meta']['total'] or not page['objects']:
+            break
+
+    report = {'files': [], 'invalid': [], 'skipped': [], 'sent': 0,
+              'quarantine': None}
+    writer = FeedWriter(max_bytes)
+    journal_cache = JournalMetaCache()
+    xsd_schema = schema(xsd)
+
+    def quarantine(item, record, errors):
+        report['invalid'].append({'item': item, 'errors': errors})
+
+        if report['quarantine'] is None:
+            report['quarantine'] = os.path.join(
+                output_dir, 'doaj_%s.quarantine.json' % run)
+            create_file(report['quarantine'], '')
+
+        with open(report['quarantine'], 'ab') as f:
+            f.write(json.dumps({'collection': item[0], 'code': item[1],
+                                'errors': errors, 'document': record}))
+            f.write('\n')
+
+    def flush(batch):
+        if batch is None:
+            return
+
+        data, items, records = batch
+
+        errors = _errors(xsd_schema, data)
+        if errors and len(items) == 1:
+            quarantine(items[0], records[0], errors)
+            return
+
+        if errors:
+            valid_items, valid_records = [], []
+            for item, record in zip(items, records):
+                errors = _errors(xsd_schema, HEADER + record + FOOTER)
+                if errors:
+                    quarantine(item, record, errors)
+                    continue
+                valid_items.append(item)
+                valid_records.append(record)
+
+            if not valid_items:
+                return
+
+            items = valid_items
+            data = HEADER + ''.join(valid_records) + FOOTER
+
+        path = os.path.join(output_dir, 'doaj_%s_%05d.xml' % (
+            run, len(report['files']) + 1))
+        create_file(path, data)
+        report['files'].append(path)
+
+        if mark_sent:
+            report['sent'] += databroker.set_doaj_status_bulk(items, True)
+
+    for item in pending:
+        collection_acronym, code = item
+        article = databroker.get_article(code, collection=collection_acronym)
+
+        if not article:
+            continue
+
+        try:
+            record = ET.tostring(
+                Export(article, journal_cache=journal_cache).record_doaj(),
+                encoding='utf-8')
+            batch = writer.add(record, item)
+        except Exception as e:
+            report['skipped'].append(
+                {'item': item, 'error': '%s: %s' % (e.__class__.__name__, e)})
+            continue
+
+        flush(batch)
+
+    flush(writer.close())
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DOAJ batch files builder')
+    parser.add_argument('uri', help='storage URI, mongodb:// or sqlite://')
+    parser.add_argument('output_dir', help='directory of the batch files')
+    parser.add_argument('--collection', default=None)
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help='size limit of each file, default %d' % DEFAULT_MAX_BYTES)
+    parser.add_argument('--xsd', default=None,
+                        help='DOAJ schema file, the one of the package by default')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='do not mark the articles as sent')
+    args = parser.parse_args()
+
+    report = build(DataBroker(storage.from_uri(args.uri)), args.output_dir,
+                   collection=args.collection, max_bytes=args.max_bytes,
+                   xsd=os.path.abspath(args.xsd) if args.xsd else DOAJ_XSD,
+                   mark_sent=not args.dry_run)
+
+    print 'files: %d invalid: %d skipped: %d sent: %d' % (
+        len(report['files']), len(report['invalid']),
+        len(report['skipped']), report['sent'])
+
+    if report['quarantine']:
+        print 'quarantine: %s' % report['quarantine']
+
+
+if __name__ == '__main__':
+    main()
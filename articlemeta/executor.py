@@ -0,0 +1,251 @@
+# coding: utf-8
+"""
+Runs the XML exports in worker processes, out of the request threads.
+
+Each worker is a python process running this module, reading length
+prefixed JSON requests, ``[format, article]``, from its stdin and writing
+the rendered XML to its stdout, followed by the JSON of the latency
+histograms recorded meanwhile when started with ``--metrics``, merged
+into the metrics of the server. The workers are plain subprocesses, which
+keeps the executor usable under gevent, where the pipes become
+cooperative.
+"""
+import argparse
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+import Queue
+
+import metrics
+
+REQUEST_HEADER = struct.Struct('>I')
+RESPONSE_HEADER = struct.Struct('>?II')
+
+FORMATS = ('sci', 'rsps', 'doaj', 'iahx')
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'executor.py')
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExecutorBusy(Exception):
+    """
+    Raised when the export queue is full or a request waited longer than
+    the queue timeout. retry_after is the number of seconds the client
+    should wait before trying again.
+    """
+
+    def __init__(self, message, retry_after):
+        super(ExecutorBusy, self).__init__(message)
+        self.retry_after = retry_after
+
+
+def _read(stream, size):
+    data = stream.read(size)
+
+    if len(data) != size:
+        raise EOFError()
+
+    return data
+
+
+def worker(stdin, stdout):
+    """
+    Serve export requests until stdin is closed. No JournalMetaCache is
+    kept, the worker living as long as the server, so a journal updated in
+    the meantime is rendered like in the request threads.
+    """
+    from export import Export
+
+    while True:
+        try:
+            size, = REQUEST_HEADER.unpack(_read(stdin, REQUEST_HEADER.size))
+            fmt, article = json.loads(_read(stdin, size))
+        except EOFError:
+            return
+
+        try:
+            data = getattr(Export(article), 'pipeline_%s' % fmt)()
+            ok = True
+        except Exception as e:
+            data = '%s: %s' % (e.__class__.__name__, e)
+            ok = False
+
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+
+        histograms = json.dumps(metrics.registry.drain()) if metrics.registry.enabled else ''
+
+        stdout.write(RESPONSE_HEADER.pack(ok, len(data), len(histograms)))
+        stdout.write(data)
+        stdout.write(histograms)
+        stdout.flush()
+
+
+class Worker(object):
+
+    def __init__(self, args=()):
+        self._process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT] + list(args),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+
+    def export(self, fmt, article):
+        request = json.dumps([fmt, article])
+
+        try:
+            self._process.stdin.write(REQUEST_HEADER.pack(len(request)))
+            self._process.stdin.write(request)
+            self._process.stdin.flush()
+
+            ok, size, histograms_size = RESPONSE_HEADER.unpack(
+                _read(self._process.stdout, RESPONSE_HEADER.size))
+            data = _read(self._process.stdout, size)
+            histograms = _read(self._process.stdout, histograms_size)
+        except (IOError, EOFError):
+            self.close()
+            raise ExportError('export worker %d died' % self._process.pid)
+
+        if histograms:
+            metrics.registry.merge(json.loads(histograms))
+
+        if not ok:
+            raise ExportError(data)
+
+        return data
+
+    @property
+    def alive(self):
+        return self._process.poll() is None
+
+    def close(self):
+
+        if not self.alive:
+            return
+
+        try:
+            self._process.stdin.close()
+        except IOError:
+            pass
+
+        self._process.wait()
+
+
+class ExportExecutor(object):
+    """
+    Pool of export worker processes. ``export`` blocks the calling thread,
+    or greenlet, until a worker is free and has rendered the article.
+
+    At most ``max_queue`` requests wait for a worker, and for no longer
+    than ``queue_timeout`` seconds, ExecutorBusy is raised otherwise.
+
+    ``worker_args`` are the command line options of the workers, see
+    ``main``.
+    """
+
+    def __init__(self, processes=2, max_queue=None, queue_timeout=10,
+                 retry_after=1, worker_args=()):
+        self.processes = processes
+        self.worker_args = list(worker_args)
+        self.max_queue = processes * 4 if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._idle = Queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._pending = 0
+
+        for i in range(processes):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = Worker(self.worker_args)
+
+        with self._lock:
+            self._workers.append(worker)
+
+        return worker
+
+    def _release(self, worker):
+
+        if not worker.alive:
+            with self._lock:
+                self._workers.remove(worker)
+            worker = self._spawn()
+
+        self._idle.put(worker)
+
+    def export(self, fmt, article):
+
+        if fmt not in FORMATS:
+            raise ValueError('Unknown export format: %s' % fmt)
+
+        with self._lock:
+            if self._pending >= self.processes + self.max_queue:
+                raise ExecutorBusy('export queue is full', self.retry_after)
+            self._pending += 1
+
+        try:
+            start = time.time()
+
+            try:
+                worker = self._idle.get(timeout=self.queue_timeout)
+            except Queue.Empty:
+                raise ExecutorBusy('no export worker available', self.retry_after)
+            finally:
+                metrics.registry.observe('articlemeta_export_queue_seconds',
+                                         time.time() - start, format=fmt)
+
+            try:
+                with metrics.registry.timer('articlemeta_export_render_seconds',
+                                            format=fmt):
+                    return worker.export(fmt, article)
+            finally:
+                self._release(worker)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    @property
+    def pending(self):
+        """
+        Number of requests being rendered or waiting for a worker.
+        """
+        return self._pending
+
+    def close(self):
+
+        with self._lock:
+            workers = self._workers
+            self._workers = []
+
+        for worker in workers:
+            worker.close()
+
+
+def main():
+    import export_citations
+
+    parser = argparse.ArgumentParser(description='Export worker')
+    parser.add_argument('--citations-threshold', type=int, default=0)
+    parser.add_argument('--citations-processes', type=int, default=None)
+    parser.add_argument('--citations-chunk-size', type=int, default=250)
+    parser.add_argument('--metrics', action='store_true')
+    args = parser.parse_args()
+
+    metrics.registry.enabled = args.metrics
+
+    export_citations.configure(threshold=args.citations_threshold,
+                               processes=args.citations_processes,
+                               chunk_size=args.citations_chunk_size)
+
+    worker(sys.stdin, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
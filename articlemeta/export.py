@@ -1,132 +1,279 @@
 # coding: utf-8
-from xylose.scielodocument import Article
+from collections import OrderedDict
+
+from lazydocument import LazyArticle
 import plumber
 
+import metrics
 import export_sci
 import export_rsps
 import export_doaj
 import export_iahx
 
 
+class JournalMetaCache(object):
+    """
+    Keeps the journal metadata elements built by the export pipelines,
+    keyed by format, ISSN and collection. The least recently used
+    journals are discarded when maxsize is reached.
+
+    The cached elements are appended as they are to every exported
+    document, so they must not be changed after being cached.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return None
+
+        self._data[key] = value
+
+        return value
+
+    def set(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class JournalMetaPipe(plumber.Pipe):
+    """
+    Runs the journal metadata pipes of an export format. When a cache is
+    given, the pipes run once for each journal and the elements they
+    appended to ``xpath`` are reused by the next articles of the same
+    journal. The pipes are instrumented on their own, being hidden from
+    the pipeline by this one.
+    """
+
+    def __init__(self, fmt, xpath, pipes, cache=None):
+        self._fmt = fmt
+        self._xpath = xpath
+        self._pipes = metrics.instrument(fmt, *pipes)
+        self._cache = cache
+
+    def transform(self, data):
+        raw, xml = data
+
+        if self._cache is None:
+            for pipe in self._pipes:
+                data = pipe.transform(data)
+            return data
+
+        key = (self._fmt, raw.any_issn(), raw.collection_acronym)
+        element = xml.find(self._xpath)
+        cached = self._cache.get(key)
+
+        if cached is None:
+            start = len(element)
+            for pipe in self._pipes:
+                data = pipe.transform(data)
+            self._cache.set(key, list(element)[start:])
+        else:
+            element.extend(cached)
+
+        return data
+
+
 class Export(object):
 
-    def __init__(self, article):
+    def __init__(self, article, journal_cache=None):
         self._article = article
+        self._journal_cache = journal_cache
 
     def pipeline_sci(self):
-        xylose_article = Article(self._article)
-
-        ppl = plumber.Pipeline(export_sci.SetupArticlePipe(),
-                               export_sci.XMLArticlePipe(),
-                               export_sci.XMLFrontPipe(),
-                               export_sci.XMLJournalMetaJournalIdPipe(),
-                               export_sci.XMLJournalMetaJournalTitleGroupPipe(),
-                               export_sci.XMLJournalMetaISSNPipe(),
-                               export_sci.XMLJournalMetaCollectionPipe(),
-                               export_sci.XMLJournalMetaPublisherPipe(),
-                               export_sci.XMLArticleMetaUniqueArticleIdPipe(),
-                               export_sci.XMLArticleMetaArticleIdPublisherPipe(),
-                               export_sci.XMLArticleMetaArticleIdDOIPipe(),
-                               export_sci.XMLArticleMetaArticleCategoriesPipe(),
-                               export_sci.XMLArticleMetaTitleGroupPipe(),
-                               export_sci.XMLArticleMetaTranslatedTitleGroupPipe(),
-                               export_sci.XMLArticleMetaContribGroupPipe(),
-                               export_sci.XMLArticleMetaAffiliationPipe(),
-                               export_sci.XMLArticleMetaGeneralInfoPipe(),
-                               export_sci.XMLArticleMetaAbstractsPipe(),
-                               export_sci.XMLArticleMetaKeywordsPipe(),
-                               export_sci.XMLArticleMetaCitationsPipe(),
-                               export_sci.XMLClosePipe())
+        with metrics.registry.timer('articlemeta_article_build_seconds',
+                                    format='sci'):
+            xylose_article = LazyArticle(self._article)
+
+        pipes = metrics.instrument('sci',
+                                   export_sci.SetupArticlePipe(),
+                                   export_sci.XMLArticlePipe(),
+                                   export_sci.XMLFrontPipe(),
+                                   JournalMetaPipe(
+                                       'sci',
+                                       './article/front/journal-meta',
+                                       [export_sci.XMLJournalMetaJournalIdPipe(),
+                                        export_sci.XMLJournalMetaJournalTitleGroupPipe(),
+                                        export_sci.XMLJournalMetaISSNPipe(),
+                                        export_sci.XMLJournalMetaCollectionPipe(),
+                                        export_sci.XMLJournalMetaPublisherPipe()],
+                                       self._journal_cache),
+                                   export_sci.XMLArticleMetaUniqueArticleIdPipe(),
+                                   export_sci.XMLArticleMetaArticleIdPublisherPipe(),
+                                   export_sci.XMLArticleMetaArticleIdDOIPipe(),
+                                   export_sci.XMLArticleMetaArticleCategoriesPipe(),
+                                   export_sci.XMLArticleMetaTitleGroupPipe(),
+                                   export_sci.XMLArticleMetaTranslatedTitleGroupPipe(),
+                                   export_sci.XMLArticleMetaContribGroupPipe(),
+                                   export_sci.XMLArticleMetaAffiliationPipe(),
+                                   export_sci.XMLArticleMetaGeneralInfoPipe(),
+                                   export_sci.XMLArticleMetaAbstractsPipe(),
+                                   export_sci.XMLArticleMetaKeywordsPipe(),
+                                   export_sci.XMLArticleMetaCitationsPipe(),
+                                   export_sci.XMLClosePipe())
+
+        ppl = plumber.Pipeline(*pipes)
 
         transformed_data = ppl.run(xylose_article, rewrap=True)
 
         return next(transformed_data)
 
     def pipeline_rsps(self):
-        xylose_article = Article(self._article)
-
-        ppl = plumber.Pipeline(export_rsps.SetupArticlePipe(),
-                               export_rsps.XMLArticlePipe(),
-                               export_rsps.XMLFrontPipe(),
-                               export_rsps.XMLJournalMetaJournalIdPipe(),
-                               export_rsps.XMLJournalMetaJournalTitleGroupPipe(),
-                               export_rsps.XMLJournalMetaISSNPipe(),
-                               export_rsps.XMLJournalMetaPublisherPipe(),
-                               export_rsps.XMLArticleMetaArticleIdPublisherPipe(),
-                               export_rsps.XMLArticleMetaArticleIdDOIPipe(),
-                               export_rsps.XMLArticleMetaArticleCategoriesPipe(),
-                               export_rsps.XMLArticleMetaTitleGroupPipe(),
-                               export_rsps.XMLArticleMetaTranslatedTitleGroupPipe(),
-                               export_rsps.XMLArticleMetaContribGroupPipe(),
-                               export_rsps.XMLArticleMetaAffiliationPipe(),
-                               export_rsps.XMLArticleMetaGeneralInfoPipe(),
-                               export_rsps.XMLArticleMetaAbstractsPipe(),
-                               export_rsps.XMLArticleMetaKeywordsPipe(),
-                               export_rsps.XMLArticleMetaCitationsPipe(),
-                               export_rsps.XMLClosePipe())
+        with metrics.registry.timer('articlemeta_article_build_seconds',
+                                    format='rsps'):
+            xylose_article = LazyArticle(self._article)
+
+        pipes = metrics.instrument('rsps',
+                                   export_rsps.SetupArticlePipe(),
+                                   export_rsps.XMLArticlePipe(),
+                                   export_rsps.XMLFrontPipe(),
+                                   JournalMetaPipe(
+                                       'rsps',
+                                       './front/journal-meta',
+                                       [export_rsps.XMLJournalMetaJournalIdPipe(),
+                                        export_rsps.XMLJournalMetaJournalTitleGroupPipe(),
+                                        export_rsps.XMLJournalMetaISSNPipe(),
+                                        export_rsps.XMLJournalMetaPublisherPipe()],
+                                       self._journal_cache),
+                                   export_rsps.XMLArticleMetaArticleIdPublisherPipe(),
+                                   export_rsps.XMLArticleMetaArticleIdDOIPipe(),
+                                   export_rsps.XMLArticleMetaArticleCategoriesPipe(),
+                                   export_rsps.XMLArticleMetaTitleGroupPipe(),
+                                   export_rsps.XMLArticleMetaTranslatedTitleGroupPipe(),
+                                   export_rsps.XMLArticleMetaContribGroupPipe(),
+                                   export_rsps.XMLArticleMetaAffiliationPipe(),
+                                   export_rsps.XMLArticleMetaGeneralInfoPipe(),
+                                   export_rsps.XMLArticleMetaAbstractsPipe(),
+                                   export_rsps.XMLArticleMetaKeywordsPipe(),
+                                   export_rsps.XMLArticleMetaCitationsPipe(),
+                                   export_rsps.XMLClosePipe())
+
+        ppl = plumber.Pipeline(*pipes)
 
         transformed_data = ppl.run(xylose_article, rewrap=True)
 
         return next(transformed_data)
 
+    def _doaj_pipes(self):
+        return [export_doaj.SetupArticlePipe(),
+                export_doaj.XMLArticlePipe(),
+                JournalMetaPipe(
+                    'doaj',
+                    './record',
+                    [export_doaj.XMLJournalMetaPublisherPipe(),
+                     export_doaj.XMLJournalMetaJournalTitlePipe(),
+                     export_doaj.XMLJournalMetaISSNPipe()],
+                    self._journal_cache),
+                export_doaj.XMLArticleMetaPublicationDatePipe(),
+                export_doaj.XMLArticleMetaVolumePipe(),
+                export_doaj.XMLArticleMetaIssuePipe(),
+                export_doaj.XMLArticleMetaStartPagePipe(),
+                export_doaj.XMLArticleMetaEndPagePipe(),
+                export_doaj.XMLArticleMetaArticleIdDOIPipe(),
+                export_doaj.XMLArticleMetaIdPipe(),
+                export_doaj.XMLArticleMetaDocumentTypePipe(),
+                export_doaj.XMLArticleMetaTitlePipe(),
+                export_doaj.XMLArticleMetaAuthorsPipe(),
+                export_doaj.XMLArticleMetaAffiliationPipe(),
+                export_doaj.XMLArticleMetaAbstractsPipe(),
+                export_doaj.XMLArticleMetaFullTextUrlPipe(),
+                export_doaj.XMLArticleMetaKeywordsPipe()]
+
     def pipeline_doaj(self):
-        xylose_article = Article(self._article, iso_format='iso 639-2')
-
-        ppl = plumber.Pipeline(export_doaj.SetupArticlePipe(),
-                               export_doaj.XMLArticlePipe(),
-                               export_doaj.XMLJournalMetaPublisherPipe(),
-                               export_doaj.XMLJournalMetaJournalTitlePipe(),
-                               export_doaj.XMLJournalMetaISSNPipe(),
-                               export_doaj.XMLArticleMetaPublicationDatePipe(),
-                               export_doaj.XMLArticleMetaVolumePipe(),
-                               export_doaj.XMLArticleMetaIssuePipe(),
-                               export_doaj.XMLArticleMetaStartPagePipe(),
-                               export_doaj.XMLArticleMetaEndPagePipe(),
-                               export_doaj.XMLArticleMetaArticleIdDOIPipe(),
-                               export_doaj.XMLArticleMetaIdPipe(),
-                               export_doaj.XMLArticleMetaDocumentTypePipe(),
-                               export_doaj.XMLArticleMetaTitlePipe(),
-                               export_doaj.XMLArticleMetaAuthorsPipe(),
-                               export_doaj.XMLArticleMetaAffiliationPipe(),
-                               export_doaj.XMLArticleMetaAbstractsPipe(),
-                               export_doaj.XMLArticleMetaFullTextUrlPipe(),
-                               export_doaj.XMLArticleMetaKeywordsPipe(),
-                               export_doaj.XMLClosePipe())
+        with metrics.registry.timer('articlemeta_article_build_seconds',
+                                    format='doaj'):
+            xylose_article = LazyArticle(self._article, iso_format='iso 639-2')
+
+        pipes = metrics.instrument('doaj',
+                                   *(self._doaj_pipes() + [export_doaj.XMLClosePipe()]))
+
+        ppl = plumber.Pipeline(*pipes)
 
         transformed_data = ppl.run(xylose_article, rewrap=True)
 
         return next(transformed_data)
 
+    def record_doaj(self):
+        """
+        Retrieve the DOAJ <record> element of the article, used to build
+        the DOAJ batch files.
+        """
+        with metrics.registry.timer('articlemeta_article_build_seconds',
+                                    format='doaj'):
+            xylose_article = LazyArticle(self._article, iso_format='iso 639-2')
+
+        ppl = plumber.Pipeline(*metrics.instrument('doaj', *self._doaj_pipes()))
+
+        raw, xml = next(ppl.run(xylose_article, rewrap=True))
+
+        return xml.find('./record')
+
+    def _iahx_pipes(self):
+        return [export_iahx.SetupDocumentPipe(),
+                export_iahx.XMLDocumentPipe(),
+                export_iahx.XMLDocumentIDPipe(),
+                export_iahx.XMLCollectionPipe(),
+                export_iahx.XMLKnowledgeAreaPipe(),
+                export_iahx.XMLCenterPipe(),
+                export_iahx.XMLDocumentTypePipe(),
+                export_iahx.XMLURPipe(),
+                export_iahx.XMLAuthorsPipe(),
+                export_iahx.XMLTitlePipe(),
+                export_iahx.XMLPagesPipe(),
+                export_iahx.XMLWOKCIPipe(),
+                export_iahx.XMLWOKSCPipe(),
+                export_iahx.XMLIssueLabelPipe(),
+                JournalMetaPipe(
+                    'iahx',
+                    './doc',
+                    [export_iahx.XMLJournalTitlePipe()],
+                    self._journal_cache),
+                export_iahx.XMLOriginalLanguagePipe(),
+                export_iahx.XMLPublicationDatePipe(),
+                export_iahx.XMLAbstractPipe(),
+                export_iahx.XMLAffiliationCountryPipe(),
+                export_iahx.XMLAffiliationInstitutionPipe(),
+                export_iahx.XMLSponsorPipe()]
+
     def pipeline_iahx(self):
-        xylose_article = Article(self._article)
-
-        ppl = plumber.Pipeline(export_iahx.SetupDocumentPipe(),
-                               export_iahx.XMLDocumentPipe(),
-                               export_iahx.XMLDocumentIDPipe(),
-                               export_iahx.XMLCollectionPipe(),
-                               export_iahx.XMLKnowledgeAreaPipe(),
-                               export_iahx.XMLCenterPipe(),
-                               export_iahx.XMLDocumentTypePipe(),
-                               export_iahx.XMLURPipe(),
-                               export_iahx.XMLAuthorsPipe(),
-                               export_iahx.XMLTitlePipe(),
-                               export_iahx.XMLPagesPipe(),
-                               export_iahx.XMLWOKCIPipe(),
-                               export_iahx.XMLWOKSCPipe(),
-                               export_iahx.XMLIssueLabelPipe(),
-                               export_iahx.XMLJournalTitlePipe(),
-                               export_iahx.XMLOriginalLanguagePipe(),
-                               export_iahx.XMLPublicationDatePipe(),
-                               export_iahx.XMLAbstractPipe(),
-                               export_iahx.XMLAffiliationCountryPipe(),
-                               export_iahx.XMLAffiliationInstitutionPipe(),
-                               export_iahx.XMLSponsorPipe(),
-                               export_iahx.XMLClosePipe())
+        with metrics.registry.timer('articlemeta_article_build_seconds',
+                                    format='iahx'):
+            xylose_article = LazyArticle(self._article)
+
+        pipes = metrics.instrument('iahx',
+                                   *(self._iahx_pipes() + [export_iahx.XMLClosePipe()]))
+
+        ppl = plumber.Pipeline(*pipes)
 
         transformed_data = ppl.run(xylose_article, rewrap=True)
 
         return next(transformed_data)
 
+    def record_iahx(self):
+        """
+        Retrieve the IAHX <doc> element of the article, used to build the
+        bulk indexing feeds.
+        """
+        with metrics.registry.timer('articlemeta_article_build_seconds',
+                                    format='iahx'):
+            xylose_article = LazyArticle(self._article)
+
+        ppl = plumber.Pipeline(*metrics.instrument('iahx', *self._iahx_pipes()))
+
+        raw, xml = next(ppl.run(xylose_article, rewrap=True))
+
+        return xml.find('./doc')
+
     # def pipeline_pubmed(self):
     #     xylose_article = Article(self._article, iso_format='iso 639-2')
 
@@ -0,0 +1,166 @@
+# coding: utf-8
+"""
+Reference list of the sci and rsps exports.
+
+Builds each <ref> in one pass over the citation records of
+lazydocument, with the same output of the XMLCitation pipelines.
+
+Reference lists of ``threshold`` or more citations, as configured by
+``configure``, are rendered in chunks across a pool of processes and
+stitched back in order. The pool is created by ``configure``, at startup,
+before the process serves any request.
+"""
+import json
+import multiprocessing
+import threading
+import xml.etree.ElementTree as ET
+import xml.etree.cElementTree as cET
+
+from xylose.scielodocument import Citation
+
+from lazydocument import CitationRecord
+
+SubElement = ET.SubElement
+
+_parallel = {'threshold': 0, 'processes': None, 'chunk_size': 250}
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure(threshold=0, processes=None, chunk_size=250):
+    """
+    Render the reference lists of at least threshold citations in chunks of
+    chunk_size citations across processes worker processes, one per CPU by
+    default, starting them now. A threshold of 0 renders every list in the
+    calling process.
+    """
+    global _pool
+
+    with _pool_lock:
+        _terminate()
+        _parallel.update({'threshold': threshold, 'processes': processes,
+                          'chunk_size': chunk_size})
+
+        if threshold:
+            _pool = multiprocessing.Pool(processes)
+
+
+def _terminate():
+    global _pool
+
+    if _pool is not None:
+        _pool.terminate()
+        _pool = None
+
+
+def close():
+
+    with _pool_lock:
+        _terminate()
+
+
+def _get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = multiprocessing.Pool(_parallel['processes'])
+
+        return _pool
+
+
+def _names(persongroup, authors):
+    for author in authors:
+        name = SubElement(persongroup, 'name')
+
+        if author.surname is not None:
+            SubElement(name, 'surname').text = author.surname
+
+        if author.given_names is not None:
+            SubElement(name, 'given-names').text = author.given_names
+
+
+def ref(citation):
+    """
+    Retrieve the <ref> element of the CitationRecord.
+    """
+    xml = ET.Element('ref')
+    xml.set('id', 'B{0}'.format(str(citation.index_number)))
+
+    elementcitation = SubElement(xml, 'element-citation')
+    elementcitation.set('publication-type', citation.publication_type)
+
+    if citation.article_title:
+        SubElement(elementcitation, 'article-title').text = citation.article_title
+
+    if citation.source:
+        SubElement(elementcitation, 'source').text = citation.source
+
+    pdate = citation.date
+    if pdate:
+        date = SubElement(elementcitation, 'date')
+
+        if pdate[8:10]:
+            SubElement(date, 'day').text = pdate[8:10]
+
+        if pdate[5:7]:
+            SubElement(date, 'month').text = pdate[5:7]
+
+        SubElement(date, 'year').text = pdate[0:4]
+
+    for tag, value in (('fpage', citation.start_page),
+                       ('lpage', citation.end_page),
+                       ('issue', citation.issue),
+                       ('volume', citation.volume)):
+        if value:
+            SubElement(elementcitation, tag).text = value
+
+    if citation.authors or citation.monographic_authors:
+        persongroup = SubElement(elementcitation, 'person-group')
+        _names(persongroup, citation.authors or ())
+        _names(persongroup, citation.monographic_authors or ())
+
+    return xml
+
+
+def _render_chunk(citations):
+    """
+    Retrieve the serialized <ref> elements of the raw citations given as
+    JSON, which is cheaper to send to the workers than their pickle.
+    """
+    return ''.join(ET.tostring(ref(CitationRecord(Citation(i))))
+                   for i in json.loads(citations))
+
+
+def _parallel_ref_list(citations):
+    """
+    The rendered chunks are parsed back by cElementTree, several times
+    faster than ElementTree, to keep the serial part of the work small.
+    Its elements serialize the same inside an ElementTree tree.
+    """
+    chunk_size = _parallel['chunk_size']
+    chunks = [json.dumps([i.data for i in citations[start:start + chunk_size]])
+              for start in range(0, len(citations), chunk_size)]
+
+    return cET.fromstring(
+        '<ref-list>%s</ref-list>' % ''.join(_get_pool().map(_render_chunk, chunks)))
+
+
+def ref_list(parent, citations):
+    """
+    Append the <ref-list> of the CitationRecords to the parent element.
+    """
+    threshold = _parallel['threshold']
+
+    if threshold and len(citations) >= threshold:
+        reflist = _parallel_ref_list(citations)
+        parent.append(reflist)
+
+        return reflist
+
+    reflist = SubElement(parent, 'ref-list')
+
+    for citation in citations:
+        reflist.append(ref(citation))
+
+    return reflist
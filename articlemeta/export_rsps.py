@@ -3,6 +3,9 @@ import xml.etree.ElementTree as ET
 
 import plumber
 
+import export_citations
+import lazydocument
+
 
 class XMLCitation(object):
 
@@ -670,7 +673,7 @@ class XMLArticleMetaCitationsPipe(plumber.Pipe):
 
         raw, xml = data
 
-        if not raw.citations:
+        if not lazydocument.citation_records(raw):
             raise plumber.UnmetPrecondition()
 
     @plumber.precondition(precond)
@@ -678,16 +681,10 @@ class XMLArticleMetaCitationsPipe(plumber.Pipe):
         raw, xml = data
 
         article = xml.find('.')
-        article.append(ET.Element('back'))
-
-        back = article.find('back')
-        back.append(ET.Element('ref-list'))
 
-        reflist = xml.find('./back/ref-list')
+        back = ET.SubElement(article, 'back')
 
-        cit = XMLCitation()
-        for citation in raw.citations:
-            reflist.append(cit.deploy(citation)[1])
+        export_citations.ref_list(back, lazydocument.citation_records(raw))
 
         return data
 
@@ -3,6 +3,9 @@ import xml.etree.ElementTree as ET
 
 import plumber
 
+import export_citations
+import lazydocument
+
 
 class XMLCitation(object):
 
@@ -724,7 +727,7 @@ class XMLArticleMetaCitationsPipe(plumber.Pipe):
 
         raw, xml = data
 
-        if not raw.citations:
+        if not lazydocument.citation_records(raw):
             raise plumber.UnmetPrecondition()
 
     @plumber.precondition(precond)
@@ -732,16 +735,10 @@ class XMLArticleMetaCitationsPipe(plumber.Pipe):
         raw, xml = data
 
         article = xml.find('./article')
-        article.append(ET.Element('back'))
-
-        back = article.find('back')
-        back.append(ET.Element('ref-list'))
 
-        reflist = xml.find('./article/back/ref-list')
+        back = ET.SubElement(article, 'back')
 
-        cit = XMLCitation()
-        for citation in raw.citations:
-            reflist.append(cit.deploy(citation)[1])
+        export_citations.ref_list(back, lazydocument.citation_records(raw))
 
         return data
 
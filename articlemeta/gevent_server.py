@@ -0,0 +1,33 @@
+# coding: utf-8
+"""
+Serves the API with gevent, one greenlet per connection, so a single
+process holds many slow connections open while they wait on MongoDB.
+
+    CONFIG_INI=config.ini python -m articlemeta.gevent_server
+
+The XML exports are CPU bound and block the other greenlets while they
+are rendered, enable the export_processes setting along with this server.
+The long polling of /api/v1/events, set by events_max_wait, is only
+worth enabling under this server.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+
+import articlemeta
+
+
+def main():
+    http_server = articlemeta.settings['http_server']
+
+    server = WSGIServer(
+        (http_server['ip'], int(http_server['port'])),
+        articlemeta.app,
+        spawn=Pool(int(http_server.get('max_connections', 1000))))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+# coding: utf-8
+"""
+Bulk IAHX indexing feeds: many <doc> elements in each <add> document,
+sent to files or POSTed to a Solr update handler.
+
+    python -m articlemeta.iahx_feed mongodb://localhost:27017/scielo_network --output-dir iahx/ --collection scl
+    python -m articlemeta.iahx_feed mongodb://localhost:27017/scielo_network --solr-url http://localhost:8983/solr/articles/update
+
+The files of each run are named after the time it started,
+iahx_<YYYYmmddHHMMSS>_00001.xml and so on, and existing files are never
+overwritten, so the files of a run not read by the indexer yet are kept.
+"""
+import argparse
+import multiprocessing
+import os
+import urllib2
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+import storage
+from controller import DataBroker
+from export import Export, JournalMetaCache
+from utils import create_file
+
+DEFAULT_MAX_DOCS = 500
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+WATERMARK = 'iahx'
+
+
+def document_id(code, collection):
+    """
+    Id of the article in the IAHX index, as set by export_iahx.
+    """
+    return 'art-%s-%s' % (code, collection)
+
+
+class FileSink(object):
+    """
+    Writes each <add> or <delete> document to a new file numbered within
+    the run, the current time by default. Existing files raise OSError.
+    """
+
+    def __init__(self, output_dir, prefix='iahx', run=None):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.run = run or datetime.now().strftime('%Y%m%d%H%M%S')
+        self.files = []
+
+    def send(self, data):
+        path = os.path.join(self.output_dir, '%s_%s_%05d.xml' % (
+            self.prefix, self.run, len(self.files) + 1))
+
+        create_file(path, data)
+
+        self.files.append(path)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class HTTPSink(object):
+    """
+    POSTs each document to a Solr update handler, committing on close.
+    """
+
+    def __init__(self, url, timeout=60, commit=True):
+        self.url = url
+        self.timeout = timeout
+        self.auto_commit = commit
+
+    def send(self, data):
+        request = urllib2.Request(self.url, data,
+                                  {'Content-Type': 'text/xml; charset=utf-8'})
+        response = urllib2.urlopen(request, timeout=self.timeout)
+
+        try:
+            response.read()
+        finally:
+            response.close()
+
+    def commit(self):
+        self.send('<commit/>')
+
+    def close(self):
+
+        if self.auto_commit:
+            self.commit()
+
+
+class BulkWriter(object):
+    """
+    Streams <doc> elements into <add> documents sent to the sink when
+    they reach max_docs documents or max_bytes bytes.
+    """
+
+    def __init__(self, sink, max_docs=DEFAULT_MAX_DOCS, max_bytes=DEFAULT_MAX_BYTES):
+        self.sink = sink
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.sent = 0
+        self._docs = []
+        self._size = 0
+
+    def add(self, doc):
+        """
+        Append a serialized <doc> element.
+        """
+        if self._docs and self._size + len(doc) > self.max_bytes:
+            self.flush()
+
+        self._docs.append(doc)
+        self._size += len(doc)
+
+        if len(self._docs) >= self.max_docs or self._size >= self.max_bytes:
+            self.flush()
+
+    def delete(self, ids):
+        """
+        Send a <delete> document with the given ids, after the pending
+        <doc> elements.
+        """
+        if not ids:
+            return
+
+        self.flush()
+        self.sink.send('<delete>%s</delete>' % ''.join(
+            '<id>%s</id>' % escape(i) for i in ids))
+
+    def flush(self):
+
+        if not self._docs:
+            return
+
+        self.sink.send('<add>%s</add>' % ''.join(self._docs))
+
+        self.sent += len(self._docs)
+        self._docs = []
+        self._size = 0
+
+    def commit(self):
+        """
+        Send the pending documents and make them visible in the index.
+        """
+        self.flush()
+        self.sink.commit()
+
+    def close(self):
+        self.flush()
+        self.sink.close()
+
+
+_journal_cache = JournalMetaCache()
+
+
+def render(article):
+    """
+    Retrieve the serialized <doc> of the article, or None with the error
+    when it could not be rendered.
+    """
+    try:
+        doc = Export(article, journal_cache=_journal_cache).record_iahx()
+        return ET.tostring(doc, encoding='utf-8'), None
+    except Exception as e:
+        return None, (article.get('code', None), '%s: %s' % (e.__class__.__name__, e))
+
+
+def export(articles, writer, processes=1, chunksize=20, pool=None):
+    """
+    Render the given articles to the writer, in worker processes when
+    processes > 1 or a multiprocessing pool is given. Retrieve the errors
+    of the articles left out.
+    """
+    errors = []
+
+    own_pool = pool is None and processes > 1
+    if own_pool:
+        pool = multiprocessing.Pool(processes)
+
+    if pool is not None:
+        rendered = pool.imap(render, articles, chunksize)
+    else:
+        rendered = (render(i) for i in articles)
+
+    try:
+        for doc, error in rendered:
+            if error:
+                errors.append(error)
+                continue
+
+            writer.add(doc)
+    finally:
+        if own_pool:
+            pool.terminate()
+
+    return errors
+
+
+def _windows(start, end, days):
+    """
+    Consecutive date windows, as (from, until) ISO dates, covering the
+    period from start to end.
+    """
+    start = datetime.strptime(start, '%Y-%m-%d').date()
+    end = datetime.strptime(end, '%Y-%m-%d').date()
+
+    while True:
+        until = min(start + timedelta(days=days - 1), end)
+        yield start.isoformat(), until.isoformat()
+
+        if until >= end:
+            break
+
+        start = until + timedelta(days=1)
+
+
+def _first_processing_date(databroker, collection):
+    fltr = {'processing_date': {'$gt': ''}}
+    if collection:
+        fltr['collection'] = collection
+
+    for item in databroker.storage.find('articles', fltr, ['processing_date'],
+                                        sort=[('processing_date', 1)], limit=1):
+        return item['processing_date']
+
+    return None
+
+
+def reindex(databroker, writer, collection=None, window_days=30, processes=1,
+            name=WATERMARK):
+    """
+    Send to the index the articles processed since the watermark of the
+    collection, window by window, and the deletions recorded since the
+    last run. The watermark is saved after each committed window, so an
+    interrupted job resumes from the last complete one. The day of the
+    watermark is sent again, as more articles may have been processed in
+    that day after the previous run.
+    """
+    today = datetime.now().date().isoformat()
+    watermark = databroker.get_watermark(name, collection)
+    report = {'windows': 0, 'errors': [], 'deleted': 0}
+
+    start = watermark.get('processing_date', None)
+    if start is None:
+        start = _first_processing_date(databroker, collection) or today
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+
+    try:
+        for from_date, until_date in _windows(start, today, window_days):
+            report['errors'] += export(
+                databroker.articles(collection=collection,
+                                    from_date=from_date, until_date=until_date),
+                writer, pool=pool)
+            writer.commit()
+
+            databroker.set_watermark(name, collection, processing_date=until_date)
+            report['windows'] += 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    deleted_from = watermark.get('deleted_date', None) or '1500-01-01'
+    offset = 0
+    while True:
+        page = databroker.identifiers_deleted('article', collection=collection,
+                                              from_date=deleted_from,
+                                              until_date=today,
+                                              offset=offset)
+        writer.delete([document_id(i['code'], i['collection'])
+                       for i in page['objects']])
+        report['deleted'] += len(page['objects'])
+        offset += page['meta']['limit']
+
+        if offset >= page['meta']['total'] or not page['objects']:
+            break
+
+    writer.commit()
+    databroker.set_watermark(name, collection, deleted_date=today)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IAHX bulk indexing feed')
+    parser.add_argument('uri', help='storage URI, mongodb:// or sqlite://')
+    sink = parser.add_mutually_exclusive_group(required=True)
+    sink.add_argument('--output-dir', help='directory of the <add> files')
+    sink.add_argument('--solr-url', help='Solr update handler URL')
+    parser.add_argument('--collection', default=None)
+    parser.add_argument('--from', dest='from_date', default='1500-01-01')
+    parser.add_argument('--until', dest='until_date', default=None)
+    parser.add_argument('--max-docs', type=int, default=DEFAULT_MAX_DOCS)
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--incremental', action='store_true',
+                        help='send the changes since the last incremental run, '
+                             'per collection, ignoring --from and --until')
+    parser.add_argument('--window-days', type=int, default=30,
+                        help='days committed at a time by --incremental')
+    args = parser.parse_args()
+
+    if args.output_dir:
+        sink = FileSink(args.output_dir)
+    else:
+        sink = HTTPSink(args.solr_url)
+
+    databroker = DataBroker(storage.from_uri(args.uri))
+    writer = BulkWriter(sink, max_docs=args.max_docs, max_bytes=args.max_bytes)
+
+    if args.incremental:
+        collections = [args.collection]
+        if not args.collection:
+            collections = [i['acron'] for i in databroker.collection() or []]
+
+        for collection in collections:
+            report = reindex(databroker, writer, collection=collection,
+                             window_days=args.window_days,
+                             processes=args.processes)
+
+            for code, error in report['errors']:
+                print 'error: %s %s' % (code, error)
+
+            print '%s windows: %d errors: %d deleted: %d' % (
+                collection, report['windows'], len(report['errors']),
+                report['deleted'])
+
+        writer.close()
+        print 'documents: %d' % writer.sent
+        return
+
+    errors = export(databroker.articles(collection=args.collection,
+                                        from_date=args.from_date,
+                                        until_date=args.until_date),
+                    writer, processes=args.processes)
+    writer.close()
+
+    for code, error in errors:
+        print 'error: %s %s' % (code, error)
+
+    print 'documents: %d errors: %d' % (writer.sent, len(errors))
+
+
+if __name__ == '__main__':
+    main()
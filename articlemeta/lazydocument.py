@@ -0,0 +1,166 @@
+# coding: utf-8
+"""
+xylose documents that decode each field only once.
+
+The xylose properties and methods decode the raw ``vNNN`` fields again on
+every access, and ``Article.citations`` builds a new list of citations each
+time. The export pipes and the ingestion read many of them several times,
+the citation titles and authors up to six times each. The classes here
+keep the result of each property, and of each method for the same
+arguments, in the instance, so a field is decoded on its first access and
+never when no one asks for it, like the citations of the IAHX export.
+
+The citations are read through compact records, built once per article
+with only the fields the exports and the citation keys use.
+"""
+from functools import wraps
+
+from xylose.scielodocument import Article, Journal
+
+_MISSING = object()
+
+
+def _memo(obj):
+    try:
+        return obj.__dict__['_memo']
+    except KeyError:
+        return obj.__dict__.setdefault('_memo', {})
+
+
+def cached_property(func):
+    """
+    Property computed on its first access and kept in the instance.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def getter(self):
+        memo = _memo(self)
+        value = memo.get(name, _MISSING)
+
+        if value is _MISSING:
+            value = memo[name] = func(self)
+
+        return value
+
+    return property(getter)
+
+
+def cached_method(func):
+    """
+    Method computed once for each set of hashable arguments.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        memo = _memo(self)
+
+        try:
+            value = memo.get(key, _MISSING)
+        except TypeError:
+            return func(self, *args, **kwargs)
+
+        if value is _MISSING:
+            value = memo[key] = func(self, *args, **kwargs)
+
+        return value
+
+    return wrapper
+
+
+def memoized(cls):
+    """
+    Retrieve a subclass of the xylose class memoizing its public properties
+    and methods.
+    """
+    attrs = {'__doc__': cls.__doc__}
+
+    for name, value in vars(cls).items():
+        if name.startswith('_'):
+            continue
+
+        if isinstance(value, property) and value.fset is None:
+            attrs[name] = cached_property(value.fget)
+        elif callable(value):
+            attrs[name] = cached_method(value)
+
+    return type('Lazy' + cls.__name__, (cls,), attrs)
+
+
+LazyJournal = memoized(Journal)
+
+
+class AuthorRecord(object):
+    """
+    Author of a citation. Missing names are None.
+    """
+    __slots__ = ('surname', 'given_names')
+
+    def __init__(self, surname=None, given_names=None):
+        self.surname = surname
+        self.given_names = given_names
+
+    @classmethod
+    def from_dict(cls, author):
+        return cls(author.get('surname', None), author.get('given_names', None))
+
+
+def _authors(authors):
+    if authors:
+        return tuple(AuthorRecord.from_dict(i) for i in authors)
+
+
+class CitationRecord(object):
+    """
+    The fields of a citation used by the exports and by the citation keys,
+    decoded once. ``title`` is the first of the article, chapter, thesis,
+    conference and link titles given, ``data`` the raw citation.
+    """
+    __slots__ = ('data', 'index_number', 'publication_type', 'article_title',
+                 'title', 'source', 'date', 'start_page', 'end_page', 'issue',
+                 'volume', 'authors', 'monographic_authors')
+
+    def __init__(self, citation):
+        self.data = citation.data
+        self.index_number = citation.index_number
+        self.publication_type = citation.publication_type
+        self.article_title = citation.article_title
+        self.title = (self.article_title or citation.chapter_title or
+                      citation.thesis_title or citation.conference_title or
+                      citation.link_title)
+        self.source = citation.source
+        self.date = citation.date
+        self.start_page = citation.start_page
+        self.end_page = citation.end_page
+        self.issue = citation.issue
+        self.volume = citation.volume
+        self.authors = _authors(citation.authors)
+        self.monographic_authors = _authors(citation.monographic_authors)
+
+
+class LazyArticle(memoized(Article)):
+
+    @cached_property
+    def journal(self):
+
+        if 'title' not in self.data:
+            return super(LazyArticle, self).journal
+
+        return LazyJournal(self.data['title'], iso_format=self._iso_format)
+
+    @cached_property
+    def citation_records(self):
+        return [CitationRecord(i) for i in Article.citations.fget(self) or []]
+
+
+def citation_records(article):
+    """
+    Retrieve the records of the citations of the xylose article, kept by
+    LazyArticle once built.
+    """
+    if isinstance(article, LazyArticle):
+        return article.citation_records
+
+    return [CitationRecord(i) for i in article.citations or []]
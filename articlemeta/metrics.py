@@ -0,0 +1,208 @@
+# coding: utf-8
+import threading
+import time
+from functools import wraps
+
+import plumber
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry(object):
+    """
+    Keeps the latency histograms of the running process. Nothing is
+    recorded until ``enabled`` is set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            histogram = self._histograms.get(key, None)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def drain(self):
+        """
+        Retrieve and clear the histograms, as JSON serializable
+        ``[name, labels, counts, sum, count]`` lists, merged by ``merge``
+        into the registry of another process.
+        """
+        with self._lock:
+            items = self._histograms.items()
+            self._histograms = {}
+
+        return [[name, list(labels), histogram.counts, histogram.sum, histogram.count]
+                for (name, labels), histogram in items]
+
+    def merge(self, histograms):
+        """
+        Add the histograms retrieved by ``drain`` to this registry.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            for name, labels, counts, sum_, count in histograms:
+                key = (name, tuple(tuple(i) for i in labels))
+
+                histogram = self._histograms.get(key, None)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram()
+
+                histogram.counts = [i + j for i, j in zip(histogram.counts, counts)]
+                histogram.sum += sum_
+                histogram.count += count
+
+    def render(self):
+        """
+        Retrieve the histograms in the Prometheus text exposition format.
+        """
+        lines = []
+
+        with self._lock:
+            items = sorted(self._histograms.items())
+
+        current = None
+        for (name, labels), histogram in items:
+            if name != current:
+                lines.append('# TYPE %s histogram' % name)
+                current = name
+
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    name, format_labels(labels + (('le', repr(bound)),)), cumulative))
+
+            lines.append('%s_bucket%s %d' % (
+                name, format_labels(labels + (('le', '+Inf'),)), histogram.count))
+            lines.append('%s_sum%s %r' % (name, format_labels(labels), histogram.sum))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+
+class Timer(object):
+
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self._registry.observe(self._name, time.time() - self._start,
+                               **self._labels)
+
+
+def format_labels(labels):
+
+    if not labels:
+        return ''
+
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels)
+
+
+registry = MetricsRegistry()
+
+
+def timed(name):
+    """
+    Records the duration of every call of the decorated function, labeled
+    with the function name.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return func(*args, **kwargs)
+
+            with registry.timer(name, method=func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TimedPipe(plumber.Pipe):
+    """
+    Records the duration of the transformations of the wrapped pipe. With
+    export_processes > 0 the pipes run in the export workers, which send
+    their histograms back with each rendered article, see
+    ``executor.worker``.
+    """
+
+    def __init__(self, pipe, fmt):
+        self._pipe = pipe
+        self._labels = {'format': fmt, 'pipe': pipe.__class__.__name__}
+
+    def transform(self, data):
+        with registry.timer('articlemeta_pipe_seconds', **self._labels):
+            return self._pipe.transform(data)
+
+
+def instrument(fmt, *pipes):
+    """
+    Retrieve the given pipes, wrapped by TimedPipe when the metrics are
+    enabled.
+    """
+    if not registry.enabled:
+        return pipes
+
+    return [TimedPipe(pipe, fmt) for pipe in pipes]
+
+
+def metrics_tween_factory(handler, registry_):
+
+    def metrics_tween(request):
+        start = time.time()
+
+        try:
+            return handler(request)
+        finally:
+            route = request.matched_route.name if request.matched_route else 'notfound'
+            registry.observe('articlemeta_view_seconds', time.time() - start,
+                             route=route)
+
+    return metrics_tween
@@ -0,0 +1,106 @@
+# coding: utf-8
+import json
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def stdlib_dumps(data):
+    return json.dumps(data)
+
+
+def ujson_dumps(data):
+    """
+    Faster than the stdlib encoder, and the same output for the documents
+    made of the JSON types only, as the ones of the storage. Other types,
+    like datetimes, are silently encoded differently, as epoch integers or
+    empty objects, and floats are limited to 15 significant digits.
+    """
+    try:
+        return ujson.dumps(data, escape_forward_slashes=False, double_precision=15)
+    except (TypeError, OverflowError):
+        # ujson refuses some values that the stdlib encoder handles
+        return json.dumps(data)
+
+
+ENCODERS = {'json': stdlib_dumps}
+
+if ujson:
+    ENCODERS['ujson'] = ujson_dumps
+
+
+def get_encoder(name='json'):
+    """
+    Retrieve the dumps callable registered with the given name.
+    """
+    try:
+        return ENCODERS[name]
+    except KeyError:
+        raise ValueError('Unavailable JSON encoder: %s' % name)
+
+
+class Serializer(object):
+    """
+    Serializes the API results to JSON. Lists having more than
+    ``stream_threshold`` items, even when they are values of a dictionary
+    (ex: the objects of the identifiers listings), are encoded in slices of
+    ``batch_size`` items, so large results can be sent without building
+    the whole document in memory.
+    """
+
+    def __init__(self, encoder='json', stream_threshold=500, batch_size=100):
+        self._dumps = get_encoder(encoder)
+        self.stream_threshold = stream_threshold
+        self.batch_size = batch_size
+
+    def _is_large_list(self, data):
+        return isinstance(data, list) and len(data) > self.stream_threshold
+
+    def streamable(self, data):
+
+        if self._is_large_list(data):
+            return True
+
+        if isinstance(data, dict):
+            return any(self._is_large_list(i) for i in data.values())
+
+        return False
+
+    def dumps(self, data):
+        return self._dumps(data)
+
+    def _iterlist(self, data):
+
+        yield '['
+
+        for i in range(0, len(data), self.batch_size):
+            chunk = self._dumps(data[i:i + self.batch_size])[1:-1]
+            yield chunk if i == 0 else ', ' + chunk
+
+        yield ']'
+
+    def iterdumps(self, data):
+
+        if self._is_large_list(data):
+            for chunk in self._iterlist(data):
+                yield chunk
+            return
+
+        if not self.streamable(data):
+            yield self._dumps(data)
+            return
+
+        yield '{'
+
+        for i, (key, value) in enumerate(data.items()):
+            yield '%s%s: ' % (', ' if i else '', self._dumps(key))
+
+            if self._is_large_list(value):
+                for chunk in self._iterlist(value):
+                    yield chunk
+            else:
+                yield self._dumps(value)
+
+        yield '}'
@@ -0,0 +1,388 @@
+# coding: utf-8
+"""
+Binary snapshots of the articles and journals of the ArticleMeta storage.
+
+A snapshot is a sequence of length-prefixed records, each one a zlib
+compressed JSON document, followed by a trailer with the position of the
+articles in the file:
+
+    magic | record* | index entry* | index offset | magic
+
+    record: kind (1 byte) | size (4 bytes) | zlib(json(document))
+    index entry: md5(collection NUL code) (16 bytes) | record offset (8 bytes)
+
+The index entries are sorted by key and searched in place in the memory
+map, so the processes serving a snapshot share its pages through the page
+cache instead of each one loading the index.
+
+Restoring a snapshot skips the article processing done by the DataBroker,
+the documents are written as they were dumped.
+
+    python -m articlemeta.snapshot dump mongodb://localhost:27017/scielo_network scl.amsnap --collection scl
+    python -m articlemeta.snapshot load scl.amsnap sqlite:///var/lib/articlemeta.db
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import storage
+
+MAGIC = 'AMSNAP02'
+RECORD_HEADER = struct.Struct('>cI')
+INDEX_ENTRY = struct.Struct('>16sQ')
+TRAILER = struct.Struct('>Q8s')
+
+KINDS = {
+    'journals': 'j',
+    'articles': 'a'
+}
+NAMES = dict((v, k) for k, v in KINDS.items())
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def index_key(collection, code):
+    return hashlib.md5(('%s\0%s' % (collection, code)).encode('utf-8')).digest()
+
+
+class SnapshotWriter(object):
+
+    def __init__(self, fileobj, level=6):
+        self._file = fileobj
+        self._level = level
+        self._offset = 0
+        self._index = []
+        self.counts = dict((name, 0) for name in KINDS)
+
+        self._write(MAGIC)
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def write(self, name, document):
+        data = zlib.compress(json.dumps(document), self._level)
+
+        if name == 'articles':
+            self._index.append(
+                (index_key(document.get('collection', None), document.get('code', None)),
+                 self._offset))
+
+        self._write(RECORD_HEADER.pack(KINDS[name], len(data)))
+        self._write(data)
+        self.counts[name] += 1
+
+    def close(self):
+        index_offset = self._offset
+        self._index.sort()
+        for key, offset in self._index:
+            self._write(INDEX_ENTRY.pack(key, offset))
+        self._write(TRAILER.pack(index_offset, MAGIC))
+        self._file.flush()
+
+
+class SnapshotReader(object):
+    """
+    Read-only access to a snapshot file through a memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, mmap.error):
+            self._file.close()
+            raise SnapshotError('Invalid snapshot: %s' % path)
+
+        size = len(self._map)
+
+        if size < len(MAGIC) + TRAILER.size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise SnapshotError('Invalid snapshot: %s' % path)
+
+        self._index_offset, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        index_size = size - TRAILER.size - self._index_offset
+
+        if magic != MAGIC or index_size < 0 or index_size % INDEX_ENTRY.size:
+            self.close()
+            raise SnapshotError('Truncated snapshot: %s' % path)
+
+        self._entries = index_size // INDEX_ENTRY.size
+
+    def _key(self, entry):
+        start = self._index_offset + entry * INDEX_ENTRY.size
+
+        return self._map[start:start + 16]
+
+    def offsets(self, code, collection):
+        """
+        Offsets of the records indexed with the key of the article, found
+        by a binary search of the index in the memory map.
+        """
+        key = index_key(collection, code)
+        low, high = 0, self._entries
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        while low < self._entries and self._key(low) == key:
+            yield INDEX_ENTRY.unpack_from(
+                self._map, self._index_offset + low * INDEX_ENTRY.size)[1]
+            low += 1
+
+    def read(self, offset):
+        """
+        Retrieve the (name, document) pair of the record at the given offset
+        and the offset of the next record.
+        """
+        kind, size = RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + RECORD_HEADER.size
+        document = json.loads(zlib.decompress(self._map[start:start + size]))
+
+        return (NAMES[kind], document), start + size
+
+    def get_article(self, code, collection):
+
+        for offset in self.offsets(code, collection):
+            (name, document), next_offset = self.read(offset)
+
+            if document.get('code', None) == code and document.get('collection', None) == collection:
+                return document
+
+        return None
+
+    def __iter__(self):
+        offset = len(MAGIC)
+
+        while offset < self._index_offset:
+            record, offset = self.read(offset)
+            yield record
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+class SnapshotArticleStore(object):
+    """
+    Serves articles from a snapshot file, reopening it when the file is
+    replaced. Snapshots must be published by renaming a complete file over
+    the previous one, as done by ``dump``, so readers never see a partial
+    file. Articles removed from the storage after the snapshot was taken
+    are still served until the next snapshot is published.
+
+    A replaced reader is closed as soon as no request is using it.
+    """
+
+    def __init__(self, path, check_interval=5):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._reader = None
+        self._stat = None
+        self._checked = 0
+        self._users = {}
+
+    def _swap(self):
+        """
+        Open the snapshot file again when it was replaced. Called with the
+        lock held.
+        """
+        try:
+            st = os.stat(self.path)
+            stat = (st.st_ino, st.st_mtime, st.st_size)
+        except OSError:
+            stat = None
+
+        if stat == self._stat:
+            return
+
+        reader = None
+        if stat:
+            try:
+                reader = SnapshotReader(self.path)
+            except (IOError, SnapshotError):
+                stat = None
+
+        previous = self._reader
+        self._reader = reader
+        self._stat = stat
+
+        if previous is not None and previous not in self._users:
+            previous.close()
+
+    def _acquire(self):
+        now = time.time()
+
+        with self._lock:
+            if now - self._checked >= self.check_interval:
+                self._checked = now
+                self._swap()
+
+            reader = self._reader
+            if reader is not None:
+                self._users[reader] = self._users.get(reader, 0) + 1
+
+        return reader
+
+    def _release(self, reader):
+
+        with self._lock:
+            self._users[reader] -= 1
+
+            if not self._users[reader]:
+                del self._users[reader]
+
+                if reader is not self._reader:
+                    reader.close()
+
+    def close(self):
+
+        with self._lock:
+            reader, self._reader, self._stat = self._reader, None, None
+
+            if reader is not None and reader not in self._users:
+                reader.close()
+
+    def get_article(self, code, collection=None):
+        """
+        Retrieve the article from the snapshot, None when there is no
+        snapshot, it does not have the article or no collection is given.
+        """
+        if not collection:
+            return None
+
+        reader = self._acquire()
+
+        if reader is None:
+            return None
+
+        try:
+            return reader.get_article(code, collection)
+        finally:
+            self._release(reader)
+
+
+def dump(strg, path, collection=None):
+    """
+    Write the journals and articles of the given collection, or of all the
+    collections, to a snapshot file. Retrieve the number of records of
+    each kind.
+
+    The snapshot is written to a temporary file renamed to the given path
+    at the end, replacing any previous snapshot atomically.
+    """
+    fltr = {}
+    if collection:
+        fltr['collection'] = collection
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            writer = SnapshotWriter(f)
+
+            for name in ('journals', 'articles'):
+                for document in strg.find(name, fltr):
+                    writer.write(name, document)
+
+            writer.close()
+            os.fsync(f.fileno())
+
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return writer.counts
+
+
+def load(strg, path, batch_size=1000, replace=False):
+    """
+    Insert the records of a snapshot file in the given storage, in batches.
+    The indexes are only built after all the records are written. Retrieve
+    the number of records of each kind.
+
+    The records are inserted as they are, so a storage that already has
+    journals or articles raises SnapshotError, unless replace is given to
+    remove them first.
+    """
+    for name in KINDS:
+        if strg.find_one(name, {}) is None:
+            continue
+
+        if not replace:
+            raise SnapshotError('The storage already has %s, use replace' % name)
+
+        strg.remove(name, {})
+
+    reader = SnapshotReader(path)
+    counts = dict((name, 0) for name in KINDS)
+    batches = dict((name, []) for name in KINDS)
+
+    try:
+        for name, document in reader:
+            batches[name].append(document)
+            counts[name] += 1
+
+            if len(batches[name]) >= batch_size:
+                strg.insert(name, batches[name])
+                batches[name] = []
+    finally:
+        reader.close()
+
+    for name, documents in batches.items():
+        if documents:
+            strg.insert(name, documents)
+
+    strg.ensure_indexes()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ArticleMeta binary snapshots')
+    subparsers = parser.add_subparsers(dest='command')
+
+    dump_parser = subparsers.add_parser('dump', help='write a snapshot file')
+    dump_parser.add_argument('uri', help='storage URI, mongodb:// or sqlite://')
+    dump_parser.add_argument('path', help='snapshot file')
+    dump_parser.add_argument('--collection', default=None,
+                             help='collection acronym, all the collections by default')
+
+    load_parser = subparsers.add_parser('load', help='restore a snapshot file')
+    load_parser.add_argument('path', help='snapshot file')
+    load_parser.add_argument('uri', help='storage URI, mongodb:// or sqlite://')
+    load_parser.add_argument('--batch-size', type=int, default=1000)
+    load_parser.add_argument('--replace', action='store_true',
+                             help='remove the journals and articles of the storage first')
+
+    args = parser.parse_args()
+
+    if args.command == 'dump':
+        counts = dump(storage.from_uri(args.uri), args.path,
+                      collection=args.collection)
+    else:
+        counts = load(storage.from_uri(args.uri, indexes=False), args.path,
+                      batch_size=args.batch_size, replace=args.replace)
+
+    print 'journals: %d articles: %d' % (counts['journals'], counts['articles'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,617 @@
+# coding: utf-8
+import json
+import sqlite3
+import threading
+import time
+import urlparse
+
+import pymongo
+
+import metrics
+
+INDEXES = {
+    'articles': [
+        [('code', 1), ('collection', 1)],
+        [('processing_date', -1)],
+        [('collection', 1), ('processing_date', -1)],
+        [('document_type', 1), ('collection', 1), ('processing_date', -1)],
+        [('sent_doaj', 1), ('collection', 1), ('processing_date', 1)]
+    ],
+    'journals': [
+        [('code', 1), ('collection', 1)],
+        [('processing_date', 1), ('collection', 1), ('issn', 1)]
+    ],
+    'tombstones': [
+        [('kind', 1), ('code', 1), ('collection', 1)],
+        [('kind', 1), ('collection', 1), ('deleted_date', 1)],
+        [('deleted_date', 1)]
+    ],
+    'events': [
+        [('seq', 1)]
+    ]
+}
+
+# Scalar fields of each collection stored in their own columns by
+# SQLiteStorage, so they can be indexed and queried by SQL.
+SQLITE_COLUMNS = {
+    'articles': ('code', 'collection', 'processing_date', 'document_type',
+                 'sent_doaj'),
+    'journals': ('collection', 'processing_date', 'issn'),
+    'tombstones': ('kind', 'code', 'collection', 'deleted_date'),
+    'events': ('seq',)
+}
+
+SQL_OPERATORS = {
+    '$gt': '>',
+    '$gte': '>=',
+    '$lt': '<',
+    '$lte': '<='
+}
+
+
+def _compare(value, operator, expected):
+
+    if operator == '$in':
+        return value in expected
+
+    if operator == '$nin':
+        return value not in expected
+
+    if operator == '$ne':
+        return value != expected
+
+    if operator == '$exists':
+        return (value is not None) == expected
+
+    if value is None:
+        return False
+
+    if operator == '$gt':
+        return value > expected
+
+    if operator == '$gte':
+        return value >= expected
+
+    if operator == '$lt':
+        return value < expected
+
+    if operator == '$lte':
+        return value <= expected
+
+    raise ValueError('Unsupported operator: %s' % operator)
+
+
+def _match_value(value, condition):
+
+    if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+        if isinstance(value, list) and not any(k in ('$ne', '$nin', '$exists') for k in condition):
+            return any(_match_value(i, condition) for i in value)
+
+        return all(_compare(value, k, v) for k, v in condition.items())
+
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+
+    return value == condition
+
+
+def match(document, fltr):
+    """
+    Checks the given document against a filter written with the subset of
+    the MongoDB query language used by the DataBroker.
+    """
+    for key, condition in (fltr or {}).items():
+        if key == '$or':
+            if not any(match(document, i) for i in condition):
+                return False
+            continue
+
+        if key == '$and':
+            if not all(match(document, i) for i in condition):
+                return False
+            continue
+
+        if not _match_value(document.get(key, None), condition):
+            return False
+
+    return True
+
+
+class Storage(object):
+    """
+    Interface of the document stores used by the DataBroker. Filters are
+    written with the subset of the MongoDB query language understood by
+    ``match``; documents are retrieved without the ``_id`` key.
+    """
+
+    def find(self, name, fltr, fields=None, sort=None, skip=0, limit=0,
+             hint=None):
+        raise NotImplementedError()
+
+    def find_one(self, name, fltr, fields=None):
+        raise NotImplementedError()
+
+    def count(self, name, fltr, hint=None):
+        raise NotImplementedError()
+
+    def insert(self, name, documents):
+        raise NotImplementedError()
+
+    def upsert(self, name, key, document):
+        """
+        Sets the fields of the given document in the record identified by
+        key, creating it when it does not exist.
+        """
+        raise NotImplementedError()
+
+    def update(self, name, fltr, values, multi=False):
+        """
+        Sets the given values in the records matching the filter and
+        retrieve the number of matched records.
+        """
+        raise NotImplementedError()
+
+    def remove(self, name, fltr):
+        """
+        Remove the records matching the filter and retrieve their number.
+        """
+        raise NotImplementedError()
+
+    def next_sequence(self, name):
+        """
+        Atomically increment and retrieve the counter of the given name.
+        """
+        raise NotImplementedError()
+
+    def ensure_indexes(self):
+        raise NotImplementedError()
+
+
+class MongoStorage(Storage):
+
+    def __init__(self, db):
+        self.db = db
+
+    def _fields(self, fields):
+        spec = dict((i, 1) for i in fields or [])
+        spec['_id'] = 0
+
+        return spec
+
+    def find(self, name, fltr, fields=None, sort=None, skip=0, limit=0,
+             hint=None):
+
+        data = self.db[name].find(fltr, self._fields(fields))
+
+        if hint:
+            data = data.hint(hint)
+
+        if sort:
+            data = data.sort(sort)
+
+        if skip:
+            data = data.skip(skip)
+
+        if limit:
+            data = data.limit(limit)
+
+        return data
+
+    def find_one(self, name, fltr, fields=None):
+
+        if fields:
+            data = self.db[name].find_one(fltr, self._fields(fields))
+        else:
+            data = self.db[name].find_one(fltr)
+
+        if data:
+            data.pop('_id', None)
+
+        return data
+
+    def count(self, name, fltr, hint=None):
+
+        data = self.db[name].find(fltr)
+
+        if hint:
+            data = data.hint(hint)
+
+        return data.count()
+
+    def insert(self, name, documents):
+        self.db[name].insert(documents)
+
+    def upsert(self, name, key, document):
+        self.db[name].update(key, {'$set': document}, safe=False, upsert=True)
+
+    def update(self, name, fltr, values, multi=False):
+        result = self.db[name].update(fltr, {'$set': values}, multi=multi, w=1)
+
+        return result['n']
+
+    def remove(self, name, fltr):
+        result = self.db[name].remove(fltr, w=1)
+
+        return result['n']
+
+    def next_sequence(self, name):
+        counter = self.db['counters'].find_and_modify(
+            {'_id': name}, {'$inc': {'seq': 1}}, upsert=True, new=True)
+
+        return counter['seq']
+
+    def ensure_indexes(self):
+        """
+        Create the missing indexes in the background, so existing
+        collections stay available while they are built.
+        """
+        for name, indexes in INDEXES.items():
+            for index in indexes:
+                self.db[name].ensure_index(index, background=True)
+
+
+class SQLiteStorage(Storage):
+    """
+    Embedded store keeping the documents as JSON in a SQLite database.
+
+    The fields listed in SQLITE_COLUMNS are copied to indexed columns, and
+    the filter conditions on them are run by SQLite. Any other condition
+    is checked in Python over the records selected by the SQL query.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._tables = set()
+
+    def _table(self, name):
+
+        if name not in self._tables:
+            columns = ''.join(', "%s"' % i for i in SQLITE_COLUMNS.get(name, ()))
+            with self._lock:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS "%s" '
+                    '(id INTEGER PRIMARY KEY, document TEXT%s)' % (name, columns))
+            self._tables.add(name)
+
+        return name
+
+    def _where(self, name, fltr):
+        """
+        Translate the filter conditions on the indexed columns to SQL.
+        Retrieve the SQL clause, its parameters and the remaining filter.
+        """
+        columns = SQLITE_COLUMNS.get(name, ())
+        clauses = []
+        params = []
+        residual = {}
+
+        for key, condition in (fltr or {}).items():
+
+            if key not in columns:
+                residual[key] = condition
+                continue
+
+            if condition is None:
+                clauses.append('"%s" IS NULL' % key)
+                continue
+
+            if not isinstance(condition, (dict, list)):
+                clauses.append('"%s" = ?' % key)
+                params.append(condition)
+                continue
+
+            if isinstance(condition, dict) and set(condition) <= set(SQL_OPERATORS) | set(['$in']):
+                for operator, value in condition.items():
+                    if operator == '$in':
+                        clauses.append('"%s" IN (%s)' % (key, ', '.join('?' * len(value)) or 'NULL'))
+                        params.extend(value)
+                    else:
+                        clauses.append('"%s" %s ?' % (key, SQL_OPERATORS[operator]))
+                        params.append(value)
+                continue
+
+            residual[key] = condition
+
+        where = ' WHERE ' + ' AND '.join(clauses) if clauses else ''
+
+        return where, params, residual
+
+    def _rows(self, name, fltr, sort=None, skip=0, limit=0, fields=None):
+        """
+        Retrieve the (id, document) pairs matching the filter. When all the
+        given fields are columns, the documents are built from the columns,
+        without decoding the stored JSON.
+        """
+        columns = SQLITE_COLUMNS.get(name, ())
+        where, params, residual = self._where(self._table(name), fltr)
+
+        from_columns = fields and not residual and all(i in columns for i in fields)
+
+        if from_columns:
+            selected = ', '.join('"%s"' % i for i in fields)
+        else:
+            selected = 'document'
+
+        query = 'SELECT id, %s FROM "%s"%s' % (selected, name, where)
+
+        sql_sort = sort and all(field in columns for field, direction in sort)
+        if sql_sort:
+            query += ' ORDER BY ' + ', '.join(
+                '"%s" %s' % (field, 'DESC' if direction < 0 else 'ASC')
+                for field, direction in sort)
+
+        if not residual and (sql_sort or not sort):
+            if limit or skip:
+                query += ' LIMIT %d OFFSET %d' % (limit or -1, skip)
+            skip = limit = 0
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        if from_columns:
+            rows = [(i[0], dict((k, v) for k, v in zip(fields, i[1:]) if v is not None))
+                    for i in rows]
+        else:
+            rows = [(i, json.loads(d)) for i, d in rows]
+            rows = [(i, d) for i, d in rows if match(d, residual)]
+
+        if sort and not sql_sort:
+            for field, direction in reversed(sort):
+                rows.sort(key=lambda i: i[1].get(field, None),
+                          reverse=direction < 0)
+
+        end = skip + limit if limit else None
+
+        return rows[skip:end]
+
+    def _project(self, document, fields):
+
+        if not fields:
+            return document
+
+        return dict((k, document[k]) for k in fields if k in document)
+
+    def _columns(self, name, document):
+        return [document.get(i, None) for i in SQLITE_COLUMNS.get(name, ())]
+
+    def find(self, name, fltr, fields=None, sort=None, skip=0, limit=0,
+             hint=None):
+        return [self._project(d, fields)
+                for i, d in self._rows(name, fltr, sort, skip, limit, fields)]
+
+    def find_one(self, name, fltr, fields=None):
+
+        for document in self.find(name, fltr, fields, limit=1):
+            return document
+
+        return None
+
+    def count(self, name, fltr, hint=None):
+        where, params, residual = self._where(self._table(name), fltr)
+
+        if residual:
+            return len(self._rows(name, fltr))
+
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM "%s"%s' % (name, where), params).fetchone()[0]
+
+    def insert(self, name, documents):
+
+        if isinstance(documents, dict):
+            documents = [documents]
+
+        columns = SQLITE_COLUMNS.get(name, ())
+        query = 'INSERT INTO "%s" (document%s) VALUES (?%s)' % (
+            self._table(name),
+            ''.join(', "%s"' % i for i in columns),
+            ', ?' * len(columns))
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    query,
+                    ([json.dumps(i)] + self._columns(name, i) for i in documents))
+
+    def _save(self, name, rowid, document):
+        columns = SQLITE_COLUMNS.get(name, ())
+        query = 'UPDATE "%s" SET document = ?%s WHERE id = ?' % (
+            name, ''.join(', "%s" = ?' % i for i in columns))
+
+        self._conn.execute(
+            query, [json.dumps(document)] + self._columns(name, document) + [rowid])
+
+    def upsert(self, name, key, document):
+
+        with self._lock:
+            rows = self._rows(name, key, limit=1)
+
+            if not rows:
+                new = dict(key)
+                new.update(document)
+                self.insert(name, new)
+                return
+
+            rowid, current = rows[0]
+            current.update(document)
+
+            with self._conn:
+                self._save(name, rowid, current)
+
+    def update(self, name, fltr, values, multi=False):
+
+        with self._lock:
+            rows = self._rows(name, fltr, limit=0 if multi else 1)
+
+            with self._conn:
+                for rowid, document in rows:
+                    document.update(values)
+                    self._save(name, rowid, document)
+
+        return len(rows)
+
+    def remove(self, name, fltr):
+        where, params, residual = self._where(self._table(name), fltr)
+
+        with self._lock:
+            with self._conn:
+                if not residual:
+                    return self._conn.execute(
+                        'DELETE FROM "%s"%s' % (name, where), params).rowcount
+
+                rows = self._rows(name, fltr)
+                for rowid, document in rows:
+                    self._conn.execute(
+                        'DELETE FROM "%s" WHERE id = ?' % name, [rowid])
+
+        return len(rows)
+
+    def next_sequence(self, name):
+
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS counters '
+                    '(name TEXT PRIMARY KEY, seq INTEGER)')
+                self._conn.execute(
+                    'INSERT OR IGNORE INTO counters (name, seq) VALUES (?, 0)', [name])
+                self._conn.execute(
+                    'UPDATE counters SET seq = seq + 1 WHERE name = ?', [name])
+
+                return self._conn.execute(
+                    'SELECT seq FROM counters WHERE name = ?', [name]).fetchone()[0]
+
+    def ensure_indexes(self):
+        for name, indexes in INDEXES.items():
+            columns = SQLITE_COLUMNS.get(name, ())
+            self._table(name)
+
+            for index in indexes:
+                fields = [i for i, direction in index if i in columns]
+                if not fields:
+                    continue
+
+                with self._lock:
+                    self._conn.execute(
+                        'CREATE INDEX IF NOT EXISTS "%s_%s" ON "%s" (%s)' % (
+                            name, '_'.join(fields), name,
+                            ', '.join('"%s"' % i for i in fields)))
+
+
+class TimedStorage(Storage):
+    """
+    Records the duration of each call to the wrapped storage, labeled with
+    the operation and the collection, so the counts give the storage
+    calls. Results of ``find`` are timed while they are iterated, excluding
+    the time spent by the caller between documents.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def _timer(self, method, name):
+        return metrics.registry.timer('articlemeta_storage_seconds',
+                                      method=method, collection=name)
+
+    def _iterate(self, name, data, elapsed):
+
+        try:
+            data = iter(data)
+            while True:
+                start = time.time()
+                try:
+                    document = next(data)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.time() - start
+
+                yield document
+        finally:
+            metrics.registry.observe('articlemeta_storage_seconds', elapsed,
+                                     method='find', collection=name)
+
+    def find(self, name, fltr, fields=None, sort=None, skip=0, limit=0,
+             hint=None):
+        start = time.time()
+        data = self.storage.find(name, fltr, fields, sort=sort, skip=skip,
+                                 limit=limit, hint=hint)
+
+        return self._iterate(name, data, time.time() - start)
+
+    def find_one(self, name, fltr, fields=None):
+        with self._timer('find_one', name):
+            return self.storage.find_one(name, fltr, fields)
+
+    def count(self, name, fltr, hint=None):
+        with self._timer('count', name):
+            return self.storage.count(name, fltr, hint=hint)
+
+    def insert(self, name, documents):
+        with self._timer('insert', name):
+            return self.storage.insert(name, documents)
+
+    def upsert(self, name, key, document):
+        with self._timer('upsert', name):
+            return self.storage.upsert(name, key, document)
+
+    def update(self, name, fltr, values, multi=False):
+        with self._timer('update', name):
+            return self.storage.update(name, fltr, values, multi=multi)
+
+    def remove(self, name, fltr):
+        with self._timer('remove', name):
+            return self.storage.remove(name, fltr)
+
+    def next_sequence(self, name):
+        with self._timer('next_sequence', name):
+            return self.storage.next_sequence(name)
+
+    def ensure_indexes(self):
+        return self.storage.ensure_indexes()
+
+
+def _greenlets():
+    """
+    Tells if the sockets were monkey patched by gevent, as done by
+    gevent_server, so pymongo must keep its sockets per greenlet.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+
+    return monkey.is_module_patched('socket')
+
+
+def from_uri(uri, indexes=True):
+    """
+    Retrieve the storage for the given URI:
+    mongodb://localhost:27017/scielo_network or sqlite:///var/lib/articlemeta.db
+
+    The missing indexes of INDEXES are created, in the background on
+    MongoDB. indexes=False skips them, for bulk loads that call
+    ensure_indexes when done.
+    """
+    url = urlparse.urlparse(uri)
+
+    if url.scheme == 'sqlite':
+        storage = SQLiteStorage(url.netloc + url.path)
+        if indexes:
+            storage.ensure_indexes()
+        return storage
+
+    conn = pymongo.Connection(host=url.hostname, port=url.port,
+                              use_greenlets=_greenlets())
+    db = conn[url.path[1:]]
+
+    if url.username and url.password:
+        db.authenticate(url.username, url.password)
+
+    storage = MongoStorage(db)
+    if indexes:
+        storage.ensure_indexes()
+
+    return storage
@@ -5,6 +5,16 @@ import weakref
 from ConfigParser import SafeConfigParser
 
 
+def create_file(path, data):
+    """
+    Write the data to a new file, raising OSError when it exists.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0644)
+
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+
+
 class SingletonMixin(object):
     """
     Adds a singleton behaviour to an existing class.
@@ -0,0 +1,179 @@
+# coding: utf-8
+"""
+Validation of the XML exports against their schemas.
+
+The schemas are compiled once per process and kept for its whole life, the
+SciELO PS one, which includes the MathML 2 schemas, taking seconds to
+compile. They are read from the xsd directory of the package unless
+another one is given to ``configure``, with the same layout.
+
+    python -m articlemeta.validation mongodb://localhost:27017/scielo_network --format sci --format rsps --collection scl
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+from lxml import etree
+
+import storage
+from controller import DataBroker
+from export import Export, JournalMetaCache
+
+XSD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'xsd')
+
+# paths relative to the schemas directory
+SCHEMAS = {
+    'sci': os.path.join('scielo_sci', 'ThomsonReuters_publishing.xsd'),
+    'rsps': os.path.join('scielo_rsps', 'SciELO-journalpublishing1.xsd'),
+    'doaj': os.path.join('scielo_doaj', 'doajArticles.xsd')
+}
+
+_xsd_dir = XSD_DIR
+_schemas = {}
+
+
+def configure(xsd_dir=None):
+    """
+    Read the schemas from xsd_dir, the directory of the package when None.
+    """
+    global _xsd_dir
+
+    _xsd_dir = xsd_dir or XSD_DIR
+    _schemas.clear()
+
+
+def schema(path):
+    """
+    Retrieve the XMLSchema of the given file, parsed only once. Relative
+    paths are taken from the schemas directory.
+    """
+    path = os.path.join(_xsd_dir, path)
+
+    if path not in _schemas:
+        _schemas[path] = etree.XMLSchema(etree.parse(path))
+
+    return _schemas[path]
+
+
+def preload(fmts=None):
+    """
+    Compile the schemas of the given export formats, all of them by default.
+    """
+    for fmt in fmts or SCHEMAS:
+        schema(SCHEMAS[fmt])
+
+
+def validate(fmt, data):
+    """
+    Retrieve the schema errors of the XML data rendered in the given export
+    format, an empty list when it is valid. Formats without a schema raise
+    ValueError.
+    """
+    if fmt not in SCHEMAS:
+        raise ValueError('no schema for the format %s' % fmt)
+
+    xsd_schema = schema(SCHEMAS[fmt])
+
+    try:
+        xml = etree.fromstring(data)
+    except etree.XMLSyntaxError as e:
+        return [str(e)]
+
+    if xsd_schema.validate(xml):
+        return []
+
+    return [str(e) for e in xsd_schema.error_log]
+
+
+_journal_cache = JournalMetaCache()
+
+
+def validate_article(args):
+    """
+    Render the article in the given formats and retrieve its report, with
+    the errors of each invalid format.
+    """
+    article, fmts = args
+
+    report = {'code': article.get('code', None),
+              'collection': article.get('collection', None),
+              'errors': {}}
+
+    for fmt in fmts:
+        try:
+            data = getattr(Export(article, journal_cache=_journal_cache),
+                           'pipeline_%s' % fmt)()
+            errors = validate(fmt, data)
+        except Exception as e:
+            errors = ['%s: %s' % (e.__class__.__name__, e)]
+
+        if errors:
+            report['errors'][fmt] = errors
+
+    return report
+
+
+def validate_articles(articles, fmts, processes=1, chunksize=20):
+    """
+    Generator of the reports of the given articles, validated in worker
+    processes when processes > 1. The schemas are compiled before the
+    workers are forked, so they inherit them.
+    """
+    preload(fmts)
+
+    tasks = ((article, fmts) for article in articles)
+
+    if processes <= 1:
+        for task in tasks:
+            yield validate_article(task)
+        return
+
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        for report in pool.imap(validate_article, tasks, chunksize):
+            yield report
+    finally:
+        pool.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export schema validation')
+    parser.add_argument('uri', help='storage URI, mongodb:// or sqlite://')
+    parser.add_argument('--format', dest='fmts', action='append',
+                        choices=sorted(SCHEMAS),
+                        help='format to validate, may be repeated, all by default')
+    parser.add_argument('--collection', default=None)
+    parser.add_argument('--from', dest='from_date', default='1500-01-01')
+    parser.add_argument('--until', dest='until_date', default=None)
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--all', action='store_true',
+                        help='report the valid articles too')
+    parser.add_argument('--xsd-dir', default=None,
+                        help='directory of the schemas, the one of the package by default')
+    args = parser.parse_args()
+
+    configure(args.xsd_dir)
+
+    articles = DataBroker(storage.from_uri(args.uri)).articles(
+        collection=args.collection,
+        from_date=args.from_date,
+        until_date=args.until_date)
+
+    total = invalid = 0
+    for report in validate_articles(articles, args.fmts or sorted(SCHEMAS),
+                                    processes=args.processes):
+        total += 1
+        if report['errors']:
+            invalid += 1
+
+        if report['errors'] or args.all:
+            print json.dumps(report)
+
+    sys.stderr.write('articles: %d invalid: %d\n' % (total, invalid))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# coding: utf-8
+"""
+Memory held by the citation records of an article with 1000 citations,
+against the same fields kept in dicts, and peak memory of building its
+citation keys and reference list, each measured in its own process.
+
+    python -m benchmarks.bench_citation_memory
+"""
+import multiprocessing
+import resource
+import sys
+import xml.etree.ElementTree as ET
+
+from articlemeta import controller
+from articlemeta import export_citations
+from articlemeta import lazydocument
+
+import common
+import corpus
+
+CITATIONS = 1000
+
+
+def deep_size(obj, seen=None):
+    """
+    Size in bytes of the object and of everything it refers to, but for
+    the raw citations.
+    """
+    seen = set() if seen is None else seen
+
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(i, seen) for i in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_size(getattr(obj, i), seen)
+                    for i in obj.__slots__ if i != 'data')
+
+    return size
+
+
+def as_dict(record):
+    fields = dict((i, getattr(record, i)) for i in record.__slots__ if i != 'data')
+
+    for i in ('authors', 'monographic_authors'):
+        if fields[i]:
+            fields[i] = [{'surname': a.surname, 'given_names': a.given_names}
+                         for a in fields[i]]
+
+    return fields
+
+
+def article():
+    return lazydocument.LazyArticle(
+        corpus.synthetic_article(common.load_fixture(), 0, citations=CITATIONS))
+
+
+def keys_and_ref_list():
+    xylose_article = article()
+
+    controller.gen_citations_title_keys(xylose_article)
+    export_citations.ref_list(ET.Element('back'),
+                              lazydocument.citation_records(xylose_article))
+
+
+def _peak(func, queue):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    func()
+    queue.put((before, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def peak_rss(func):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_peak, args=(func, queue))
+    process.start()
+    before, after = queue.get()
+    process.join()
+
+    return before, after
+
+
+def main():
+    records = lazydocument.citation_records(article())
+
+    records_size = deep_size(records)
+    dicts_size = deep_size([as_dict(i) for i in records])
+
+    print '%d citations' % CITATIONS
+    print 'records  %10d bytes  %6d bytes/citation' % (records_size, records_size // CITATIONS)
+    print 'dicts    %10d bytes  %6d bytes/citation' % (dicts_size, dicts_size // CITATIONS)
+
+    before, after = peak_rss(keys_and_ref_list)
+    print 'keys and ref-list peak RSS %d KB (%d KB before)' % (after, before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# coding: utf-8
+"""
+Reference list of an article with 10, 100, 1000 and 5000 citations, built
+by the XMLCitation pipeline and by export_citations, serially and across
+a pool of processes.
+
+    python -m benchmarks.bench_citations
+"""
+import multiprocessing
+import xml.etree.ElementTree as ET
+
+from xylose.scielodocument import Article
+
+from articlemeta import export_citations
+from articlemeta import export_sci
+from articlemeta import lazydocument
+
+import common
+import corpus
+
+SIZES = [10, 100, 1000, 5000]
+
+
+def pipeline_ref_list(citations):
+    reflist = ET.Element('ref-list')
+
+    cit = export_sci.XMLCitation()
+    for citation in citations:
+        reflist.append(cit.deploy(citation)[1])
+
+    return reflist
+
+
+def main():
+    base = common.load_fixture()
+    rows = []
+
+    for size in SIZES:
+        article = Article(corpus.synthetic_article(base, 0, citations=size))
+        citations = article.citations
+        records = lazydocument.citation_records(article)
+        number = max(1, 1000 // size)
+
+        rows.append(('pipeline %d citations' % size,
+                     common.best_of(lambda: pipeline_ref_list(citations), number=number)))
+        rows.append(('export_citations %d citations' % size,
+                     common.best_of(lambda: export_citations.ref_list(ET.Element('back'), records),
+                                    number=number)))
+
+        export_citations.configure(threshold=1, processes=multiprocessing.cpu_count())
+        rows.append(('export_citations parallel %d citations' % size,
+                     common.best_of(lambda: export_citations.ref_list(ET.Element('back'), records),
+                                    number=number)))
+        export_citations.configure()
+
+    common.print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+# coding: utf-8
+"""
+JSON serialization of the fixture article and of a 1000 rows identifiers
+page, for every encoder available.
+
+    python -m benchmarks.bench_serializer
+"""
+import json
+
+from articlemeta import serializer
+
+import common
+
+
+def main():
+    article = common.load_fixture()
+    page = common.identifiers_page(1000)
+
+    rows = [('json.dumps article', common.best_of(lambda: json.dumps(article))),
+            ('json.dumps identifiers', common.best_of(lambda: json.dumps(page)))]
+
+    for name in sorted(serializer.ENCODERS):
+        srlzr = serializer.Serializer(encoder=name)
+
+        rows.append(('%s article' % name,
+                     common.best_of(lambda: srlzr.dumps(article))))
+        rows.append(('%s identifiers' % name,
+                     common.best_of(lambda: srlzr.dumps(page))))
+        rows.append(('%s identifiers streamed' % name,
+                     common.best_of(lambda: list(srlzr.iterdumps(page)))))
+
+    common.print_table(rows)
+
+
+if __name__ == '__main__':
+    main()
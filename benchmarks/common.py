@@ -0,0 +1,39 @@
+# coding: utf-8
+import os
+import json
+import timeit
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures',
+                       'article_meta.json')
+
+
+def load_fixture():
+    return json.loads(open(FIXTURE).read())
+
+
+def identifiers_page(rows=1000):
+    """
+    Retrieve a synthetic identifiers listing page, like the ones given by
+    DataBroker.identifiers_article.
+    """
+    return {
+        'meta': {'limit': rows, 'offset': 0, 'total': rows * 10,
+                 'filter': {'processing_date': {'$gte': '1500-01-01',
+                                                '$lte': '2014-12-31'}}},
+        'objects': [{'code': 'S0034-891020100004%05d' % i,
+                     'collection': 'scl',
+                     'processing_date': '2010-08-01'} for i in range(rows)]
+    }
+
+
+def best_of(func, number=100, repeat=3):
+    """
+    Retrieve the best time, in seconds, of a single call to func.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def print_table(rows):
+    width = max(len(i[0]) for i in rows)
+    for name, value in rows:
+        print '%s  %10.3f ms' % (name.ljust(width), value * 1000)
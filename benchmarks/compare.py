@@ -0,0 +1,57 @@
+# coding: utf-8
+"""
+Compares two result files written by benchmarks.run.
+
+    python -m benchmarks.compare bench/base.json bench/HEAD.json
+
+Exits with status 1 when any case got slower than the given tolerance.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+
+    return report, dict(((i['name'], i['profile'], i['size']), i)
+                        for i in report['results'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('base')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='accepted throughput loss, default 0.1 (10%%)')
+    args = parser.parse_args()
+
+    base_report, base = load(args.base)
+    current_report, current = load(args.current)
+
+    print 'base: %s  current: %s' % (base_report['commit'], current_report['commit'])
+
+    regressions = 0
+    for key in sorted(set(base) & set(current)):
+        old = base[key].get('items_per_second')
+        new = current[key].get('items_per_second')
+
+        if not old or not new:
+            continue
+
+        ratio = new / old
+        flag = ''
+        if ratio < 1 - args.tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+
+        print '%-40s %-8s %6d  %10.1f -> %10.1f items/s (%+.1f%%) mem %d -> %d KB%s' % (
+            key[0], key[1], key[2], old, new, (ratio - 1) * 100,
+            base[key]['peak_rss_kb'], current[key]['peak_rss_kb'], flag)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# coding: utf-8
+"""
+Synthetic corpora built from the fixture article.
+"""
+import copy
+from datetime import date, timedelta
+
+import common
+
+LANGUAGES = ['en', 'es', 'fr', 'de', 'it', 'ru', 'zh', 'ja']
+
+PROFILES = {
+    'small': {'citations': 5, 'authors': 2, 'translations': 0},
+    'fixture': {'citations': 23, 'authors': 10, 'translations': 2},
+    'heavy': {'citations': 300, 'authors': 30, 'translations': 6}
+}
+
+
+def _cycle(items, total):
+    return [copy.deepcopy(items[i % len(items)]) for i in range(total)]
+
+
+def _citations(base, code, total):
+    citations = _cycle(base['citations'], total)
+
+    for i, citation in enumerate(citations):
+        citation['v880'] = [{'_': '%s%05d' % (code, i + 1)}]
+        citation['v118'] = [{'_': str(i + 1)}]
+        for field in ('v12', 'v18'):
+            if field in citation:
+                citation[field][0]['_'] += ' %d' % i
+
+    return citations
+
+
+def _authors(base, total):
+    authors = _cycle(base['article']['v10'], total)
+
+    for i, author in enumerate(authors):
+        author['s'] = '%s%d' % (author.get('s', ''), i)
+
+    return authors
+
+
+def _translations(field, base, total):
+    original = base['article'][field][0]
+    translated = base['article'][field][1]
+    language = original['l']
+
+    items = [copy.deepcopy(original)]
+    for lang in [i for i in LANGUAGES if i != language][:total]:
+        item = copy.deepcopy(translated)
+        item['l'] = lang
+        items.append(item)
+
+    return items
+
+
+def synthetic_article(base, index, citations=23, authors=10, translations=2,
+                      collection='scl'):
+    """
+    Retrieve a copy of the base article with a new code, processing date
+    and the given number of citations, authors and translations.
+    """
+    article = copy.deepcopy(base)
+    article.pop('_id', None)
+
+    code = 'S0034-89102010%04d%05d' % (index // 100000 + 1, index % 100000)
+    processing_date = date(2010, 1, 1) + timedelta(days=index % 1500)
+
+    article['code'] = code
+    article['collection'] = collection
+    article['article']['v880'] = [{'_': code}]
+    article['article']['v992'] = [{'_': collection}]
+    article['article']['v91'] = [{'_': processing_date.strftime('%Y%m%d')}]
+    article['article']['v10'] = _authors(base, authors)
+    article['article']['v12'] = _translations('v12', base, translations)
+    article['article']['v83'] = _translations('v83', base, translations)
+    article['citations'] = _citations(base, code, citations)
+
+    return article
+
+
+def corpus(size, profile='fixture'):
+    """
+    Retrieve a generator of ``size`` synthetic articles of the given
+    profile.
+    """
+    base = common.load_fixture()
+    params = PROFILES[profile]
+
+    for index in range(size):
+        yield synthetic_article(base, index, **params)
@@ -0,0 +1,173 @@
+# coding: utf-8
+"""
+In memory stand-in for the subset of the pymongo API used by DataBroker.
+"""
+import copy
+import itertools
+
+from articlemeta.storage import match
+
+_ids = itertools.count(1)
+
+
+def project(document, fields):
+
+    if not fields:
+        return copy.deepcopy(document)
+
+    if isinstance(fields, (list, tuple)):
+        fields = dict((i, 1) for i in fields)
+
+    included = [k for k, v in fields.items() if v and k != '_id']
+
+    if included:
+        result = dict((k, copy.deepcopy(document[k])) for k in included if k in document)
+        if fields.get('_id', 1):
+            result['_id'] = document['_id']
+        return result
+
+    return dict((k, copy.deepcopy(v)) for k, v in document.items()
+                if fields.get(k, 1))
+
+
+def seed(spec):
+    """
+    Document inserted by an upsert, with the equality conditions of spec.
+    """
+    return dict((k, v) for k, v in (spec or {}).items()
+                if not k.startswith('$') and not isinstance(v, dict))
+
+
+def modify(document, update):
+    """
+    Apply the $set and $inc operators of the update to the document.
+    """
+    document.update(copy.deepcopy(update.get('$set', {})))
+
+    for field, value in update.get('$inc', {}).items():
+        document[field] = document.get(field, 0) + value
+
+    return document
+
+
+class MemoryCursor(object):
+
+    def __init__(self, documents, fields):
+        self._documents = documents
+        self._fields = fields
+        self._skip = 0
+        self._limit = 0
+
+    def hint(self, index):
+        return self
+
+    def sort(self, key, direction=1):
+        keys = [(key, direction)] if isinstance(key, basestring) else key
+
+        for field, direction in reversed(keys):
+            self._documents.sort(key=lambda i: i.get(field, None),
+                                 reverse=direction < 0)
+
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def count(self):
+        return len(self._documents)
+
+    def __iter__(self):
+        end = self._skip + self._limit if self._limit else None
+
+        for document in self._documents[self._skip:end]:
+            yield project(document, self._fields)
+
+
+class MemoryCollection(object):
+
+    def __init__(self):
+        self._documents = []
+        self.indexes = []
+
+    def find(self, spec=None, fields=None):
+        return MemoryCursor([i for i in self._documents if match(i, spec)], fields)
+
+    def find_one(self, spec=None, fields=None):
+        for document in self._documents:
+            if match(document, spec):
+                return project(document, fields)
+
+        return None
+
+    def insert(self, documents, **kwargs):
+        if isinstance(documents, dict):
+            documents = [documents]
+
+        for document in documents:
+            document = copy.deepcopy(document)
+            document.setdefault('_id', next(_ids))
+            self._documents.append(document)
+
+    def update(self, spec, document, upsert=False, multi=False, **kwargs):
+        updated = 0
+
+        for item in self._documents:
+            if not match(item, spec):
+                continue
+
+            modify(item, document)
+            updated += 1
+
+            if not multi:
+                break
+
+        if not updated and upsert:
+            self.insert(modify(seed(spec), document))
+
+        return {'n': updated or int(upsert), 'updatedExisting': bool(updated)}
+
+    def find_and_modify(self, query=None, update=None, upsert=False,
+                        new=False, fields=None, **kwargs):
+        for item in self._documents:
+            if match(item, query):
+                before = project(item, fields)
+                modify(item, update)
+                return project(item, fields) if new else before
+
+        if not upsert:
+            return None
+
+        self.insert(modify(seed(query), update))
+
+        return project(self._documents[-1], fields) if new else None
+
+    def remove(self, spec=None, **kwargs):
+        before = len(self._documents)
+        self._documents = [i for i in self._documents if not match(i, spec)]
+
+        return {'n': before - len(self._documents)}
+
+    def ensure_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+
+    create_index = ensure_index
+
+    def drop_indexes(self):
+        self.indexes = []
+
+
+class MemoryDatabase(object):
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, MemoryCollection())
+
+    def collection_names(self):
+        return self._collections.keys()
@@ -0,0 +1,211 @@
+# coding: utf-8
+"""
+Benchmarks of the export pipelines and of the DataBroker, the last one
+against an in memory stand-in of MongoDB and against the SQLite storage.
+Every case runs in its own process, so the peak memory reported belongs
+to that case only.
+
+    python -m benchmarks.run --sizes 10,100 --output bench/HEAD.json
+    python -m benchmarks.compare bench/base.json bench/HEAD.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+import traceback
+from datetime import datetime
+
+from articlemeta.export import Export
+from articlemeta.controller import DataBroker
+from articlemeta import storage
+
+import corpus
+import memorydb
+
+FORMATS = ['sci', 'rsps', 'doaj', 'iahx']
+
+
+def sqlite_storage():
+    sqlite = storage.SQLiteStorage(':memory:')
+    sqlite.ensure_indexes()
+
+    return sqlite
+
+
+BACKENDS = {
+    'mongo': memorydb.MemoryDatabase,
+    'sqlite': sqlite_storage
+}
+
+
+def bench_export(fmt, size, profile):
+    articles = list(corpus.corpus(size, profile))
+
+    start = time.time()
+    for article in articles:
+        getattr(Export(article), 'pipeline_%s' % fmt)()
+
+    return len(articles), time.time() - start
+
+
+def _loaded_databroker(backend, size, profile):
+    databroker = DataBroker(BACKENDS[backend]())
+
+    for article in corpus.corpus(size, profile):
+        databroker.add_article(article)
+
+    return databroker
+
+
+def bench_add_article(backend, size, profile):
+    articles = list(corpus.corpus(size, profile))
+    databroker = DataBroker(BACKENDS[backend]())
+
+    start = time.time()
+    for article in articles:
+        databroker.add_article(article)
+
+    return len(articles), time.time() - start
+
+
+def bench_readd_article(backend, size, profile):
+    databroker = _loaded_databroker(backend, size, profile)
+    articles = list(corpus.corpus(size, profile))
+
+    start = time.time()
+    for article in articles:
+        databroker.add_article(article)
+
+    return len(articles), time.time() - start
+
+
+def bench_get_article(backend, size, profile):
+    databroker = _loaded_databroker(backend, size, profile)
+    codes = [i['code'] for i in databroker.identifiers_article(limit=size)['objects']]
+
+    start = time.time()
+    for code in codes:
+        databroker.get_article(code, collection='scl')
+
+    return len(codes), time.time() - start
+
+
+def bench_exists_article(backend, size, profile):
+    databroker = _loaded_databroker(backend, size, profile)
+    codes = [i['code'] for i in databroker.identifiers_article(limit=size)['objects']]
+
+    start = time.time()
+    for code in codes:
+        databroker.exists_article(code, collection='scl')
+
+    return len(codes), time.time() - start
+
+
+def bench_identifiers_article(backend, size, profile):
+    databroker = _loaded_databroker(backend, size, profile)
+    pages = range(0, size, 100)
+
+    start = time.time()
+    for offset in pages:
+        databroker.identifiers_article(collection='scl', offset=offset, limit=100)
+
+    return len(pages), time.time() - start
+
+
+CASES = [('export.%s' % fmt, lambda size, profile, fmt=fmt: bench_export(fmt, size, profile))
+         for fmt in FORMATS]
+for backend in sorted(BACKENDS):
+    CASES += [
+        ('databroker.%s.%s' % (backend, func.__name__[6:]),
+         lambda size, profile, func=func, backend=backend: func(backend, size, profile))
+        for func in (bench_add_article, bench_readd_article, bench_get_article,
+                     bench_exists_article, bench_identifiers_article)
+    ]
+
+
+def _run_case(func, size, profile, queue):
+    result = {'error': None}
+
+    try:
+        items, seconds = func(size, profile)
+        result.update({
+            'items': items,
+            'seconds': seconds,
+            'items_per_second': items / seconds if seconds else None
+        })
+    except Exception:
+        result['error'] = traceback.format_exc().strip().splitlines()[-1]
+
+    result['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(result)
+
+
+def run_case(name, func, size, profile):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_case,
+                                      args=(func, size, profile, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+
+    result.update({'name': name, 'size': size, 'profile': profile})
+
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100',
+                        help='comma separated number of articles of each corpus')
+    parser.add_argument('--profiles', default=','.join(sorted(corpus.PROFILES)),
+                        help='comma separated corpus profiles')
+    parser.add_argument('--cases', default='',
+                        help='run only the cases starting with this prefix')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to save the results')
+    args = parser.parse_args()
+
+    results = []
+    for profile in args.profiles.split(','):
+        for size in [int(i) for i in args.sizes.split(',')]:
+            for name, func in CASES:
+                if not name.startswith(args.cases):
+                    continue
+
+                result = run_case(name, func, size, profile)
+                results.append(result)
+
+                if result['error']:
+                    summary = 'error: %s' % result['error']
+                else:
+                    summary = '%10.1f items/s' % result['items_per_second']
+
+                print '%-40s %-8s %6d  %s  %8d KB' % (
+                    name, profile, size, summary, result['peak_rss_kb'])
+                sys.stdout.flush()
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
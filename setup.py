@@ -14,6 +14,8 @@ setup(
     license="BSD 2-clause",
     url="http://docs.scielo.org",
     packages=['articlemeta'],
+    package_data={'articlemeta': ['xsd/*/*.xsd', 'xsd/*/*/*.xsd', 'xsd/*/*/*/*.xsd',
+                                  'xsd/*/*/*.txt']},
     classifiers=[
         "Development Status :: 1 - Planning",
         "Intended Audience :: Customer Service",
@@ -0,0 +1,54 @@
+# coding: utf-8
+"""
+Export stand-in shared by the tests of the feeds, the validation and the
+deliveries. The articles with the codes ``broken`` and ``invalid`` fail to
+render and render documents out of the schema.
+"""
+import xml.etree.ElementTree as ET
+
+from articlemeta import iahx_feed
+
+RECORD = ('<record><journalTitle>Revista de Saude Publica</journalTitle>'
+          '<publicationDate>2010-08</publicationDate>'
+          '<title language="eng">%s</title>'
+          '<fullTextUrl format="html">http://www.scielo.br/%s</fullTextUrl></record>')
+
+RECORDS = '<?xml version="1.0" encoding="UTF-8"?>\n<records>' + RECORD + '</records>'
+
+INVALID_RECORD = '<record><title>no journal title</title></record>'
+
+
+class FakeExport(object):
+
+    def __init__(self, article, journal_cache=None):
+        self._article = article
+
+    def _check(self):
+
+        if self._article['code'] == 'broken':
+            raise ValueError('broken article')
+
+    def record_doaj(self):
+        self._check()
+
+        if self._article['code'] == 'invalid':
+            return ET.fromstring(INVALID_RECORD)
+
+        return ET.fromstring(RECORD % (self._article['code'], self._article['code']))
+
+    def pipeline_doaj(self):
+        self._check()
+
+        if self._article['code'] == 'invalid':
+            return '<records>%s</records>' % INVALID_RECORD
+
+        return RECORDS % (self._article['code'], self._article['code'])
+
+    def record_iahx(self):
+        self._check()
+
+        doc = ET.Element('doc')
+        field = ET.SubElement(doc, 'field', name='id')
+        field.text = iahx_feed.document_id(self._article['code'], 'scl')
+
+        return doc
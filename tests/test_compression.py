@@ -0,0 +1,110 @@
+# coding: utf-8
+import unittest
+import zlib
+
+from pyramid import testing
+from pyramid.response import Response
+
+from articlemeta import compression
+
+
+class CompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp(settings={'app': {'compression_min_size': '10'}})
+        self._body = '{"objects": [%s]}' % ', '.join(['"S0034-89102010000400007"'] * 200)
+
+    def tearDown(self):
+        testing.tearDown()
+
+    def _tween(self, response):
+        return compression.compression_tween_factory(lambda request: response,
+                                                     self.config.registry)
+
+    def test_parse_accept_encoding(self):
+
+        expected = {'gzip': 0.8, 'deflate': 1.0, 'br': 0.0}
+
+        self.assertEqual(
+            compression.parse_accept_encoding('gzip;q=0.8, deflate, br;q=0'),
+            expected)
+
+    def test_choose_encoding_by_quality(self):
+
+        self.assertEqual(
+            compression.choose_encoding('gzip;q=0.5, deflate'), 'deflate')
+
+    def test_choose_encoding_identity_only(self):
+
+        self.assertEqual(compression.choose_encoding('identity'), None)
+
+    def test_choose_encoding_without_header(self):
+
+        self.assertEqual(compression.choose_encoding(None), None)
+
+    def test_choose_encoding_wildcard(self):
+
+        self.assertTrue(compression.choose_encoding('*') in compression.PREFERENCE)
+
+    def test_gzip_response(self):
+
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        response = Response(self._body, content_type='application/json')
+
+        result = self._tween(response)(request)
+
+        self.assertEqual(result.content_encoding, 'gzip')
+        self.assertEqual(
+            zlib.decompress(result.body, 16 + zlib.MAX_WBITS), self._body)
+        self.assertTrue('Accept-Encoding' in result.vary)
+
+    def test_deflate_response(self):
+
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'deflate'})
+        response = Response(self._body, content_type='application/xml')
+
+        result = self._tween(response)(request)
+
+        self.assertEqual(result.content_encoding, 'deflate')
+        self.assertEqual(zlib.decompress(result.body), self._body)
+
+    def test_streamed_response(self):
+
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        response = Response(app_iter=iter(['{"a": ', '1}']),
+                            content_type='application/json')
+
+        result = self._tween(response)(request)
+
+        self.assertEqual(result.content_encoding, 'gzip')
+        self.assertEqual(
+            zlib.decompress(result.body, 16 + zlib.MAX_WBITS), '{"a": 1}')
+
+    def test_response_under_min_size(self):
+
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        response = Response('null', content_type='application/json')
+
+        result = self._tween(response)(request)
+
+        self.assertEqual(result.content_encoding, None)
+        self.assertEqual(result.body, 'null')
+
+    def test_response_not_compressible(self):
+
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        response = Response(self._body, content_type='image/png')
+
+        result = self._tween(response)(request)
+
+        self.assertEqual(result.content_encoding, None)
+
+    def test_compression_disabled(self):
+
+        self.config.registry.settings['app']['compression'] = 'false'
+        request = testing.DummyRequest(headers={'Accept-Encoding': 'gzip'})
+        response = Response(self._body, content_type='application/json')
+
+        result = self._tween(response)(request)
+
+        self.assertEqual(result.content_encoding, None)
@@ -1,13 +1,18 @@
 # coding: utf-8
 import os
+import threading
 import unittest
 import json
+from datetime import datetime
 
 from mocker import Mocker, ANY
 from xylose.scielodocument import Article
 
+from articlemeta import storage
 from articlemeta.controller import (DataBroker,
+                                    ReferenceCache,
                                     remove_accents,
+                                    content_hash,
                                     gen_citations_title_keys,
                                     gen_title_keys)
 
@@ -309,6 +314,34 @@ class ControllerTest(unittest.TestCase):
 
         self.assertEqual(db.get_article('xx'), None)
 
+    def test_get_article_from_article_store(self):
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        article_store = mocker.mock()
+        article_store.get_article('xx', 'scl')
+        mocker.result(self._raw_json)
+        mocker.replay()
+
+        db = DataBroker(databroker, article_store=article_store)
+
+        self.assertEqual(db.get_article('xx', 'scl')['code'], 'S0034-89102010000400007')
+
+    def test_get_article_missing_in_article_store(self):
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        article_store = mocker.mock()
+        article_store.get_article('xx', 'scl')
+        mocker.result(None)
+        databroker['articles'].find_one(ANY)
+        mocker.result(self._raw_json)
+        mocker.replay()
+
+        db = DataBroker(databroker, article_store=article_store)
+
+        self.assertEqual(db.get_article('xx', 'scl')['code'], 'S0034-89102010000400007')
+
     def test_exists_article_False(self):
 
         mocker = Mocker()
@@ -339,7 +372,9 @@ class ControllerTest(unittest.TestCase):
         expected = db._check_journal_meta(self._raw_json['title'])
 
         self.assertEqual(expected['code'], [u'0034-8910'])
+        self.assertEqual(expected['issn'], u'0034-8910')
         self.assertEqual(expected['collection'], u'scl')
+        self.assertTrue(expected['processing_date'])
 
     def test_remove_accents(self):
 
@@ -347,16 +382,516 @@ class ControllerTest(unittest.TestCase):
 
         self.assertEqual(remove_accents(u'Perfil epidemiológico dos pacientes em terapia renal substitutiva no Brasil, 2000-2004'), expected)
 
+    def test_journal_without_data(self):
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        databroker['journals'].find(ANY, ANY)
+        mocker.result([])
+        mocker.replay()
+
+        db = DataBroker(databroker)
+
+        self.assertEqual(db.journal(), None)
+
+    def test_journal_reference_cache(self):
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        databroker['journals'].find(ANY, ANY)
+        mocker.result([self._raw_json['title']])
+        mocker.count(1)
+        mocker.replay()
+
+        db = DataBroker(databroker, reference_cache=ReferenceCache())
+
+        self.assertEqual(db.journal(collection='scl'), [self._raw_json['title']])
+        self.assertEqual(db.journal(collection='scl'), [self._raw_json['title']])
+
+        mocker.verify()
+
+    def test_collection_reference_cache(self):
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        databroker['collections'].find(ANY, ANY)
+        mocker.result([{'acron': 'scl'}])
+        mocker.count(1)
+        mocker.replay()
+
+        db = DataBroker(databroker, reference_cache=ReferenceCache())
+
+        self.assertEqual(db.collection(), [{'acron': 'scl'}])
+        self.assertEqual(db.collection(), [{'acron': 'scl'}])
+
+        mocker.verify()
+
+    def test_add_journal_invalidates_reference_cache(self):
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        databroker['journals'].find(ANY, ANY)
+        mocker.result([])
+        databroker['journals'].find_one(ANY, ANY)
+        mocker.result(None)
+        databroker['journals'].update(ANY, ANY, safe=False, upsert=True)
+        databroker['tombstones'].remove(ANY, w=1)
+        mocker.result({'n': 0})
+        databroker['counters'].find_and_modify(ANY, ANY, upsert=True, new=True)
+        mocker.result({'seq': 1})
+        databroker['events'].insert(ANY)
+        databroker['journals'].find(ANY, ANY)
+        mocker.result([])
+        mocker.replay()
+
+        db = DataBroker(databroker, reference_cache=ReferenceCache())
+
+        db.journal()
+        db.add_journal(self._raw_json['title'])
+        db.journal()
+
+        mocker.verify()
+
+    def test_add_journal_unchanged_keeps_processing_date(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        db = DataBroker(strg)
+        raw = json.dumps(self._raw_json['title'])
+
+        journal = db.add_journal(json.loads(raw))
+        strg.update('journals', {'collection': journal['collection']},
+                    {'processing_date': '2014-01-01'}, multi=True)
+
+        self.assertEqual(db.add_journal(json.loads(raw)), None)
+        self.assertEqual(strg.find_one('journals', {})['processing_date'], '2014-01-01')
+        self.assertEqual(len(db.events()['objects']), 1)
+
+        changed = json.loads(raw)
+        changed['v100'] = [{'_': 'Changed title'}]
+
+        self.assertTrue(db.add_journal(changed))
+        self.assertEqual(strg.find_one('journals', {})['processing_date'],
+                         datetime.now().date().isoformat())
+
+    def test_reference_cache_read_through(self):
+
+        calls = []
+        cache = ReferenceCache(ttl=300)
+
+        def loader():
+            calls.append(1)
+            return ['scl']
+
+        self.assertEqual(cache.get(('collections',), loader), ['scl'])
+        self.assertEqual(cache.get(('collections',), loader), ['scl'])
+        self.assertEqual(len(calls), 1)
+
+    def test_reference_cache_expired(self):
+
+        calls = []
+        cache = ReferenceCache(ttl=0)
+
+        def loader():
+            calls.append(1)
+            return ['scl']
+
+        cache.get(('collections',), loader)
+        cache.get(('collections',), loader)
+
+        self.assertEqual(len(calls), 2)
+
+    def test_reference_cache_size_limited(self):
+
+        cache = ReferenceCache(ttl=300, maxsize=2)
+
+        cache.get(('journals', None, '0001-0001'), lambda: None)
+        cache.get(('collections',), lambda: ['scl'])
+        cache.get(('journals', None, '0001-0001'), lambda: None)
+        cache.get(('journals', None, '0002-0002'), lambda: None)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(('collections',), lambda: ['arg']), ['arg'])
+
+    def test_reference_cache_invalidate_kind(self):
+
+        calls = []
+        cache = ReferenceCache(ttl=300)
+
+        def loader():
+            calls.append(1)
+            return ['scl']
+
+        cache.get(('collections',), loader)
+        cache.get(('journals', None, None), loader)
+        cache.invalidate('journals')
+        cache.get(('collections',), loader)
+        cache.get(('journals', None, None), loader)
+
+        self.assertEqual(len(calls), 3)
+
+    def _journals_storage(self):
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('journals', [
+            {'code': ['0001-0001'], 'issn': '0001-0001', 'collection': 'scl', 'processing_date': '2014-01-01'},
+            {'code': ['0002-0002'], 'issn': '0002-0002', 'collection': 'scl', 'processing_date': '2014-01-02'},
+            {'code': ['0003-0003'], 'issn': '0003-0003', 'collection': 'arg', 'processing_date': '2014-01-02'},
+            {'code': ['0004-0004'], 'issn': '0004-0004', 'collection': 'scl', 'processing_date': '2014-01-02'},
+            {'code': ['0005-0005'], 'collection': 'scl'}
+        ])
+
+        return strg
+
+    def test_identifiers_journal_without_dates(self):
+
+        db = DataBroker(self._journals_storage())
+
+        result = db.identifiers_journal()
+
+        self.assertEqual(result['meta']['total'], 5)
+        self.assertFalse('resume_token' in result['meta'])
+
+    def test_identifiers_journal_changes_window(self):
+
+        db = DataBroker(self._journals_storage())
+
+        result = db.identifiers_journal(from_date='2014-01-02', until_date='2014-01-02')
+
+        self.assertEqual(result['meta']['total'], 3)
+        self.assertEqual([i['code'] for i in result['objects']],
+                         [['0003-0003'], ['0002-0002'], ['0004-0004']])
+        self.assertEqual(result['meta']['resume_token'], None)
+
+    def test_identifiers_journal_resume_token(self):
+
+        db = DataBroker(self._journals_storage())
+
+        codes = []
+        token = None
+        while True:
+            result = db.identifiers_journal(from_date='2014-01-01', limit=2,
+                                            resume_token=token)
+            codes += [i['code'][0] for i in result['objects']]
+            token = result['meta']['resume_token']
+            if not token:
+                break
+
+        self.assertEqual(codes, ['0001-0001', '0003-0003', '0002-0002', '0004-0004'])
+
+    def test_identifiers_journal_invalid_resume_token(self):
+
+        db = DataBroker(self._journals_storage())
+
+        self.assertRaises(ValueError, db.identifiers_journal, resume_token='x')
+
+    def test_articles_paged(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', [
+            {'code': 'S0%d' % i, 'collection': 'scl', 'processing_date': '2014-01-0%d' % i}
+            for i in range(1, 6)
+        ])
+        db = DataBroker(strg)
+
+        articles = db.articles(collection='scl', from_date='2014-01-02',
+                               until_date='2014-01-04', page_size=2)
+
+        self.assertEqual(sorted(i['code'] for i in articles), ['S02', 'S03', 'S04'])
+
+    def test_delete_article_adds_tombstone(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', {'code': 'S0034-89102010000400007', 'collection': 'scl'})
+        db = DataBroker(strg)
+
+        db.delete_article('S0034-89102010000400007', collection='scl')
+
+        result = db.identifiers_deleted('article', collection='scl')
+        self.assertEqual(strg.count('articles', {}), 0)
+        self.assertEqual(result['meta']['total'], 1)
+        self.assertEqual(result['objects'][0]['code'], 'S0034-89102010000400007')
+        self.assertEqual(result['objects'][0]['deleted_date'],
+                         datetime.now().date().isoformat())
+
+    def test_delete_journal_without_collection_adds_tombstone(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('journals', {'code': '0034-8910', 'collection': None})
+        db = DataBroker(strg)
+
+        db.delete_journal('0034-8910')
+        db.delete_journal('0034-8910')
+
+        result = db.identifiers_deleted('journal')
+        self.assertEqual(result['meta']['total'], 1)
+        self.assertEqual(result['objects'][0]['collection'], None)
+
+    def test_delete_missing_article_adds_no_tombstone(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', {'code': 'S0034-89102010000400007', 'collection': 'scl'})
+        db = DataBroker(strg)
+
+        db.delete_article('S0034-89102010000400007')
+        db.delete_article('S0034-89102010000400008', collection='scl')
+        db.delete_journal('0034-8910', collection='scl')
+
+        self.assertEqual(strg.count('articles', {}), 1)
+        self.assertEqual(strg.count('tombstones', {}), 0)
+        self.assertEqual(db.events()['objects'], [])
+
+    def test_identifiers_deleted_window(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('tombstones', [
+            {'kind': 'article', 'code': 'a', 'collection': 'scl', 'deleted_date': '2014-01-01'},
+            {'kind': 'article', 'code': 'b', 'collection': 'scl', 'deleted_date': '2014-02-01'},
+            {'kind': 'journal', 'code': 'c', 'collection': 'scl', 'deleted_date': '2014-02-01'}
+        ])
+        db = DataBroker(strg)
+
+        result = db.identifiers_deleted('article', from_date='2014-01-15',
+                                        until_date='2014-03-01')
+
+        self.assertEqual([i['code'] for i in result['objects']], ['b'])
+
+    def test_compact_tombstones_on_delete(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('tombstones', [
+            {'kind': 'article', 'code': 'a', 'collection': 'scl', 'deleted_date': '2000-01-01'}
+        ])
+        strg.insert('articles', {'code': 'b', 'collection': 'scl'})
+        db = DataBroker(strg, tombstone_retention_days=30)
+
+        db.delete_article('b', collection='scl')
+
+        self.assertEqual([i['code'] for i in strg.find('tombstones', {})], ['b'])
+
+    def test_add_article_removes_tombstone(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('tombstones', [
+            {'kind': 'article', 'code': 'S0034-89102010000400007', 'collection': 'scl', 'deleted_date': '2014-01-01'},
+            {'kind': 'article', 'code': 'S0034-89102010000400007', 'collection': 'arg', 'deleted_date': '2014-01-01'}
+        ])
+        db = DataBroker(strg)
+        self._raw_json['article']['v992'] = [{'_': 'scl'}]
+
+        db.add_article(self._raw_json)
+
+        self.assertEqual([i['collection'] for i in strg.find('tombstones', {})], ['arg'])
+
+    def test_content_hash_is_stable(self):
+
+        article = {'article': {'v880': [{'_': 'x'}]}, 'title': {'v100': [{'_': 'y'}]}}
+        copy = json.loads(json.dumps(article))
+        copy['_id'] = 'abc'
+
+        self.assertEqual(content_hash(article), content_hash(copy))
+        copy['article']['v880'][0]['_'] = 'z'
+        self.assertNotEqual(content_hash(article), content_hash(copy))
+
+    def test_add_articles_counts(self):
+
+        self._raw_json['article']['v992'] = [{'_': 'scl'}]
+        raw = json.dumps(self._raw_json)
+        changed = json.loads(raw)
+        changed['article']['v40'] = [{'_': 'es'}]
+
+        db = DataBroker(storage.SQLiteStorage(':memory:'))
+
+        first = db.add_articles([json.loads(raw)])
+        second = db.add_articles([json.loads(raw), changed])
+
+        self.assertEqual(first, {'inserted': 1, 'updated': 0, 'skipped': 0})
+        self.assertEqual(second, {'inserted': 0, 'updated': 1, 'skipped': 1})
+
+    def test_add_article_unchanged_is_skipped(self):
+
+        self._raw_json['article']['v992'] = [{'_': 'scl'}]
+        raw = json.dumps(self._raw_json)
+        db = DataBroker(storage.SQLiteStorage(':memory:'))
+
+        self.assertTrue(db.add_article(json.loads(raw)))
+        self.assertEqual(db.add_article(json.loads(raw)), None)
+
+    def test_events_logged_in_order(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', [{'code': 'a', 'collection': 'scl'},
+                                 {'code': 'b', 'collection': 'scl'}])
+        strg.insert('journals', {'code': '0034-8910', 'collection': 'scl'})
+        db = DataBroker(strg)
+
+        db.delete_article('a', collection='scl')
+        db.set_doaj_status('b', True)
+        db.delete_journal('0034-8910', collection='scl')
+
+        result = db.events(since=1)
+
+        self.assertEqual([(i['seq'], i['event'], i['code']) for i in result['objects']],
+                         [(2, 'article.doaj_status', 'b'), (3, 'journal.delete', '0034-8910')])
+        self.assertEqual(result['meta']['last'], 3)
+        self.assertFalse(result['meta']['truncated'])
+
+    def test_events_disabled(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', {'code': 'a', 'collection': 'scl'})
+        db = DataBroker(strg, events_max=0)
+
+        db.delete_article('a', collection='scl')
+
+        self.assertEqual(db.events()['objects'], [])
+
+    def test_events_trimmed(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', {'code': 'a', 'collection': 'scl'})
+        db = DataBroker(strg, events_max=10)
+
+        for i in range(100):
+            db.set_doaj_status('a', i % 2 == 0)
+
+        result = db.events(since=5, limit=5)
+
+        self.assertEqual(strg.count('events', {}), 10)
+        self.assertEqual(result['objects'][0]['seq'], 91)
+        self.assertTrue(result['meta']['truncated'])
+
+    def test_events_stop_at_event_being_written(self):
+
+        written = threading.Event()
+        release = threading.Event()
+
+        class SlowStorage(storage.SQLiteStorage):
+
+            def insert(self, name, documents):
+                if name == 'events' and documents['seq'] == 2:
+                    written.set()
+                    release.wait(5)
+                return super(SlowStorage, self).insert(name, documents)
+
+        strg = SlowStorage(':memory:')
+        strg.insert('articles', [{'code': i, 'collection': 'scl'} for i in 'abc'])
+        db = DataBroker(strg)
+        db.set_doaj_status('a', True)
+
+        slow = threading.Thread(target=db.set_doaj_status, args=('b', True))
+        slow.start()
+        written.wait(5)
+        db.set_doaj_status('c', True)
+
+        result = db.events(since=1)
+        self.assertEqual(result['objects'], [])
+        self.assertEqual(result['meta']['last'], 1)
+        self.assertFalse(result['meta']['truncated'])
+
+        release.set()
+        slow.join()
+
+        result = db.events(since=1)
+        self.assertEqual([i['code'] for i in result['objects']], ['b', 'c'])
+        self.assertEqual(result['meta']['last'], 3)
+
+    def test_events_concurrent_writers(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', [{'code': 'start', 'collection': 'scl'}] + [
+            {'code': '%d-%d' % (w, i), 'collection': 'scl'} for w in range(4) for i in range(50)])
+        db = DataBroker(strg)
+        db.set_doaj_status('start', True)
+
+        def write(worker):
+            for i in range(50):
+                db.set_doaj_status('%d-%d' % (worker, i), True)
+
+        writers = [threading.Thread(target=write, args=(i,)) for i in range(4)]
+        for writer in writers:
+            writer.start()
+
+        seen = []
+        last = 1
+        while any(i.is_alive() for i in writers) or last < 201:
+            result = db.events(since=last, limit=7)
+            seen.extend(i['seq'] for i in result['objects'])
+            last = result['meta']['last']
+
+        for writer in writers:
+            writer.join()
+
+        self.assertEqual(seen, range(2, 202))
+
+    def test_events_skip_old_gap(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('events', [
+            {'seq': 1, 'event': 'x', 'code': 'a', 'collection': None, 'date': '2014-01-01T00:00:00'},
+            {'seq': 3, 'event': 'x', 'code': 'c', 'collection': None, 'date': '2014-01-01T00:00:01'}
+        ])
+        db = DataBroker(strg)
+
+        result = db.events(since=1)
+
+        self.assertEqual([i['seq'] for i in result['objects']], [3])
+        self.assertFalse(result['meta']['truncated'])
+
+    def _doaj_storage(self):
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', [
+            {'code': 'a', 'collection': 'scl', 'sent_doaj': 'False', 'processing_date': '2014-01-03'},
+            {'code': 'b', 'collection': 'scl', 'sent_doaj': 'False', 'processing_date': '2014-01-01'},
+            {'code': 'a', 'collection': 'arg', 'sent_doaj': 'False', 'processing_date': '2014-01-02'},
+            {'code': 'c', 'collection': 'scl', 'sent_doaj': 'True', 'processing_date': '2014-01-01'}
+        ])
+
+        return strg
+
+    def test_set_doaj_status_by_collection(self):
+
+        strg = self._doaj_storage()
+        db = DataBroker(strg)
+
+        updated = db.set_doaj_status('a', True, collection='arg')
+
+        self.assertEqual(updated, 1)
+        self.assertEqual(strg.count('articles', {'sent_doaj': 'True'}), 2)
+        self.assertEqual(strg.find_one('articles', {'code': 'a', 'collection': 'scl'})['sent_doaj'],
+                         'False')
 
+    def test_set_doaj_status_bulk(self):
 
+        strg = self._doaj_storage()
+        db = DataBroker(strg)
 
+        updated = db.set_doaj_status_bulk([('scl', 'a'), ('scl', 'b'), ('arg', 'x')], True)
 
+        self.assertEqual(updated, 2)
+        self.assertEqual(
+            sorted((i['collection'], i['code']) for i in strg.find('articles', {'sent_doaj': 'False'})),
+            [('arg', 'a')])
+        self.assertEqual([i['codes'] for i in db.events()['objects']], [['a', 'b']])
 
+        self.assertEqual(db.set_doaj_status_bulk([('scl', 'a'), ('scl', 'c')], True), 0)
+        self.assertEqual(len(db.events()['objects']), 1)
 
+    def test_set_doaj_status_unchanged_logs_no_event(self):
 
+        db = DataBroker(self._doaj_storage())
 
+        self.assertEqual(db.set_doaj_status('missing', True), 0)
+        self.assertEqual(db.set_doaj_status('c', True, collection='scl'), 0)
+        self.assertEqual(db.events()['objects'], [])
 
+        self.assertEqual(db.set_doaj_status('c', False, collection='scl'), 1)
+        self.assertEqual([i['code'] for i in db.events()['objects']], ['c'])
 
+    def test_identifiers_doaj_pending(self):
 
+        db = DataBroker(self._doaj_storage())
 
+        result = db.identifiers_doaj_pending()
 
+        self.assertEqual(result['meta']['total'], 3)
+        self.assertEqual([(i['collection'], i['code']) for i in result['objects']],
+                         [('scl', 'b'), ('arg', 'a'), ('scl', 'a')])
@@ -0,0 +1,71 @@
+# coding: utf-8
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from articlemeta import delivery
+from tests.fakes import FakeExport, RECORDS
+
+
+class DeliverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self._export = delivery.Export
+        delivery.Export = FakeExport
+
+    def tearDown(self):
+        delivery.Export = self._export
+        shutil.rmtree(self.output_dir)
+
+    def check(self, processes):
+
+        articles = [{'code': code, 'collection': 'scl'}
+                    for code in ['S01', 'broken', 'invalid', 'S02']]
+
+        summary = delivery.deliver(articles, self.output_dir, 'scl', fmt='doaj',
+                                   processes=processes, chunksize=1)
+
+        with zipfile.ZipFile(summary['package']) as zf:
+            names = sorted(zf.namelist())
+            document = zf.read('scl/S01.xml')
+
+        with open(summary['quarantine']) as f:
+            quarantined = [json.loads(i) for i in f]
+
+        with open(os.path.join(self.output_dir, 'scl.summary.json')) as f:
+            written = json.load(f)
+
+        self.assertEqual(names, ['scl/S01.xml', 'scl/S02.xml'])
+        self.assertEqual(document, RECORDS % ('S01', 'S01'))
+        self.assertEqual([i['code'] for i in quarantined], ['broken', 'invalid'])
+        self.assertEqual(quarantined[0]['document'], None)
+        self.assertTrue(quarantined[1]['errors'])
+        self.assertEqual((summary['articles'], summary['valid'], summary['invalid']),
+                         (4, 2, 2))
+        self.assertEqual(summary['failure_rate'], 0.5)
+        self.assertEqual(written['valid'], 2)
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ['scl.quarantine.json', 'scl.summary.json', 'scl.zip'])
+
+    def test_deliver(self):
+
+        self.check(processes=1)
+
+    def test_deliver_in_pool(self):
+
+        self.check(processes=2)
+
+    def test_temporary_files_removed_on_error(self):
+
+        def articles():
+            yield {'code': 'S01', 'collection': 'scl'}
+            raise IOError('storage gone')
+
+        self.assertRaises(IOError, delivery.deliver, articles(), self.output_dir,
+                          'scl', fmt='doaj')
+
+        self.assertEqual(os.listdir(self.output_dir), [])
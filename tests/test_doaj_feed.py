@@ -0,0 +1,129 @@
+# coding: utf-8
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mocker import Mocker
+
+from articlemeta import doaj_feed
+from tests.fakes import FakeExport, RECORD
+
+
+class FeedWriterTest(unittest.TestCase):
+
+    def test_batches_stay_under_limit(self):
+
+        record = RECORD % ('a', 'a')
+        limit = len(doaj_feed.HEADER) + len(doaj_feed.FOOTER) + 2 * len(record)
+        writer = doaj_feed.FeedWriter(max_bytes=limit)
+
+        batches = [writer.add(record, i) for i in range(5)] + [writer.close()]
+        batches = [i for i in batches if i]
+
+        self.assertEqual([items for data, items, records in batches], [[0, 1], [2, 3], [4]])
+        self.assertTrue(all(len(data) <= limit for data, items, records in batches))
+
+    def test_record_larger_than_limit(self):
+
+        writer = doaj_feed.FeedWriter(max_bytes=10)
+
+        self.assertRaises(ValueError, writer.add, RECORD % ('a', 'a'), 1)
+
+    def test_close_empty(self):
+
+        self.assertEqual(doaj_feed.FeedWriter().close(), None)
+
+
+class BuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self._export = doaj_feed.Export
+        doaj_feed.Export = FakeExport
+
+    def tearDown(self):
+        doaj_feed.Export = self._export
+        shutil.rmtree(self.output_dir)
+
+    def test_build(self):
+
+        codes = ['S01', 'broken', 'invalid', 'S02']
+
+        mocker = Mocker()
+        databroker = mocker.mock()
+        databroker.identifiers_doaj_pending(collection='scl', offset=0)
+        mocker.result({'meta': {'limit': 1000, 'total': len(codes)},
+                       'objects': [{'code': i, 'collection': 'scl'} for i in codes]})
+        for code in codes:
+            databroker.get_article(code, collection='scl')
+            mocker.result({'code': code})
+        databroker.set_doaj_status_bulk([('scl', 'S01')], True)
+        mocker.result(1)
+        databroker.set_doaj_status_bulk([('scl', 'S02')], True)
+        mocker.result(1)
+        mocker.replay()
+
+        record_size = len(RECORD % ('S01', 'S01'))
+        report = doaj_feed.build(
+            databroker, self.output_dir, collection='scl',
+            max_bytes=len(doaj_feed.HEADER) + len(doaj_feed.FOOTER) + record_size,
+            run='20140101000000')
+
+        mocker.verify()
+
+        self.assertEqual(len(report['files']), 2)
+        self.assertEqual(report['sent'], 2)
+        self.assertEqual(report['invalid'][0]['item'], ('scl', 'invalid'))
+        self.assertEqual(report['skipped'][0]['item'], ('scl', 'broken'))
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ['doaj_20140101000000.quarantine.json',
+                          'doaj_20140101000000_00001.xml',
+                          'doaj_20140101000000_00002.xml'])
+
+    def _databroker(self, mocker, codes):
+        databroker = mocker.mock()
+        databroker.identifiers_doaj_pending(collection='scl', offset=0)
+        mocker.result({'meta': {'limit': 1000, 'total': len(codes)},
+                       'objects': [{'code': i, 'collection': 'scl'} for i in codes]})
+        for code in codes:
+            databroker.get_article(code, collection='scl')
+            mocker.result({'code': code})
+
+        return databroker
+
+    def test_invalid_records_quarantined(self):
+
+        mocker = Mocker()
+        databroker = self._databroker(mocker, ['S01', 'invalid', 'S02'])
+        databroker.set_doaj_status_bulk([('scl', 'S01'), ('scl', 'S02')], True)
+        mocker.result(2)
+        mocker.replay()
+
+        report = doaj_feed.build(databroker, self.output_dir, collection='scl',
+                                 run='20140101000000')
+
+        mocker.verify()
+
+        self.assertEqual(report['sent'], 2)
+        with open(report['files'][0]) as f:
+            self.assertEqual(f.read().count('<record>'), 2)
+        with open(report['quarantine']) as f:
+            quarantined = [json.loads(i) for i in f]
+        self.assertEqual([i['code'] for i in quarantined], ['invalid'])
+        self.assertTrue(quarantined[0]['errors'])
+
+    def test_files_never_overwritten(self):
+
+        open(os.path.join(self.output_dir, 'doaj_20140101000000_00001.xml'), 'w').close()
+
+        mocker = Mocker()
+        databroker = self._databroker(mocker, ['S01'])
+        mocker.replay()
+
+        self.assertRaises(OSError, doaj_feed.build, databroker, self.output_dir,
+                          collection='scl', run='20140101000000')
+
+        self.assertEqual(os.path.getsize(
+            os.path.join(self.output_dir, 'doaj_20140101000000_00001.xml')), 0)
@@ -0,0 +1,154 @@
+# coding: utf-8
+import json
+import unittest
+from StringIO import StringIO
+
+from articlemeta import executor
+from articlemeta import metrics
+
+
+def request(fmt, article):
+    data = json.dumps([fmt, article])
+
+    return executor.REQUEST_HEADER.pack(len(data)) + data
+
+
+class WorkerTest(unittest.TestCase):
+
+    def test_worker_returns_error_and_keeps_reading(self):
+
+        stdin = StringIO(request('sci', {}) + request('sci', {}))
+        stdout = StringIO()
+
+        executor.worker(stdin, stdout)
+
+        output = stdout.getvalue()
+        ok, size, histograms_size = executor.RESPONSE_HEADER.unpack_from(output)
+        second = output[executor.RESPONSE_HEADER.size + size:]
+
+        self.assertFalse(ok)
+        self.assertEqual(histograms_size, 0)
+        self.assertEqual(second, output[:len(second)])
+
+    def test_worker_sends_histograms(self):
+
+        stdout = StringIO()
+
+        metrics.registry.enabled = True
+        metrics.registry.clear()
+
+        try:
+            executor.worker(StringIO(request('sci', {})), stdout)
+            left = metrics.registry.render()
+        finally:
+            metrics.registry.enabled = False
+            metrics.registry.clear()
+
+        output = stdout.getvalue()
+        ok, size, histograms_size = executor.RESPONSE_HEADER.unpack_from(output)
+        start = executor.RESPONSE_HEADER.size + size
+        histograms = json.loads(output[start:start + histograms_size])
+
+        self.assertIn('articlemeta_article_build_seconds',
+                      [name for name, labels, counts, sum_, count in histograms])
+        self.assertEqual(left, '\n')
+
+    def test_worker_stops_on_eof(self):
+
+        stdout = StringIO()
+
+        executor.worker(StringIO(''), stdout)
+
+        self.assertEqual(stdout.getvalue(), '')
+
+
+class ExportExecutorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = executor.ExportExecutor(processes=1)
+
+    def tearDown(self):
+        self.executor.close()
+
+    def test_unknown_format(self):
+
+        self.assertRaises(ValueError, self.executor.export, 'xml', {})
+
+    def test_export_error(self):
+
+        self.assertRaises(executor.ExportError, self.executor.export, 'sci', {})
+
+    def test_dead_worker_is_replaced(self):
+
+        worker = self.executor._idle.get()
+        worker._process.kill()
+        worker._process.wait()
+        self.executor._idle.put(worker)
+
+        self.assertRaises(executor.ExportError, self.executor.export, 'sci', {})
+        self.assertRaises(executor.ExportError, self.executor.export, 'sci', {})
+        self.assertEqual(len(self.executor._workers), 1)
+        self.assertTrue(self.executor._workers[0].alive)
+
+    def test_queue_full(self):
+
+        self.executor._pending = self.executor.processes + self.executor.max_queue
+
+        with self.assertRaises(executor.ExecutorBusy) as cm:
+            self.executor.export('sci', {})
+
+        self.assertEqual(cm.exception.retry_after, 1)
+
+    def test_queue_timeout(self):
+
+        self.executor.queue_timeout = 0.01
+        worker = self.executor._idle.get()
+
+        try:
+            self.assertRaises(executor.ExecutorBusy, self.executor.export, 'sci', {})
+            self.assertEqual(self.executor.pending, 0)
+        finally:
+            self.executor._idle.put(worker)
+
+    def test_queue_time_metrics(self):
+
+        metrics.registry.enabled = True
+        metrics.registry.clear()
+
+        try:
+            self.assertRaises(executor.ExportError, self.executor.export, 'sci', {})
+            rendered = metrics.registry.render()
+        finally:
+            metrics.registry.enabled = False
+            metrics.registry.clear()
+
+        self.assertIn('articlemeta_export_queue_seconds_count{format="sci"} 1', rendered)
+        self.assertIn('articlemeta_export_render_seconds_count{format="sci"} 1', rendered)
+
+    def test_worker_metrics_merged(self):
+
+        export_executor = executor.ExportExecutor(processes=1, worker_args=['--metrics'])
+
+        metrics.registry.enabled = True
+        metrics.registry.clear()
+
+        try:
+            self.assertRaises(executor.ExportError, export_executor.export, 'sci', {})
+            rendered = metrics.registry.render()
+        finally:
+            metrics.registry.enabled = False
+            metrics.registry.clear()
+            export_executor.close()
+
+        self.assertIn('articlemeta_article_build_seconds_count{format="sci"} 1', rendered)
+
+    def test_worker_args(self):
+
+        export_executor = executor.ExportExecutor(
+            processes=1, worker_args=['--citations-threshold', '100'])
+
+        try:
+            self.assertRaises(executor.ExportError, export_executor.export, 'sci', {})
+            self.assertTrue(export_executor._workers[0].alive)
+        finally:
+            export_executor.close()
@@ -0,0 +1,125 @@
+# coding: utf-8
+import unittest
+import xml.etree.ElementTree as ET
+import json
+import os
+
+import plumber
+from xylose.scielodocument import Article
+
+from articlemeta import export
+from articlemeta import metrics
+
+
+class CountingPipe(plumber.Pipe):
+
+    def __init__(self):
+        self.calls = 0
+
+    def transform(self, data):
+        raw, xml = data
+
+        self.calls += 1
+
+        issn = ET.Element('issn')
+        issn.text = raw.any_issn()
+        xml.find('./journal-meta').append(issn)
+
+        return data
+
+
+class JournalMetaCacheTests(unittest.TestCase):
+
+    def test_get_unavailable_key(self):
+
+        cache = export.JournalMetaCache()
+
+        self.assertEqual(cache.get(('sci', '0034-8910', 'scl')), None)
+
+    def test_set_get(self):
+
+        cache = export.JournalMetaCache()
+        cache.set(('sci', '0034-8910', 'scl'), ['x'])
+
+        self.assertEqual(cache.get(('sci', '0034-8910', 'scl')), ['x'])
+
+    def test_maxsize_discards_least_recently_used(self):
+
+        cache = export.JournalMetaCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+
+
+class JournalMetaPipeTests(unittest.TestCase):
+
+    def setUp(self):
+
+        self._raw_json = json.loads(open(os.path.dirname(__file__)+'/fixtures/article_meta.json').read())
+        self._article_meta = Article(self._raw_json)
+
+    def _deploy(self, pipe):
+
+        pxml = ET.Element('front')
+        pxml.append(ET.Element('journal-meta'))
+
+        raw, xml = pipe.transform([self._article_meta, pxml])
+
+        return ET.tostring(xml)
+
+    def test_without_cache(self):
+
+        counting = CountingPipe()
+        pipe = export.JournalMetaPipe('sci', './journal-meta', [counting])
+
+        first = self._deploy(pipe)
+        second = self._deploy(pipe)
+
+        self.assertEqual(counting.calls, 2)
+        self.assertEqual(first, second)
+
+    def test_with_cache(self):
+
+        counting = CountingPipe()
+        cache = export.JournalMetaCache()
+        pipe = export.JournalMetaPipe('sci', './journal-meta', [counting], cache)
+
+        first = self._deploy(pipe)
+        second = self._deploy(pipe)
+
+        self.assertEqual(counting.calls, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(
+            '<front><journal-meta><issn>0034-8910</issn></journal-meta></front>',
+            second)
+
+    def test_cache_keyed_by_format(self):
+
+        counting = CountingPipe()
+        cache = export.JournalMetaCache()
+
+        self._deploy(export.JournalMetaPipe('sci', './journal-meta', [counting], cache))
+        self._deploy(export.JournalMetaPipe('rsps', './journal-meta', [counting], cache))
+
+        self.assertEqual(counting.calls, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_inner_pipes_timed(self):
+
+        metrics.registry.clear()
+        metrics.registry.enabled = True
+
+        try:
+            self._deploy(export.JournalMetaPipe('sci', './journal-meta', [CountingPipe()]))
+            rendered = metrics.registry.render()
+        finally:
+            metrics.registry.enabled = False
+            metrics.registry.clear()
+
+        self.assertIn('articlemeta_pipe_seconds_count{format="sci",pipe="CountingPipe"} 1',
+                      rendered)
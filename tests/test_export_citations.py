@@ -0,0 +1,112 @@
+# coding: utf-8
+import json
+import os
+import unittest
+import xml.etree.ElementTree as ET
+
+from xylose.scielodocument import Article, Citation
+
+from articlemeta import export_citations
+from articlemeta import export_rsps
+from articlemeta import export_sci
+from articlemeta import lazydocument
+
+
+class RefTests(unittest.TestCase):
+
+    def setUp(self):
+
+        raw_json = json.loads(open(os.path.dirname(__file__)+'/fixtures/article_meta.json').read())
+        self._citations = Article(raw_json).citations
+        self._records = lazydocument.citation_records(Article(raw_json))
+
+    def assertSameAsPipeline(self, citation):
+
+        expected = ET.tostring(export_sci.XMLCitation().deploy(citation)[1])
+
+        self.assertEqual(
+            ET.tostring(export_citations.ref(lazydocument.CitationRecord(citation))), expected)
+        self.assertEqual(
+            ET.tostring(export_rsps.XMLCitation().deploy(citation)[1]), expected)
+
+    def test_same_output_as_pipeline(self):
+
+        for citation in self._citations:
+            self.assertSameAsPipeline(citation)
+
+    def test_same_output_as_pipeline_for_books(self):
+
+        citation = Citation({
+            'v701': [{'_': '3'}],
+            'v18': [{'_': 'Book title'}],
+            'v17': [{'_': 'Institution'}],
+            'v16': [{'s': 'Surname', 'n': 'Given'}, {'s': 'Other'}],
+            'v65': [{'_': '2010'}]
+        })
+
+        self.assertSameAsPipeline(citation)
+
+    def test_ref_list(self):
+
+        back = ET.Element('back')
+
+        reflist = export_citations.ref_list(back, self._records)
+
+        self.assertTrue(back.find('ref-list') is reflist)
+        self.assertEqual(len(reflist.findall('ref')), len(self._records))
+        self.assertEqual(reflist.find('ref').get('id'), 'B1')
+
+
+class ParallelRefListTests(unittest.TestCase):
+
+    def setUp(self):
+
+        raw_json = json.loads(open(os.path.dirname(__file__)+'/fixtures/article_meta.json').read())
+        self._citations = lazydocument.citation_records(Article(raw_json))
+
+    def tearDown(self):
+
+        export_citations.configure()
+
+    def test_same_output_as_serial(self):
+
+        back = ET.Element('back')
+        export_citations.ref_list(back, self._citations)
+        expected = ET.tostring(back, encoding='utf-8')
+
+        export_citations.configure(threshold=5, processes=2, chunk_size=4)
+        back = ET.Element('back')
+        reflist = export_citations.ref_list(back, self._citations)
+
+        self.assertTrue(back.find('ref-list') is reflist)
+        self.assertEqual(len(reflist.findall('./ref/element-citation')), len(self._citations))
+        self.assertEqual(ET.tostring(back, encoding='utf-8'), expected)
+
+    def test_below_threshold_is_serial(self):
+
+        export_citations.configure(threshold=len(self._citations) + 1, processes=2)
+
+        def parallel_ref_list(citations):
+            raise AssertionError('rendered in the pool')
+
+        original = export_citations._parallel_ref_list
+        export_citations._parallel_ref_list = parallel_ref_list
+        try:
+            export_citations.ref_list(ET.Element('back'), self._citations)
+        finally:
+            export_citations._parallel_ref_list = original
+
+    def test_pool_started_by_configure(self):
+
+        export_citations.configure(threshold=5, processes=2)
+        pool = export_citations._pool
+
+        self.assertTrue(pool is not None)
+
+        export_citations.ref_list(ET.Element('back'), self._citations)
+
+        self.assertTrue(export_citations._pool is pool)
+
+        export_citations.configure()
+
+        self.assertEqual(export_citations._pool, None)
@@ -0,0 +1,278 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date, timedelta
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from articlemeta import iahx_feed
+from articlemeta import storage
+from articlemeta.controller import DataBroker
+from tests.fakes import FakeExport
+
+
+class ListSink(object):
+
+    def __init__(self):
+        self.documents = []
+        self.closed = False
+        self.commits = 0
+
+    def send(self, data):
+        self.documents.append(data)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = True
+
+
+class SolrHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.server.received.append(
+            (self.headers['Content-Type'],
+             self.rfile.read(int(self.headers['Content-Length']))))
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write('<response/>')
+
+    def log_message(self, *args):
+        pass
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def test_flush_by_count(self):
+
+        sink = ListSink()
+        writer = iahx_feed.BulkWriter(sink, max_docs=2)
+
+        for i in range(5):
+            writer.add('<doc>%d</doc>' % i)
+        writer.close()
+
+        self.assertEqual(sink.documents, ['<add><doc>0</doc><doc>1</doc></add>',
+                                          '<add><doc>2</doc><doc>3</doc></add>',
+                                          '<add><doc>4</doc></add>'])
+        self.assertEqual(writer.sent, 5)
+        self.assertTrue(sink.closed)
+
+    def test_flush_by_size(self):
+
+        sink = ListSink()
+        writer = iahx_feed.BulkWriter(sink, max_bytes=25)
+
+        for i in range(3):
+            writer.add('<doc>%d</doc>' % i)
+        writer.close()
+
+        self.assertEqual(sink.documents, ['<add><doc>0</doc><doc>1</doc></add>',
+                                          '<add><doc>2</doc></add>'])
+
+    def test_delete_after_pending_docs(self):
+
+        sink = ListSink()
+        writer = iahx_feed.BulkWriter(sink)
+
+        writer.add('<doc>0</doc>')
+        writer.delete(['art-S01-scl', 'a&b'])
+
+        self.assertEqual(sink.documents, [
+            '<add><doc>0</doc></add>',
+            '<delete><id>art-S01-scl</id><id>a&amp;b</id></delete>'])
+
+
+class SinkTest(unittest.TestCase):
+
+    def test_file_sink(self):
+
+        output_dir = tempfile.mkdtemp()
+
+        try:
+            sink = iahx_feed.FileSink(output_dir, run='20140101000000')
+            sink.send('<add/>')
+            sink.send('<add/>')
+
+            self.assertEqual(sorted(os.listdir(output_dir)),
+                             ['iahx_20140101000000_00001.xml',
+                              'iahx_20140101000000_00002.xml'])
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_file_sink_never_overwrites(self):
+
+        output_dir = tempfile.mkdtemp()
+
+        try:
+            iahx_feed.FileSink(output_dir, run='20140101000000').send('<add/>')
+            sink = iahx_feed.FileSink(output_dir, run='20140101000000')
+
+            self.assertRaises(OSError, sink.send, '<delete/>')
+
+            with open(os.path.join(output_dir, 'iahx_20140101000000_00001.xml')) as f:
+                self.assertEqual(f.read(), '<add/>')
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_http_sink(self):
+
+        server = HTTPServer(('127.0.0.1', 0), SolrHandler)
+        server.received = []
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        thread2 = threading.Thread(target=server.handle_request)
+
+        try:
+            sink = iahx_feed.HTTPSink('http://127.0.0.1:%d/solr/update' % server.server_port)
+            sink.send('<add><doc/></add>')
+            thread.join()
+            thread2.start()
+            sink.close()
+            thread2.join()
+        finally:
+            server.server_close()
+
+        self.assertEqual(server.received, [
+            ('text/xml; charset=utf-8', '<add><doc/></add>'),
+            ('text/xml; charset=utf-8', '<commit/>')])
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self._export = iahx_feed.Export
+        iahx_feed.Export = FakeExport
+
+    def tearDown(self):
+        iahx_feed.Export = self._export
+
+    def test_export(self):
+
+        strg = storage.SQLiteStorage(':memory:')
+        strg.insert('articles', [
+            {'code': code, 'collection': 'scl', 'processing_date': '2014-01-0%d' % i}
+            for i, code in enumerate(['S01', 'broken', 'S02'], 1)
+        ])
+        sink = ListSink()
+        writer = iahx_feed.BulkWriter(sink)
+
+        errors = iahx_feed.export(
+            DataBroker(strg).articles(collection='scl', page_size=2),
+            writer)
+        writer.close()
+
+        self.assertEqual([code for code, error in errors], ['broken'])
+        self.assertEqual(writer.sent, 2)
+        self.assertEqual(len(sink.documents), 1)
+
+
+class FailingWriter(iahx_feed.BulkWriter):
+
+    def __init__(self, sink, fail_after):
+        super(FailingWriter, self).__init__(sink)
+        self.fail_after = fail_after
+
+    def commit(self):
+
+        if self.sink.commits >= self.fail_after:
+            raise IOError('solr is down')
+
+        super(FailingWriter, self).commit()
+
+
+class ReindexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._export = iahx_feed.Export
+        iahx_feed.Export = FakeExport
+
+        self.today = date.today()
+        self.strg = storage.SQLiteStorage(':memory:')
+        self.strg.insert('articles', [
+            {'code': 'S0%d' % i, 'collection': 'scl',
+             'processing_date': (self.today - timedelta(days=i * 10)).isoformat()}
+            for i in range(3)
+        ])
+        self.db = DataBroker(self.strg)
+
+    def tearDown(self):
+        iahx_feed.Export = self._export
+
+    def test_windows(self):
+
+        self.assertEqual(list(iahx_feed._windows('2014-01-01', '2014-01-05', 2)),
+                         [('2014-01-01', '2014-01-02'),
+                          ('2014-01-03', '2014-01-04'),
+                          ('2014-01-05', '2014-01-05')])
+
+    def test_reindex_sends_changes_since_watermark(self):
+
+        sink = ListSink()
+        writer = iahx_feed.BulkWriter(sink)
+
+        first = iahx_feed.reindex(self.db, writer, collection='scl', window_days=7)
+
+        self.db.delete_article('S02', collection='scl')
+        self.strg.insert('articles', {'code': 'S09', 'collection': 'scl',
+                                      'processing_date': self.today.isoformat()})
+        sink.documents = []
+
+        second = iahx_feed.reindex(self.db, writer, collection='scl', window_days=7)
+
+        self.assertEqual(first['windows'], 3)
+        self.assertEqual(second['windows'], 1)
+        self.assertEqual(second['deleted'], 1)
+        self.assertEqual(sink.documents, [
+            '<add><doc><field name="id">art-S00-scl</field></doc>'
+            '<doc><field name="id">art-S09-scl</field></doc></add>',
+            '<delete><id>art-S02-scl</id></delete>'])
+        self.assertEqual(self.db.get_watermark('iahx', 'scl')['processing_date'],
+                         self.today.isoformat())
+
+    def test_incremental_runs_keep_earlier_files(self):
+
+        output_dir = tempfile.mkdtemp()
+
+        try:
+            first = iahx_feed.FileSink(output_dir, run='20140101000000')
+            iahx_feed.reindex(self.db, iahx_feed.BulkWriter(first),
+                              collection='scl', window_days=7)
+
+            self.db.delete_article('S02', collection='scl')
+            second = iahx_feed.FileSink(output_dir, run='20140102000000')
+            iahx_feed.reindex(self.db, iahx_feed.BulkWriter(second),
+                              collection='scl', window_days=7)
+
+            self.assertEqual(sorted(os.listdir(output_dir)),
+                             sorted(os.path.basename(i)
+                                    for i in first.files + second.files))
+            self.assertTrue(first.files and second.files)
+
+            with open(first.files[0]) as f:
+                self.assertTrue('art-S02-scl' in f.read())
+            with open(second.files[-1]) as f:
+                self.assertEqual(f.read(), '<delete><id>art-S02-scl</id></delete>')
+        finally:
+            shutil.rmtree(output_dir)
+
+    def test_reindex_resumes_after_failure(self):
+
+        sink = ListSink()
+
+        self.assertRaises(IOError, iahx_feed.reindex, self.db,
+                          FailingWriter(sink, fail_after=1),
+                          collection='scl', window_days=7)
+
+        watermark = self.db.get_watermark('iahx', 'scl')['processing_date']
+        sink.documents = []
+
+        iahx_feed.reindex(self.db, iahx_feed.BulkWriter(sink), collection='scl',
+                          window_days=7)
+
+        self.assertEqual(watermark, (self.today - timedelta(days=14)).isoformat())
+        self.assertFalse('art-S02-scl' in ''.join(sink.documents))
+        self.assertTrue('art-S01-scl' in ''.join(sink.documents))
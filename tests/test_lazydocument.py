@@ -0,0 +1,125 @@
+# coding: utf-8
+import json
+import os
+import unittest
+
+from xylose.scielodocument import Article, Citation
+
+from articlemeta import lazydocument
+
+
+class LazyArticleTests(unittest.TestCase):
+
+    def setUp(self):
+
+        self._raw_json = json.loads(open(os.path.dirname(__file__)+'/fixtures/article_meta.json').read())
+        self._article = lazydocument.LazyArticle(self._raw_json)
+
+    def test_same_values_as_article(self):
+
+        article = Article(self._raw_json)
+
+        self.assertEqual(self._article.publisher_id, article.publisher_id)
+        self.assertEqual(self._article.original_title(), article.original_title())
+        self.assertEqual(self._article.any_issn(priority=u'print'),
+                         article.any_issn(priority=u'print'))
+        self.assertEqual([i.article_title for i in self._article.citations],
+                         [i.article_title for i in article.citations])
+
+    def test_property_is_cached(self):
+
+        self.assertTrue(self._article.citations is self._article.citations)
+        self.assertTrue(self._article.journal is self._article.journal)
+
+    def test_citation_records_are_cached(self):
+
+        records = self._article.citation_records
+
+        self.assertTrue(lazydocument.citation_records(self._article) is records)
+        self.assertEqual(len(records), len(Article(self._raw_json).citations))
+
+    def test_citation_records(self):
+
+        citation = Article(self._raw_json).citations[0]
+        record = lazydocument.citation_records(Article(self._raw_json))[0]
+
+        self.assertEqual(record.article_title, citation.article_title)
+        self.assertEqual(record.title, citation.article_title)
+        self.assertEqual(record.date, citation.date)
+        self.assertEqual([(i.surname, i.given_names) for i in record.authors],
+                         [(i.get('surname'), i.get('given_names')) for i in citation.authors])
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_citation_record_title(self):
+
+        citation = Citation({'v18': [{'_': 'Book title'}], 'v51': [{'_': 'PhD'}]})
+
+        self.assertEqual(lazydocument.CitationRecord(citation).title, citation.thesis_title)
+
+    def test_journal_is_lazy(self):
+
+        self.assertTrue(isinstance(self._article.journal, lazydocument.LazyJournal))
+
+    def test_method_is_cached_by_arguments(self):
+
+        electronic = self._article.any_issn(priority=u'electronic')
+
+        self.assertTrue(self._article.any_issn(priority=u'electronic') is electronic)
+        self.assertEqual(self._article.any_issn(priority=u'print'),
+                         Article(self._raw_json).any_issn(priority=u'print'))
+
+    def test_without_citations(self):
+
+        del self._raw_json['citations']
+
+        self.assertEqual(lazydocument.LazyArticle(self._raw_json).citations, None)
+        self.assertEqual(lazydocument.LazyArticle(self._raw_json).citation_records, [])
+
+
+class MemoTests(unittest.TestCase):
+
+    class Document(object):
+
+        def __init__(self):
+            self.calls = 0
+
+        @lazydocument.cached_property
+        def value(self):
+            self.calls += 1
+            return [self.calls]
+
+        @lazydocument.cached_property
+        def broken(self):
+            self.calls += 1
+            raise ValueError()
+
+        @lazydocument.cached_method
+        def echo(self, value):
+            self.calls += 1
+            return value
+
+    def test_errors_are_not_cached(self):
+
+        document = self.Document()
+
+        self.assertRaises(ValueError, getattr, document, 'broken')
+        self.assertRaises(ValueError, getattr, document, 'broken')
+        self.assertEqual(document.calls, 2)
+
+    def test_unhashable_arguments(self):
+
+        document = self.Document()
+
+        document.echo([1])
+        document.echo([1])
+        document.echo(1)
+        document.echo(1)
+
+        self.assertEqual(document.calls, 3)
+
+    def test_property(self):
+
+        document = self.Document()
+
+        self.assertTrue(document.value is document.value)
+        self.assertEqual(document.calls, 1)
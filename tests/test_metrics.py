@@ -0,0 +1,101 @@
+# coding: utf-8
+import json
+import unittest
+
+import plumber
+
+from articlemeta import metrics
+
+
+class UpperPipe(plumber.Pipe):
+
+    def transform(self, data):
+        return data.upper()
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+        metrics.registry.enabled = True
+
+    def tearDown(self):
+        metrics.registry.clear()
+        metrics.registry.enabled = False
+
+    def test_histogram_observe(self):
+
+        histogram = metrics.Histogram(buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        self.assertEqual(histogram.counts, [1, 1])
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.sum, 5.55)
+
+    def test_disabled_registry(self):
+
+        metrics.registry.enabled = False
+        metrics.registry.observe('articlemeta_view_seconds', 0.1, route='index')
+
+        self.assertEqual(metrics.registry.render(), '\n')
+
+    def test_render(self):
+
+        metrics.registry.observe('articlemeta_view_seconds', 0.003, route='get_article')
+        metrics.registry.observe('articlemeta_view_seconds', 20, route='get_article')
+
+        lines = metrics.registry.render().splitlines()
+
+        self.assertEqual(lines[0], '# TYPE articlemeta_view_seconds histogram')
+        self.assertTrue('articlemeta_view_seconds_bucket{route="get_article",le="0.0025"} 0' in lines)
+        self.assertTrue('articlemeta_view_seconds_bucket{route="get_article",le="0.005"} 1' in lines)
+        self.assertTrue('articlemeta_view_seconds_bucket{route="get_article",le="10.0"} 1' in lines)
+        self.assertTrue('articlemeta_view_seconds_bucket{route="get_article",le="+Inf"} 2' in lines)
+        self.assertTrue('articlemeta_view_seconds_count{route="get_article"} 2' in lines)
+
+    def test_format_labels_escape(self):
+
+        self.assertEqual(metrics.format_labels((('a', 'x"y'),)), '{a="x\\"y"}')
+
+    def test_timed(self):
+
+        @metrics.timed('articlemeta_databroker_seconds')
+        def get_article():
+            return 'ok'
+
+        self.assertEqual(get_article(), 'ok')
+        self.assertTrue(
+            'articlemeta_databroker_seconds_count{method="get_article"} 1' in metrics.registry.render())
+
+    def test_drain_and_merge(self):
+
+        metrics.registry.observe('x_seconds', 0.02, route='a')
+        metrics.registry.observe('x_seconds', 2, route='a')
+
+        histograms = json.loads(json.dumps(metrics.registry.drain()))
+
+        self.assertEqual(metrics.registry.render(), '\n')
+
+        metrics.registry.observe('x_seconds', 0.02, route='a')
+        metrics.registry.merge(histograms)
+        rendered = metrics.registry.render()
+
+        self.assertIn('x_seconds_bucket{route="a",le="0.025"} 2', rendered)
+        self.assertIn('x_seconds_count{route="a"} 3', rendered)
+
+    def test_instrument_disabled(self):
+
+        metrics.registry.enabled = False
+        pipe = UpperPipe()
+
+        self.assertEqual(metrics.instrument('sci', pipe), (pipe,))
+
+    def test_instrument_pipeline(self):
+
+        ppl = plumber.Pipeline(*metrics.instrument('sci', UpperPipe()))
+
+        self.assertEqual(next(ppl.run('xx', rewrap=True)), 'XX')
+        self.assertTrue(
+            'articlemeta_pipe_seconds_count{format="sci",pipe="UpperPipe"} 1' in metrics.registry.render())
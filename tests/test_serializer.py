@@ -0,0 +1,87 @@
+# coding: utf-8
+import os
+import unittest
+import json
+
+from articlemeta import serializer
+
+
+class SerializerTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self._raw_json = json.loads(
+            open(os.path.dirname(__file__)+'/fixtures/article_meta.json').read())
+
+        self._ids = {
+            'meta': {'limit': 1000, 'offset': 0, 'filter': {}, 'total': 1000},
+            'objects': [{'code': 'S0034-891020100004%05d' % i,
+                         'collection': 'scl',
+                         'processing_date': '2010-08-01'} for i in range(1000)]
+        }
+
+    def test_get_encoder_default(self):
+
+        self.assertEqual(serializer.get_encoder(), serializer.stdlib_dumps)
+
+    def test_get_encoder_stdlib(self):
+
+        self.assertEqual(serializer.get_encoder('json'), serializer.stdlib_dumps)
+
+    @unittest.skipUnless(serializer.ujson, 'ujson is not installed')
+    def test_ujson_same_output_as_stdlib(self):
+
+        self.assertEqual(serializer.ujson_dumps(self._raw_json),
+                         json.dumps(self._raw_json, separators=(',', ':')))
+        self.assertEqual(json.loads(serializer.ujson_dumps(self._raw_json)),
+                         json.loads(serializer.stdlib_dumps(self._raw_json)))
+
+    @unittest.skipUnless(serializer.ujson, 'ujson is not installed')
+    def test_ujson_slashes_and_floats(self):
+
+        data = {'url': 'http://www.scielo.br/', 'value': 0.5 + 0.25}
+
+        self.assertEqual(json.loads(serializer.ujson_dumps(data)), data)
+        self.assertTrue('\\/' not in serializer.ujson_dumps(data))
+
+    def test_get_encoder_unavailable(self):
+
+        self.assertRaises(ValueError, serializer.get_encoder, 'xpto')
+
+    def test_dumps_article(self):
+
+        srlzr = serializer.Serializer()
+
+        self.assertEqual(json.loads(srlzr.dumps(self._raw_json)), self._raw_json)
+
+    def test_streamable(self):
+
+        srlzr = serializer.Serializer(stream_threshold=500)
+
+        self.assertTrue(srlzr.streamable(self._ids))
+        self.assertTrue(srlzr.streamable(self._ids['objects']))
+        self.assertFalse(srlzr.streamable(self._raw_json))
+        self.assertFalse(srlzr.streamable(None))
+
+    def test_iterdumps_identifiers(self):
+
+        srlzr = serializer.Serializer(stream_threshold=500, batch_size=300)
+
+        chunks = list(srlzr.iterdumps(self._ids))
+
+        self.assertTrue(len(chunks) > 4)
+        self.assertEqual(json.loads(''.join(chunks)), self._ids)
+
+    def test_iterdumps_list(self):
+
+        srlzr = serializer.Serializer(stream_threshold=10, batch_size=7)
+
+        data = range(100)
+
+        self.assertEqual(json.loads(''.join(srlzr.iterdumps(data))), data)
+
+    def test_iterdumps_small_data(self):
+
+        srlzr = serializer.Serializer()
+
+        self.assertEqual(list(srlzr.iterdumps([1, 2])), [srlzr.dumps([1, 2])])
@@ -0,0 +1,192 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from articlemeta import snapshot
+from articlemeta import storage
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'scl.amsnap')
+
+        self.source = storage.SQLiteStorage(':memory:')
+        self.source.ensure_indexes()
+        self.source.insert('journals', [
+            {'code': ['0034-8910'], 'collection': 'scl', 'v100': [{'_': u'Revista de Saúde Pública'}]},
+            {'code': ['1234-5678'], 'collection': 'arg'}
+        ])
+        self.source.insert('articles', [
+            {'code': 'S0034-89102010000400001', 'collection': 'scl', 'processing_date': '2010-08-01'},
+            {'code': 'S0034-89102010000400002', 'collection': 'scl', 'processing_date': '2010-08-02'},
+            {'code': 'S1234-56782010000400001', 'collection': 'arg', 'processing_date': '2010-08-03'}
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_dump_counts(self):
+
+        counts = snapshot.dump(self.source, self.path, collection='scl')
+
+        self.assertEqual(counts, {'journals': 1, 'articles': 2})
+
+    def test_reader_iterates_records(self):
+
+        snapshot.dump(self.source, self.path)
+
+        reader = snapshot.SnapshotReader(self.path)
+        records = list(reader)
+        reader.close()
+
+        self.assertEqual([name for name, document in records],
+                         ['journals', 'journals', 'articles', 'articles', 'articles'])
+        self.assertEqual(records[0][1]['v100'][0]['_'], u'Revista de Saúde Pública')
+
+    def test_reader_get_article(self):
+
+        snapshot.dump(self.source, self.path)
+
+        reader = snapshot.SnapshotReader(self.path)
+        article = reader.get_article('S0034-89102010000400002', 'scl')
+        missing = reader.get_article('S0034-89102010000400002', 'arg')
+        reader.close()
+
+        self.assertEqual(article['processing_date'], '2010-08-02')
+        self.assertEqual(missing, None)
+
+    def test_reader_searches_index(self):
+
+        codes = ['S0034-891020100004%05d' % i for i in range(100)]
+        self.source.insert('articles', [{'code': i, 'collection': 'bra'} for i in codes])
+        snapshot.dump(self.source, self.path)
+
+        reader = snapshot.SnapshotReader(self.path)
+        found = [reader.get_article(i, 'bra')['code'] for i in codes]
+        missing = reader.get_article('S9999-99992010000400001', 'bra')
+        reader.close()
+
+        self.assertEqual(found, codes)
+        self.assertEqual(missing, None)
+
+    def test_reader_invalid_file(self):
+
+        with open(self.path, 'wb') as f:
+            f.write('not a snapshot')
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.SnapshotReader, self.path)
+
+    def test_reader_truncated_file(self):
+
+        snapshot.dump(self.source, self.path)
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+
+        with open(self.path, 'wb') as f:
+            f.write(data[:-4])
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.SnapshotReader, self.path)
+
+    def test_load(self):
+
+        snapshot.dump(self.source, self.path, collection='scl')
+
+        target = storage.SQLiteStorage(':memory:')
+        counts = snapshot.load(target, self.path, batch_size=1)
+
+        self.assertEqual(counts, {'journals': 1, 'articles': 2})
+        self.assertEqual(
+            target.find_one('articles', {'code': 'S0034-89102010000400001'})['processing_date'],
+            '2010-08-01')
+        self.assertEqual(target.count('journals', {'collection': 'scl'}), 1)
+
+    def test_load_into_non_empty_storage(self):
+
+        snapshot.dump(self.source, self.path, collection='scl')
+
+        target = storage.SQLiteStorage(':memory:')
+        snapshot.load(target, self.path)
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.load, target, self.path)
+        self.assertEqual(target.count('articles', {}), 2)
+
+        snapshot.load(target, self.path, replace=True)
+
+        self.assertEqual(target.count('articles', {}), 2)
+        self.assertEqual(target.count('journals', {}), 1)
+
+
+class SnapshotArticleStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'scl.amsnap')
+
+        self.source = storage.SQLiteStorage(':memory:')
+        self.source.insert('articles', [
+            {'code': 'S0034-89102010000400001', 'collection': 'scl', 'processing_date': '2010-08-01'}
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_article(self):
+
+        snapshot.dump(self.source, self.path)
+        store = snapshot.SnapshotArticleStore(self.path)
+
+        self.assertEqual(
+            store.get_article('S0034-89102010000400001', 'scl')['processing_date'],
+            '2010-08-01')
+
+    def test_get_article_without_collection(self):
+
+        snapshot.dump(self.source, self.path)
+        store = snapshot.SnapshotArticleStore(self.path)
+
+        self.assertEqual(store.get_article('S0034-89102010000400001'), None)
+
+    def test_get_article_without_snapshot(self):
+
+        store = snapshot.SnapshotArticleStore(self.path)
+
+        self.assertEqual(store.get_article('S0034-89102010000400001', 'scl'), None)
+
+    def test_hot_swap(self):
+
+        snapshot.dump(self.source, self.path)
+        store = snapshot.SnapshotArticleStore(self.path, check_interval=0)
+        old = store.get_article('S0034-89102010000400001', 'scl')
+
+        self.source.update('articles', {'code': 'S0034-89102010000400001'},
+                           {'processing_date': '2010-09-01'})
+        snapshot.dump(self.source, self.path)
+
+        self.assertEqual(old['processing_date'], '2010-08-01')
+        self.assertEqual(
+            store.get_article('S0034-89102010000400001', 'scl')['processing_date'],
+            '2010-09-01')
+        self.assertEqual(os.listdir(self.tmpdir), ['scl.amsnap'])
+
+    def test_hot_swap_closes_replaced_reader(self):
+
+        snapshot.dump(self.source, self.path)
+        store = snapshot.SnapshotArticleStore(self.path, check_interval=0)
+
+        in_use = store._acquire()
+        snapshot.dump(self.source, self.path)
+        store.get_article('S0034-89102010000400001', 'scl')
+
+        self.assertEqual(in_use.get_article('S0034-89102010000400001', 'scl')['code'],
+                         'S0034-89102010000400001')
+
+        store._release(in_use)
+
+        self.assertTrue(in_use._file.closed)
+        self.assertFalse(store._reader._file.closed)
+        store.close()
@@ -0,0 +1,226 @@
+# coding: utf-8
+import unittest
+
+from mocker import Mocker, ANY
+
+from articlemeta import metrics
+from articlemeta import storage
+
+
+class MatchTest(unittest.TestCase):
+
+    def test_match_equality(self):
+
+        self.assertTrue(storage.match({'code': 'x'}, {'code': 'x'}))
+        self.assertFalse(storage.match({'code': 'x'}, {'code': 'y'}))
+
+    def test_match_list_membership(self):
+
+        self.assertTrue(storage.match({'code': ['0034-8910', '1518-8787']},
+                                      {'code': '1518-8787'}))
+
+    def test_match_list_equality(self):
+
+        self.assertTrue(storage.match({'code': ['0034-8910']},
+                                      {'code': ['0034-8910']}))
+
+    def test_match_range(self):
+
+        fltr = {'processing_date': {'$gte': '2010-01-01', '$lte': '2010-12-31'}}
+
+        self.assertTrue(storage.match({'processing_date': '2010-08-01'}, fltr))
+        self.assertFalse(storage.match({'processing_date': '2011-08-01'}, fltr))
+        self.assertFalse(storage.match({}, fltr))
+
+    def test_match_or(self):
+
+        fltr = {'$or': [{'code': 'x'}, {'code': 'y'}]}
+
+        self.assertTrue(storage.match({'code': 'y'}, fltr))
+        self.assertFalse(storage.match({'code': 'z'}, fltr))
+
+    def test_match_in(self):
+
+        self.assertTrue(storage.match({'code': 'x'}, {'code': {'$in': ['x', 'y']}}))
+        self.assertFalse(storage.match({'code': 'z'}, {'code': {'$in': ['x', 'y']}}))
+
+
+class MongoStorageTest(unittest.TestCase):
+
+    def test_find_one_without_id(self):
+
+        mocker = Mocker()
+        db = mocker.mock()
+        db['articles'].find_one(ANY)
+        mocker.result({'_id': 'xx', 'code': 'S0034-89102010000400007'})
+        mocker.replay()
+
+        self.assertEqual(storage.MongoStorage(db).find_one('articles', {}),
+                         {'code': 'S0034-89102010000400007'})
+
+    def test_upsert(self):
+
+        mocker = Mocker()
+        db = mocker.mock()
+        db['articles'].update({'code': 'x'}, {'$set': {'code': 'x', 'a': 1}},
+                              safe=False, upsert=True)
+        mocker.replay()
+
+        storage.MongoStorage(db).upsert('articles', {'code': 'x'}, {'code': 'x', 'a': 1})
+
+        mocker.verify()
+
+    def test_next_sequence(self):
+
+        mocker = Mocker()
+        db = mocker.mock()
+        db['counters'].find_and_modify({'_id': 'events'}, {'$inc': {'seq': 1}},
+                                       upsert=True, new=True)
+        mocker.result({'_id': 'events', 'seq': 3})
+        mocker.replay()
+
+        self.assertEqual(storage.MongoStorage(db).next_sequence('events'), 3)
+
+        mocker.verify()
+
+    def test_remove(self):
+
+        mocker = Mocker()
+        db = mocker.mock()
+        db['articles'].remove({'code': 'a'}, w=1)
+        mocker.result({'n': 2, 'ok': 1.0})
+        mocker.replay()
+
+        self.assertEqual(storage.MongoStorage(db).remove('articles', {'code': 'a'}), 2)
+
+        mocker.verify()
+
+    def test_ensure_indexes(self):
+
+        mocker = Mocker()
+        db = mocker.mock()
+        for name, indexes in storage.INDEXES.items():
+            for index in indexes:
+                db[name].ensure_index(index, background=True)
+        mocker.replay()
+
+        storage.MongoStorage(db).ensure_indexes()
+
+        mocker.verify()
+
+
+class SQLiteStorageTest(unittest.TestCase):
+
+    def setUp(self):
+
+        self.storage = storage.SQLiteStorage(':memory:')
+        self.storage.ensure_indexes()
+
+        self.storage.insert('articles', [
+            {'code': 'S0034-8910201000040000%d' % i,
+             'collection': 'scl' if i % 2 else 'arg',
+             'processing_date': '2010-0%d-01' % i,
+             'sent_doaj': 'False'} for i in range(1, 8)
+        ])
+
+    def test_find(self):
+
+        data = self.storage.find('articles', {'collection': 'scl'})
+
+        self.assertEqual(len(data), 4)
+
+    def test_find_range_sort_skip_limit(self):
+
+        data = self.storage.find(
+            'articles',
+            {'processing_date': {'$gte': '2010-02-01', '$lte': '2010-06-01'}},
+            ['code'],
+            sort=[('processing_date', -1)], skip=1, limit=2)
+
+        self.assertEqual(data, [{'code': 'S0034-89102010000400005'},
+                                {'code': 'S0034-89102010000400004'}])
+
+    def test_find_residual_filter(self):
+
+        self.storage.update('articles', {'code': 'S0034-89102010000400001'},
+                            {'sent_doaj': 'True'})
+
+        data = self.storage.find('articles', {'sent_doaj': 'False', 'collection': 'scl'},
+                                 ['code'], skip=1, limit=1)
+
+        self.assertEqual(data, [{'code': 'S0034-89102010000400005'}])
+        self.assertEqual(
+            self.storage.count('articles', {'sent_doaj': 'False', 'collection': 'scl'}), 3)
+
+    def test_find_one(self):
+
+        data = self.storage.find_one('articles', {'code': 'S0034-89102010000400003'})
+
+        self.assertEqual(data['processing_date'], '2010-03-01')
+        self.assertEqual(self.storage.find_one('articles', {'code': 'x'}), None)
+
+    def test_count(self):
+
+        self.assertEqual(self.storage.count('articles', {'collection': 'arg'}), 3)
+        self.assertEqual(self.storage.count('journals', {}), 0)
+
+    def test_upsert_insert_and_update(self):
+
+        self.storage.upsert('journals', {'code': ['0034-8910'], 'collection': 'scl'},
+                            {'code': ['0034-8910'], 'collection': 'scl', 'v100': 'a'})
+        self.storage.upsert('journals', {'code': ['0034-8910'], 'collection': 'scl'},
+                            {'v100': 'b'})
+
+        data = self.storage.find('journals', {'code': '0034-8910'})
+
+        self.assertEqual(data, [{'code': ['0034-8910'], 'collection': 'scl', 'v100': 'b'}])
+
+    def test_next_sequence(self):
+
+        self.assertEqual(self.storage.next_sequence('events'), 1)
+        self.assertEqual(self.storage.next_sequence('events'), 2)
+        self.assertEqual(self.storage.next_sequence('other'), 1)
+
+    def test_update_multi(self):
+
+        updated = self.storage.update('articles', {'collection': 'scl'},
+                                      {'sent_doaj': 'True'}, multi=True)
+
+        self.assertEqual(updated, 4)
+        self.assertEqual(self.storage.count('articles', {'sent_doaj': 'True'}), 4)
+
+    def test_remove(self):
+
+        self.assertEqual(self.storage.remove('articles', {'collection': 'scl'}), 4)
+        self.assertEqual(self.storage.remove(
+            'articles', {'sent_doaj': 'False', 'code': 'S0034-89102010000400002'}), 1)
+        self.assertEqual(self.storage.remove('articles', {'code': 'missing'}), 0)
+
+        self.assertEqual(self.storage.count('articles', {}), 2)
+
+
+class TimedStorageTest(unittest.TestCase):
+
+    def setUp(self):
+        metrics.registry.clear()
+        metrics.registry.enabled = True
+        self.strg = storage.TimedStorage(storage.SQLiteStorage(':memory:'))
+
+    def tearDown(self):
+        metrics.registry.clear()
+        metrics.registry.enabled = False
+
+    def test_counts_storage_calls(self):
+
+        self.strg.insert('articles', [{'code': 'S01'}, {'code': 'S02'}])
+        documents = list(self.strg.find('articles', {}))
+        self.strg.find_one('articles', {'code': 'S01'})
+        self.strg.count('articles', {})
+
+        rendered = metrics.registry.render()
+
+        self.assertEqual(len(documents), 2)
+        for method in ('insert', 'find', 'find_one', 'count'):
+            self.assertTrue(
+                'articlemeta_storage_seconds_count{collection="articles",method="%s"} 1' % method
+                in rendered, method)
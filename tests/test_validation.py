@@ -0,0 +1,95 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from articlemeta import validation
+from tests.fakes import FakeExport, RECORDS
+
+
+class ValidateTest(unittest.TestCase):
+
+    def test_schema_is_cached(self):
+
+        path = validation.SCHEMAS['doaj']
+
+        self.assertTrue(validation.schema(path) is validation.schema(path))
+
+    def test_valid(self):
+
+        self.assertEqual(validation.validate('doaj', RECORDS % ('S01', 'S01')), [])
+
+    def test_invalid(self):
+
+        errors = validation.validate('doaj', '<records><record/></records>')
+
+        self.assertTrue(errors)
+
+    def test_malformed(self):
+
+        errors = validation.validate('doaj', '<records>')
+
+        self.assertEqual(len(errors), 1)
+
+    def test_format_without_schema(self):
+
+        self.assertRaises(ValueError, validation.validate, 'iahx', '<add/>')
+
+    def test_package_schemas(self):
+
+        cwd = os.getcwd()
+        os.chdir(tempfile.gettempdir())
+
+        try:
+            validation.configure()
+            validation.preload()
+        finally:
+            os.chdir(cwd)
+
+    def test_configure_xsd_dir(self):
+
+        xsd_dir = tempfile.mkdtemp()
+        shutil.copytree(os.path.join(validation.XSD_DIR, 'scielo_doaj'),
+                        os.path.join(xsd_dir, 'scielo_doaj'))
+
+        try:
+            validation.configure(xsd_dir)
+            self.assertEqual(validation.validate('doaj', RECORDS % ('S01', 'S01')), [])
+            self.assertEqual(validation._schemas.keys(),
+                             [os.path.join(xsd_dir, validation.SCHEMAS['doaj'])])
+        finally:
+            validation.configure()
+            shutil.rmtree(xsd_dir)
+
+
+class ValidateArticlesTest(unittest.TestCase):
+
+    def setUp(self):
+        self._export = validation.Export
+        validation.Export = FakeExport
+
+    def tearDown(self):
+        validation.Export = self._export
+
+    def check(self, processes):
+
+        articles = [{'code': code, 'collection': 'scl'}
+                    for code in ['S01', 'broken', 'invalid']]
+
+        reports = list(validation.validate_articles(articles, ['doaj'],
+                                                    processes=processes,
+                                                    chunksize=1))
+
+        self.assertEqual([i['code'] for i in reports], ['S01', 'broken', 'invalid'])
+        self.assertEqual(reports[0]['errors'], {})
+        self.assertEqual(reports[1]['errors'], {'doaj': ['ValueError: broken article']})
+        self.assertTrue(reports[2]['errors']['doaj'])
+
+    def test_validate_articles(self):
+
+        self.check(processes=1)
+
+    def test_validate_articles_in_pool(self):
+
+        self.check(processes=2)